@@ -6,6 +6,10 @@ def create_app(configuration=Config):
     app = Flask(__name__)
 
     from app.models import db, login_manager, migrate
+    from app.report_cache import report_cache
+    from app.report_jobs import report_jobs
+    from app.query_stats import query_stats
+    from app.candidate_search import candidate_search
     from sassutils.wsgi import SassMiddleware
 
     app.wsgi_app = SassMiddleware(
@@ -16,6 +20,10 @@ def create_app(configuration=Config):
     migrate.init_app(app, db)
     login_manager.init_app(app)
     login_manager.login_view = "update_bp.login"
+    report_cache.init_app(app)
+    report_jobs.init_app(app)
+    query_stats.init_app(app)
+    candidate_search.init_app(app)
 
     from app.updates import update_bp
 
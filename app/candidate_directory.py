@@ -0,0 +1,106 @@
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import and_, select
+from sqlalchemy.orm import Query
+
+from app.models import Application, Candidate, Grade, Location, Organisation, Role, db
+
+
+class DirectoryPage(NamedTuple):
+    candidates: List[Dict]
+    # the id to page on from, or None if this is the last page
+    next_after: Optional[int]
+
+
+class CandidateDirectory:
+    """
+    A list of candidates, filtered by scheme, intake year and their current grade, organisation and location, and read
+    a page at a time in id order. Pages are found by keyset rather than by offset: each page starts after the last id
+    on the one before, so the database seeks straight to it through the primary key however deep into the list it is,
+    rather than reading and throwing away every row before it. Only the columns shown in the list are selected
+    """
+
+    columns = [
+        Candidate.id,
+        Candidate.first_name,
+        Candidate.last_name,
+        Candidate.email_address,
+        Grade.value.label("grade"),
+        Organisation.name.label("organisation"),
+        Location.value.label("location"),
+    ]
+    page_size = 50
+
+    def __init__(
+        self,
+        scheme: int = None,
+        intake: int = None,
+        grade: int = None,
+        organisation: int = None,
+        location: int = None,
+    ):
+        """
+        :param scheme: the id of the scheme candidates have applied to
+        :param intake: the year of the intake candidates have applied to, on any scheme unless `scheme` is given
+        :param grade: the id of the grade of candidates' current roles
+        :param organisation: the id of the organisation of candidates' current roles
+        :param location: the id of the location of candidates' current roles
+        """
+        self.scheme = scheme
+        self.intake = intake
+        self.grade = grade
+        self.organisation = organisation
+        self.location = location
+
+    def query(self) -> Query:
+        query = (
+            db.session.query(*self.columns)
+            .select_from(Candidate)
+            .outerjoin(Role, Role.id == Candidate.current_role_id)
+            .outerjoin(Grade, Grade.id == Role.grade_id)
+            .outerjoin(Organisation, Organisation.id == Role.organisation_id)
+            .outerjoin(Location, Location.id == Role.location_id)
+        )
+        for column, value in [
+            (Role.grade_id, self.grade),
+            (Role.organisation_id, self.organisation),
+            (Role.location_id, self.location),
+        ]:
+            if value is not None:
+                query = query.filter(column == value)
+        if self.scheme is not None or self.intake is not None:
+            # a candidate can apply more than once, so applications are looked up rather than joined to keep one row
+            # per candidate
+            query = query.filter(Candidate.id.in_(self.applications()))
+        return query
+
+    def applications(self):
+        conditions = []
+        if self.scheme is not None:
+            conditions.append(Application.scheme_id == self.scheme)
+        if self.intake is not None:
+            conditions.extend(
+                [
+                    Application.scheme_start_date >= date(self.intake, 1, 1),
+                    Application.scheme_start_date < date(self.intake + 1, 1, 1),
+                ]
+            )
+        return select([Application.candidate_id]).where(and_(*conditions))
+
+    def page(self, after: int = 0) -> DirectoryPage:
+        """
+        The page of candidates whose ids come next after `after`
+        """
+        rows = (
+            self.query()
+            .filter(Candidate.id > after)
+            .order_by(Candidate.id)
+            .limit(self.page_size + 1)
+            .all()
+        )
+        candidates = [row._asdict() for row in rows[: self.page_size]]
+        has_next_page = len(rows) > self.page_size
+        return DirectoryPage(
+            candidates, candidates[-1]["id"] if has_next_page else None
+        )
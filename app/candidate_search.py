@@ -0,0 +1,380 @@
+import heapq
+import logging
+import re
+import threading
+from array import array
+from collections import Counter
+from concurrent.futures import Executor, ThreadPoolExecutor
+from time import monotonic
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from flask import Flask
+from fuzzywuzzy import fuzz
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from app.models import Candidate, db
+
+logger = logging.getLogger(__name__)
+
+WORD = re.compile(r"[0-9a-z]+")
+
+SEARCHED_COLUMNS = [
+    "first_name",
+    "last_name",
+    "email_address",
+    "secondary_email_address",
+]
+
+
+class SearchResult(NamedTuple):
+    id: int
+    name: str
+    email_address: Optional[str]
+    secondary_email_address: Optional[str]
+    score: int
+
+
+def trigrams(text: str) -> Set[str]:
+    """
+    The three letter sequences in `text`, ignoring case and punctuation. Each word is padded with a space either side,
+    so the start and end of a word count for more than its middle
+    """
+    return {
+        padded[i : i + 3]
+        for padded in [f" {word} " for word in WORD.findall(text.lower())]
+        for i in range(len(padded) - 2)
+    }
+
+
+def document_trigrams(document: Tuple[Optional[str], ...]) -> Set[str]:
+    return trigrams(" ".join(filter(None, document)))
+
+
+class CandidateSearchIndex:
+    """
+    A process-level trigram index over candidates' names and email addresses, for fuzzy searches that are quick enough
+    to run on every keystroke. A search counts, for each candidate, how many of the query's trigrams they share by
+    reading the index's list of candidates for each trigram, starting with the rarest, rather than scoring every
+    candidate. Only the closest few are then scored with fuzzywuzzy.
+
+    The index is built from the database the first time it's searched, and kept up to date with every change to a
+    candidate's name or email addresses that a session commits. Code that writes candidates some other way, like
+    `bulk_insert_mappings`, must call `invalidate` itself. Other processes' changes are found when the index reaches
+    `max_age` seconds old and is rebuilt. Rebuilds after the first run in the background, on `executor`, while
+    searches are answered from the old index, and changes committed during a rebuild are applied to the new one.
+
+    `max_postings` is the most entries the trigram lists can hold between them. A build counts every trigram first and
+    leaves out the ones shared by the most candidates until the rest fit, as they do little to tell candidates apart;
+    lists that grow past it later are dropped the same way. It doesn't bound the searched columns of each candidate,
+    which the index also holds to score results against, so those grow with the number of candidates.
+    """
+
+    def __init__(
+        self,
+        max_age: float = 3600,
+        max_postings: int = 10_000_000,
+        max_scanned: int = 50_000,
+        shortlist: int = 200,
+        scored: int = 20,
+        min_score: int = 60,
+    ):
+        """
+        :param max_age: how many seconds the index is kept before it's rebuilt
+        :param max_postings: the most entries the trigram lists can hold between them
+        :param max_scanned: the most trigram list entries a search reads
+        :param shortlist: how many of the candidates sharing the most trigrams with the query are compared with it
+        :param scored: how many of the closest candidates are scored with fuzzywuzzy
+        :param min_score: the lowest fuzzywuzzy score that's returned
+        """
+        self.max_age = max_age
+        self.max_postings = max_postings
+        self.max_scanned = max_scanned
+        self.shortlist = shortlist
+        self.scored = scored
+        self.min_score = min_score
+        self.app: Optional[Flask] = None
+        self.executor: Optional[Executor] = None
+        # guards the index's data, and is only held briefly; builds hold _build_lock while they read the database
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._built_at: Optional[float] = None
+        self._out_of_date = False
+        self._rebuilding = False
+        # changes committed while a build is reading the database, to apply to its index once it's swapped in
+        self._changes_during_build: Optional[Dict] = None
+        self._documents: Dict[int, Tuple[Optional[str], ...]] = {}
+        self._postings: Dict[str, array] = {}
+        self._dropped: Set[str] = set()
+        self._size = 0
+        # entries left in trigram lists for candidates that have since changed or been deleted
+        self._stale = 0
+
+    def search(self, query: str, limit: int = 10) -> List[SearchResult]:
+        """
+        The candidates whose names or email addresses are closest to `query`, closest first
+        """
+        query_trigrams = trigrams(query or "")
+        if not query_trigrams:
+            return []
+        self._ensure_built()
+        with self._lock:
+            shared = self._count_shared(query_trigrams)
+            shortlist = heapq.nlargest(self.shortlist, shared, key=shared.get)
+            closest = heapq.nlargest(
+                self.scored,
+                (
+                    (len(query_trigrams & document_trigrams(document)), id)
+                    for id, document in (
+                        (id, self._documents.get(id)) for id in shortlist
+                    )
+                    if document is not None
+                ),
+            )
+            documents = [
+                (id, self._documents[id]) for overlap, id in closest if overlap
+            ]
+        results = [self._score(query, id, document) for id, document in documents]
+        results = [result for result in results if result.score >= self.min_score]
+        return sorted(results, key=lambda result: (-result.score, result.id))[:limit]
+
+    def invalidate(self):
+        """
+        Mark the index out of date, so that it's rebuilt from the database the next time it's searched
+        """
+        self._out_of_date = True
+
+    def clear(self):
+        """
+        Throw the index away, so that the next search waits for it to be built
+        """
+        with self._build_lock, self._lock:
+            self._built_at = None
+            self._out_of_date = False
+            self._documents = {}
+            self._postings = {}
+            self._dropped = set()
+            self._size = self._stale = 0
+
+    def update(self, changes: Dict[int, Optional[Tuple[Optional[str], ...]]]):
+        """
+        Bring the index up to date with changed candidates, if it has been built
+        :param changes: each changed candidate's values for SEARCHED_COLUMNS, by id, or None if they were deleted
+        """
+        with self._lock:
+            if self._changes_during_build is not None:
+                self._changes_during_build.update(changes)
+            if self._built_at is None:
+                return
+            for id, document in changes.items():
+                self._replace(id, document)
+            self._enforce_budget()
+            if self._stale > max(self._size // 4, 1000):
+                # the lists are rebuilt without their stale entries on the next search
+                self._out_of_date = True
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "candidates": len(self._documents),
+            "trigrams": len(self._postings),
+            "dropped_trigrams": len(self._dropped),
+            "postings": self._size,
+            "stale_postings": self._stale,
+        }
+
+    def init_app(self, app: Flask):
+        self.app = app
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="candidate-search"
+        )
+        self.max_age = app.config.get("CANDIDATE_SEARCH_MAX_AGE", self.max_age)
+        self.max_postings = app.config.get(
+            "CANDIDATE_SEARCH_MAX_POSTINGS", self.max_postings
+        )
+        app.extensions["candidate_search"] = self
+        if app.config.get("CANDIDATE_SEARCH_PREBUILD"):
+            # building takes seconds for a large table, so it's done now rather than on the first search
+            self._rebuilding = True
+            self.executor.submit(self._build_in_background)
+
+    def build(self):
+        """
+        Build the index from the database now. Searches are answered from the old index until the new one is ready
+        """
+        with self._build_lock:
+            self._build()
+
+    def _build_in_background(self):
+        try:
+            with self.app.app_context():
+                try:
+                    self.build()
+                finally:
+                    db.session.remove()
+        except Exception:
+            logger.exception("Couldn't rebuild the candidate search index")
+        finally:
+            self._rebuilding = False
+
+    def _ensure_built(self):
+        if self._built_at is None:
+            # there's nothing to answer from yet, so the search waits for the index to be built
+            with self._build_lock:
+                if self._built_at is None:
+                    self._build()
+        elif self._out_of_date or monotonic() - self._built_at > self.max_age:
+            if self.executor is None:
+                self.build()
+            elif not self._rebuilding:
+                self._rebuilding = True
+                self.executor.submit(self._build_in_background)
+
+    def _build(self):
+        with self._lock:
+            self._changes_during_build = {}
+            # anything invalidating the index from here on may not be in what's read, so is left to rebuild it again
+            self._out_of_date = False
+        started = monotonic()
+        try:
+            columns = [getattr(Candidate, column) for column in SEARCHED_COLUMNS]
+            rows = db.session.execute(select([Candidate.id, *columns]))
+            documents = {id: tuple(document) for id, *document in rows}
+            postings, dropped = self._index(documents)
+        except Exception:
+            with self._lock:
+                self._changes_during_build = None
+            raise
+        with self._lock:
+            changes, self._changes_during_build = self._changes_during_build, None
+            self._documents = documents
+            self._postings = postings
+            self._dropped = dropped
+            self._size = sum(len(ids) for ids in postings.values())
+            self._stale = 0
+            self._built_at = started
+            for id, document in changes.items():
+                self._replace(id, document)
+            self._enforce_budget()
+
+    def _index(
+        self, documents: Dict[int, Tuple[Optional[str], ...]]
+    ) -> Tuple[Dict[str, array], Set[str]]:
+        """
+        The trigram lists for `documents`, within `max_postings`, and the trigrams left out to keep them within it.
+        Trigrams are counted before any list is filled, so that the lists are never bigger than the budget allows
+        """
+        frequencies = Counter()
+        for document in documents.values():
+            frequencies.update(document_trigrams(document))
+        dropped = set()
+        size = sum(frequencies.values())
+        if size > self.max_postings:
+            for gram, frequency in frequencies.most_common():
+                if size <= self.max_postings * 0.9:
+                    break
+                size -= frequency
+                dropped.add(gram)
+        postings = {gram: array("i") for gram in frequencies if gram not in dropped}
+        for id, document in documents.items():
+            for gram in document_trigrams(document) - dropped:
+                postings[gram].append(id)
+        return postings, dropped
+
+    def _add(self, id: int, grams: Set[str]):
+        for gram in grams:
+            if gram in self._dropped:
+                continue
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = array("i")
+            postings.append(id)
+            self._size += 1
+
+    def _replace(self, id: int, document: Optional[Tuple[Optional[str], ...]]):
+        old = self._documents.pop(id, None)
+        old_trigrams = document_trigrams(old) if old else set()
+        new_trigrams = set()
+        if document is not None:
+            self._documents[id] = document
+            new_trigrams = document_trigrams(document)
+        # entries for trigrams the candidate no longer has are left in place and skipped when searching, until there
+        # are enough of them to be worth rebuilding the lists
+        self._stale += len(old_trigrams - new_trigrams - self._dropped)
+        self._add(id, new_trigrams - old_trigrams)
+
+    def _enforce_budget(self):
+        if self._size <= self.max_postings:
+            return
+        by_length = sorted(
+            self._postings, key=lambda gram: len(self._postings[gram]), reverse=True
+        )
+        for gram in by_length:
+            if self._size <= self.max_postings * 0.9:
+                break
+            self._size -= len(self._postings.pop(gram))
+            self._dropped.add(gram)
+
+    def _count_shared(self, query_trigrams: Set[str]) -> Counter:
+        """
+        How many of the query's trigrams each candidate has, counted from the rarest trigrams first until reading the
+        next would take the entries read past `max_scanned`
+        """
+        lists = sorted(
+            (self._postings[gram] for gram in query_trigrams if gram in self._postings),
+            key=len,
+        )
+        shared = Counter()
+        scanned = 0
+        for postings in lists:
+            if scanned + len(postings) > self.max_scanned:
+                # a query made only of common trigrams is still answered, from the start of its rarest trigram's list
+                if not scanned:
+                    shared.update(postings[: self.max_scanned])
+                break
+            shared.update(postings)
+            scanned += len(postings)
+        return shared
+
+    @staticmethod
+    def _score(
+        query: str, id: int, document: Tuple[Optional[str], ...]
+    ) -> SearchResult:
+        first_name, last_name, email_address, secondary_email_address = document
+        name = " ".join(filter(None, [first_name, last_name]))
+        score = max(
+            fuzz.token_set_ratio(query, field)
+            for field in [name, email_address, secondary_email_address]
+            if field
+        )
+        return SearchResult(id, name, email_address, secondary_email_address, score)
+
+    def _record_flushed(self, session: Session, flush_context):
+        changes = session.info.setdefault("candidate_search_changes", {})
+        for candidate in session.new | session.dirty:
+            if not isinstance(candidate, Candidate):
+                continue
+            attributes = inspect(candidate).attrs
+            if candidate in session.new or any(
+                attributes[column].history.has_changes() for column in SEARCHED_COLUMNS
+            ):
+                changes[candidate.id] = tuple(
+                    getattr(candidate, column) for column in SEARCHED_COLUMNS
+                )
+        for candidate in session.deleted:
+            if isinstance(candidate, Candidate):
+                changes[candidate.id] = None
+
+    def _apply_committed(self, session: Session):
+        changes = session.info.pop("candidate_search_changes", None)
+        if changes:
+            self.update(changes)
+
+    @staticmethod
+    def _discard_rolled_back(session: Session):
+        session.info.pop("candidate_search_changes", None)
+
+
+candidate_search = CandidateSearchIndex()
+event.listen(Session, "after_flush", candidate_search._record_flushed)
+event.listen(Session, "after_commit", candidate_search._apply_committed)
+event.listen(Session, "after_rollback", candidate_search._discard_rolled_back)
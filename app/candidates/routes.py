@@ -1,6 +1,54 @@
+from datetime import MAXYEAR, MINYEAR
+
 from app.models import *
 from app.candidates import candidates_bp
-from flask import render_template, abort
+from app.candidate_directory import CandidateDirectory
+from app.reference_data import reference_data
+from flask import render_template, abort, jsonify, request, url_for
+from sqlalchemy.orm import joinedload
+
+DIRECTORY_FILTERS = ["scheme", "intake", "grade", "organisation", "location"]
+
+
+def directory_filters() -> dict:
+    """
+    The directory filters set in the query string. Any that aren't numbers are ignored, as is an intake year that a
+    date can't be made for
+    """
+    filters = {name: request.args.get(name, type=int) for name in DIRECTORY_FILTERS}
+    if filters["intake"] is not None and not MINYEAR <= filters["intake"] < MAXYEAR:
+        filters["intake"] = None
+    return {name: value for name, value in filters.items() if value is not None}
+
+
+@candidates_bp.route("/", methods=["GET"])
+def candidate_directory():
+    filters = directory_filters()
+    page = CandidateDirectory(**filters).page(request.args.get("after", 0, type=int))
+    return render_template(
+        "candidates/directory.html",
+        page_header="Candidates",
+        page=page,
+        filters=filters,
+        schemes=reference_data.all(Scheme),
+        grades=reference_data.all(Grade),
+        organisations=reference_data.all(Organisation),
+        locations=reference_data.all(Location),
+    )
+
+
+@candidates_bp.route("/api", methods=["GET"])
+def candidate_directory_api():
+    filters = directory_filters()
+    page = CandidateDirectory(**filters).page(request.args.get("after", 0, type=int))
+    return jsonify(
+        candidates=page.candidates,
+        next=url_for(
+            "candidates.candidate_directory_api", after=page.next_after, **filters
+        )
+        if page.next_after is not None
+        else None,
+    )
 
 
 @candidates_bp.route("/<int:candidate_id>", methods=["POST", "GET"])
@@ -8,4 +56,19 @@ def candidate_profile(candidate_id):
     candidate = Candidate.query.get(candidate_id)
     if not candidate:
         return abort(404)
-    return render_template("candidates/profile.html", candidate=candidate)
+    # every role, and the role change that started it, is loaded up front rather than one role at a time
+    roles = candidate.roles.options(
+        joinedload(Role.grade), joinedload(Role.location), joinedload(Role.profession)
+    ).all()
+    role_changes = {
+        role_change.new_role_id: role_change
+        for role_change in candidate.role_changes.options(
+            joinedload(RoleChangeEvent.role_change)
+        )
+    }
+    return render_template(
+        "candidates/profile.html",
+        candidate=candidate,
+        roles=roles,
+        role_changes=role_changes,
+    )
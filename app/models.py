@@ -1,11 +1,20 @@
+import logging
+
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import check_password_hash, generate_password_hash
 from flask_login import UserMixin
 from flask_migrate import Migrate
 from flask_login import LoginManager
-from datetime import datetime
-from sqlalchemy import and_, func
+from collections import defaultdict
+from datetime import datetime, date
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import and_, event, func, inspect, select
+from sqlalchemy.engine import Connection
 from sqlalchemy.ext.declarative import declared_attr
+from sqlalchemy.orm import Session, object_session
+from app.reference_data import reference_data
+
+logger = logging.getLogger(__name__)
 
 
 db = SQLAlchemy()
@@ -13,6 +22,12 @@ migrate = Migrate()
 login_manager = LoginManager()
 
 
+def as_date(date_or_datetime: datetime.date) -> datetime.date:
+    if isinstance(date_or_datetime, datetime):
+        return date_or_datetime.date()
+    return date_or_datetime
+
+
 class CandidateGetterMixin:
     @declared_attr
     def candidates(cls):
@@ -49,10 +64,22 @@ class RoleChangeEvent(db.Model):
 
     candidate_id = db.Column(db.ForeignKey("candidate.id"))
     former_role_id = db.Column(db.ForeignKey("role.id"))
-    new_role_id = db.Column(db.ForeignKey("role.id"))
+    new_role_id = db.Column(db.ForeignKey("role.id"), index=True)
     role_change_id = db.Column(db.ForeignKey("promotion.id"))
 
+    # promotion reports look for a candidate's role changes of one type between two dates
+    __table_args__ = (
+        db.Index(
+            "ix_role_change_event_candidate_id_role_change_id_role_change_date",
+            "candidate_id",
+            "role_change_id",
+            "role_change_date",
+        ),
+    )
+
     role_change = db.relationship("Promotion", lazy="select")
+    former_role = db.relationship("Role", foreign_keys=[former_role_id])
+    new_role = db.relationship("Role", foreign_keys=[new_role_id])
 
 
 class Ethnicity(CandidateGetterMixin, db.Model):
@@ -89,8 +116,18 @@ class Candidate(db.Model):
     ethnicity_id = db.Column(db.ForeignKey("ethnicity.id"))
     main_job_type_id = db.Column(db.ForeignKey("main_job_type.id"))
     joining_grade_id = db.Column(db.ForeignKey("grade.id"))
+    # denormalised from the candidate's most recent RoleChangeEvent, and kept up to date by `new_role`
+    current_role_id = db.Column(
+        db.ForeignKey("role.id", use_alter=True, name="candidate_current_role_id_fkey"),
+        index=True,
+    )
 
-    roles = db.relationship("Role", backref="candidate", lazy="dynamic")
+    roles = db.relationship(
+        "Role", backref="candidate", lazy="dynamic", foreign_keys="Role.candidate_id"
+    )
+    latest_role = db.relationship(
+        "Role", foreign_keys=[current_role_id], post_update=True
+    )
     applications = db.relationship(
         "Application",
         backref="candidate",
@@ -128,14 +165,12 @@ class Candidate(db.Model):
         """
         if not promoted_before_date:
             promoted_before_date = datetime.today()
-        role_change = (
-            Promotion.query.filter(Promotion.value == "temporary").first()
-            if temporary
-            else Promotion.query.filter(Promotion.value == "substantive").first()
+        role_change_id = reference_data.id_for(
+            Promotion, "temporary" if temporary else "substantive"
         )
         role_changes = self.role_changes.filter(
             and_(
-                RoleChangeEvent.role_change_id == role_change.id,
+                RoleChangeEvent.role_change_id == role_change_id,
                 RoleChangeEvent.role_change_date <= promoted_before_date,
                 RoleChangeEvent.role_change_date >= promoted_after_date,
             )
@@ -170,11 +205,16 @@ class Candidate(db.Model):
         elif not primary:
             self.secondary_email_address = new_address
 
-    def current_role(self):
-        if self.role_changes.first() is None:
-            return None
-        else:
-            return Role.query.get(self.role_changes.first().new_role_id)
+    def current_role(self) -> "Role":
+        return self.latest_role
+
+    def _latest_role_change_date(self):
+        dates = [
+            as_date(role_change.role_change_date)
+            for role_change in self.role_changes
+            if role_change.role_change_date
+        ]
+        return max(dates, default=None)
 
     def new_role(
         self,
@@ -193,18 +233,22 @@ class Candidate(db.Model):
             grade_id=new_grade_id,
             role_name=new_title,
         )
+        latest_role_change_date = self._latest_role_change_date()
         self.roles.append(new_role)
         self.role_changes.append(
             RoleChangeEvent(
                 candidate_id=self.id,
-                former_role_id=None
-                if self.current_role() is None
-                else self.current_role().id,
-                new_role_id=new_role.id,
+                former_role=self.latest_role,
+                new_role=new_role,
                 role_change_id=role_change_id,
                 role_change_date=start_date,
             )
         )
+        # a role that started before the current one, like the first role of a newly uploaded candidate, is history
+        if latest_role_change_date is None or (
+            start_date and as_date(start_date) >= latest_role_change_date
+        ):
+            self.latest_role = new_role
 
 
 class Organisation(db.Model):
@@ -283,7 +327,7 @@ class Role(db.Model):
     role_name = db.Column(db.String(256))
 
     organisation_id = db.Column(db.ForeignKey("organisation.id"))
-    candidate_id = db.Column(db.ForeignKey("candidate.id"))
+    candidate_id = db.Column(db.ForeignKey("candidate.id"), index=True)
     profession_id = db.Column(db.ForeignKey("profession.id"))
     location_id = db.Column(db.ForeignKey("location.id"))
     grade_id = db.Column(db.ForeignKey("grade.id"))
@@ -322,7 +366,7 @@ class Application(db.Model):
 
     aspirational_grade_id = db.Column(db.ForeignKey("grade.id"))
     scheme_id = db.Column(db.ForeignKey("scheme.id"))
-    candidate_id = db.Column(db.ForeignKey("candidate.id"), nullable=False)
+    candidate_id = db.Column(db.ForeignKey("candidate.id"), nullable=False, index=True)
 
     application_date = db.Column(db.Date())
     scheme_start_date = db.Column(db.Date(), index=True)
@@ -336,10 +380,29 @@ class Application(db.Model):
 
     aspirational_grade = db.relationship("Grade", lazy="select")
 
+    # every report starts from the applications to one scheme in one intake, and parallel reports split those
+    # applications up by candidate id
+    __table_args__ = (
+        db.Index(
+            "ix_application_scheme_id_scheme_start_date_candidate_id",
+            "scheme_id",
+            "scheme_start_date",
+            "candidate_id",
+        ),
+    )
+
     def defer(self, date_to_defer_to: datetime.date):
         self.scheme_start_date = date_to_defer_to
         return None
 
+    @staticmethod
+    def promotions_count_from(scheme_start_date: datetime.date) -> datetime.date:
+        """
+        We only take credit for promotions that happen after candidates find out they're successful, in December
+        before their scheme starts
+        """
+        return date(scheme_start_date.year - 1, 12, 1)
+
     def offer_status(self):
         if self.delta:
             output = "DELTA"
@@ -426,3 +489,273 @@ class AuditEvent(db.Model):
 class Promotion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     value = db.Column(db.String(28), index=True)
+
+
+class PromotionOutcome(db.Model):
+    """
+    The first substantive and the first temporary promotion of the candidate on each application, counting from the
+    application's `promotions_count_from` date. This is derived from RoleChangeEvent and Application so that promotion
+    reports can read one row per application rather than walking each candidate's role history. Rows are refreshed
+    whenever a session flushes a change to a candidate's role changes or applications; code that writes those tables
+    without the session, like `bulk_insert_mappings`, must call `refresh` itself.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    application_id = db.Column(
+        db.ForeignKey("application.id", ondelete="CASCADE"), nullable=False, unique=True
+    )
+    candidate_id = db.Column(
+        db.ForeignKey("candidate.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    substantive_promotion_date = db.Column(db.Date())
+    temporary_promotion_date = db.Column(db.Date())
+
+    @classmethod
+    def refresh(
+        cls, connection: Connection, candidate_ids: Iterable[int], batch_size=500
+    ):
+        """
+        Rebuild the outcomes for every application belonging to these candidates
+        :param connection: the connection to refresh through, which should be the session's own if it has unflushed or
+        uncommitted changes
+        :param candidate_ids: the candidates whose outcomes may have changed
+        :param batch_size: how many candidates to refresh in each round trip
+        """
+        candidate_ids = sorted({id for id in candidate_ids if id is not None})
+        for start in range(0, len(candidate_ids), batch_size):
+            cls._refresh_batch(connection, candidate_ids[start : start + batch_size])
+
+    @classmethod
+    def _refresh_batch(cls, connection: Connection, candidate_ids):
+        applications = connection.execute(
+            select(
+                [
+                    Application.id,
+                    Application.candidate_id,
+                    Application.scheme_start_date,
+                ]
+            ).where(Application.candidate_id.in_(candidate_ids))
+        ).fetchall()
+        promotions = defaultdict(list)
+        for candidate_id, promotion_type, role_change_date in connection.execute(
+            select(
+                [
+                    RoleChangeEvent.candidate_id,
+                    Promotion.value,
+                    RoleChangeEvent.role_change_date,
+                ]
+            )
+            .select_from(
+                RoleChangeEvent.__table__.join(
+                    Promotion.__table__,
+                    Promotion.id == RoleChangeEvent.role_change_id,
+                )
+            )
+            .where(
+                and_(
+                    RoleChangeEvent.candidate_id.in_(candidate_ids),
+                    Promotion.value.in_(["substantive", "temporary"]),
+                    RoleChangeEvent.role_change_date.isnot(None),
+                )
+            )
+        ):
+            promotions[candidate_id].append((promotion_type, as_date(role_change_date)))
+
+        connection.execute(
+            cls.__table__.delete().where(cls.candidate_id.in_(candidate_ids))
+        )
+        outcomes = [
+            cls._outcome(application, promotions[application.candidate_id])
+            for application in applications
+        ]
+        if outcomes:
+            connection.execute(cls.__table__.insert(), outcomes)
+
+    @staticmethod
+    def _outcome(application, promotions) -> dict:
+        outcome = dict(
+            application_id=application.id,
+            candidate_id=application.candidate_id,
+            substantive_promotion_date=None,
+            temporary_promotion_date=None,
+        )
+        if application.scheme_start_date is None:
+            return outcome
+        count_from = Application.promotions_count_from(
+            as_date(application.scheme_start_date)
+        )
+        for promotion_type, role_change_date in promotions:
+            key = f"{promotion_type}_promotion_date"
+            if role_change_date >= count_from and (
+                outcome[key] is None or role_change_date < outcome[key]
+            ):
+                outcome[key] = role_change_date
+        return outcome
+
+
+def _mark_promotion_outcomes_stale(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("stale_promotion_outcomes", set()).add(
+            target.candidate_id
+        )
+
+
+def _refresh_stale_promotion_outcomes(session: Session, flush_context):
+    candidate_ids = session.info.pop("stale_promotion_outcomes", None)
+    if candidate_ids:
+        PromotionOutcome.refresh(session.connection(), candidate_ids)
+
+
+for _model in (RoleChangeEvent, Application):
+    for _mapper_event in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _mapper_event, _mark_promotion_outcomes_stale)
+event.listen(Session, "after_flush", _refresh_stale_promotion_outcomes)
+
+
+class CandidateEmail(db.Model):
+    """
+    Every primary and secondary email address of every candidate, normalised to lower case without surrounding spaces,
+    so that a candidate can be found by an address however it was typed with one probe of the unique index on
+    `address`. Rows are refreshed whenever a session flushes a change to a candidate's email addresses; code that
+    writes candidates without the session, like `bulk_insert_mappings`, must call `refresh` itself.
+
+    The email address columns only have to be unique as they were typed, so two candidates can have addresses that
+    normalise to the same one. Each normalised address is kept for the candidate who already has it, or for a primary
+    address before a secondary one, and the other candidates' copies are left out and logged.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    candidate_id = db.Column(
+        db.ForeignKey("candidate.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    address = db.Column(db.String(120), nullable=False, index=True, unique=True)
+    primary = db.Column(db.Boolean, nullable=False)
+
+    @staticmethod
+    def normalise(address: str) -> str:
+        return address.strip().lower()
+
+    @classmethod
+    def candidate(cls, address: str) -> Optional[Candidate]:
+        """
+        The candidate with `address` as their primary or secondary email address, in any case, or None
+        """
+        if not address:
+            return None
+        return (
+            Candidate.query.join(cls, cls.candidate_id == Candidate.id)
+            .filter(cls.address == cls.normalise(address))
+            .first()
+        )
+
+    @classmethod
+    def refresh(
+        cls, connection: Connection, candidate_ids: Iterable[int], batch_size=500
+    ) -> List[Tuple[int, str]]:
+        """
+        Rebuild the addresses of these candidates from their email address columns
+        :param connection: the connection to refresh through, which should be the session's own if it has unflushed or
+        uncommitted changes
+        :param candidate_ids: the candidates whose addresses may have changed
+        :param batch_size: how many candidates to refresh in each round trip
+        :return: (candidate id, address) pairs for the addresses left out because another candidate has them
+        """
+        candidate_ids = sorted({id for id in candidate_ids if id is not None})
+        collisions = []
+        for start in range(0, len(candidate_ids), batch_size):
+            batch = candidate_ids[start : start + batch_size]
+            connection.execute(
+                cls.__table__.delete().where(cls.candidate_id.in_(batch))
+            )
+            rows = [
+                row
+                for candidate in connection.execute(
+                    select(
+                        [
+                            Candidate.id,
+                            Candidate.email_address,
+                            Candidate.secondary_email_address,
+                        ]
+                    )
+                    .where(Candidate.id.in_(batch))
+                    .order_by(Candidate.id)
+                )
+                for row in cls.rows(*candidate)
+            ]
+            if not rows:
+                continue
+            taken = {
+                address
+                for address, in connection.execute(
+                    select([cls.address]).where(
+                        cls.address.in_({row["address"] for row in rows})
+                    )
+                )
+            }
+            kept = []
+            for row in sorted(rows, key=lambda row: not row["primary"]):
+                if row["address"] in taken:
+                    collisions.append((row["candidate_id"], row["address"]))
+                else:
+                    taken.add(row["address"])
+                    kept.append(row)
+            if kept:
+                connection.execute(cls.__table__.insert(), kept)
+        for candidate_id, address in collisions:
+            logger.warning(
+                f"Candidate {candidate_id}'s address {address} belongs to another candidate, so they can't be found "
+                f"by it"
+            )
+        return collisions
+
+    @classmethod
+    def rows(
+        cls, candidate_id: int, email_address: str, secondary_email_address: str
+    ) -> List[dict]:
+        """
+        The rows for one candidate's addresses. A secondary address that's the same as the primary one is left out
+        """
+        rows = []
+        for address, primary in [
+            (email_address, True),
+            (secondary_email_address, False),
+        ]:
+            if address and cls.normalise(address) not in [
+                row["address"] for row in rows
+            ]:
+                rows.append(
+                    dict(
+                        candidate_id=candidate_id,
+                        address=cls.normalise(address),
+                        primary=primary,
+                    )
+                )
+        return rows
+
+
+def _mark_candidate_emails_stale(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("stale_candidate_emails", set()).add(target.id)
+
+
+def _mark_changed_candidate_emails_stale(mapper, connection, target):
+    attributes = inspect(target).attrs
+    if (
+        attributes.email_address.history.has_changes()
+        or attributes.secondary_email_address.history.has_changes()
+    ):
+        _mark_candidate_emails_stale(mapper, connection, target)
+
+
+def _refresh_stale_candidate_emails(session: Session, flush_context):
+    candidate_ids = session.info.pop("stale_candidate_emails", None)
+    if candidate_ids:
+        CandidateEmail.refresh(session.connection(), candidate_ids)
+
+
+event.listen(Candidate, "after_insert", _mark_candidate_emails_stale)
+event.listen(Candidate, "after_update", _mark_changed_candidate_emails_stale)
+event.listen(Candidate, "after_delete", _mark_candidate_emails_stale)
+event.listen(Session, "after_flush", _refresh_stale_candidate_emails)
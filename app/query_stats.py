@@ -0,0 +1,193 @@
+import heapq
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from flask import Flask, Response, request
+from flask.logging import default_handler
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    """
+    How many SQL statements were run, how long they took altogether, and the slowest few of them
+    """
+
+    def __init__(self, slowest_kept: int = 3):
+        self.slowest_kept = slowest_kept
+        self.count = 0
+        self.total_time = 0.0
+        self._slowest: List[Tuple[float, str]] = []
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.total_time += duration
+        self._keep_if_slow(duration, statement)
+
+    def add(self, other: "QueryStats"):
+        self.count += other.count
+        self.total_time += other.total_time
+        for duration, statement in other._slowest:
+            self._keep_if_slow(duration, statement)
+
+    def _keep_if_slow(self, duration: float, statement: str):
+        if len(self._slowest) < self.slowest_kept:
+            heapq.heappush(self._slowest, (duration, statement))
+        else:
+            heapq.heappushpop(self._slowest, (duration, statement))
+
+    @property
+    def slowest(self) -> List[Tuple[float, str]]:
+        """
+        (seconds, statement) pairs for the slowest statements, slowest first
+        """
+        return sorted(self._slowest, reverse=True)
+
+    def as_dict(self) -> Dict:
+        return {
+            "queries": self.count,
+            "sql_ms": round(self.total_time * 1000, 2),
+            "slowest": [
+                {
+                    "ms": round(duration * 1000, 2),
+                    "statement": " ".join(statement.split()),
+                }
+                for duration, statement in self.slowest
+            ],
+        }
+
+
+class QueryStatsRecorder:
+    """
+    Records the SQL each request and each report runs, from SQLAlchemy's engine events. Every request's stats are
+    written to the log as a line of JSON, at the level QUERY_STATS_LOG_LEVEL sets, and in debug mode, or if
+    QUERY_STATS_HEADERS is set, are also sent back in X-Query-Count and X-Query-Time headers. Reports are tracked with
+    `track`, and their stats are added up by report class in `reports`, so a report that starts running a query per
+    candidate stands out.
+
+    Statements are counted against everything being tracked in the thread that runs them. A streamed report runs its
+    queries after its request has finished, so they're counted against the report but not the request.
+    """
+
+    def __init__(self, app: Flask = None):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.slowest_kept = 3
+        self.headers = False
+        self.reports: Dict[str, QueryStats] = defaultdict(self._new_stats)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        self.slowest_kept = app.config.get("QUERY_STATS_SLOWEST", 3)
+        self.headers = app.debug or app.config.get("QUERY_STATS_HEADERS", False)
+        logger.setLevel(app.config.get("QUERY_STATS_LOG_LEVEL", "INFO"))
+        # Flask's handler is added unless this logger's lines already reach it as a child of the app's logger
+        if not logger.name.startswith(f"{app.logger.name}."):
+            logger.addHandler(default_handler)
+        if not event.contains(Engine, "before_cursor_execute", self._before_execute):
+            event.listen(Engine, "before_cursor_execute", self._before_execute)
+            event.listen(Engine, "after_cursor_execute", self._after_execute)
+            event.listen(Engine, "handle_error", self._execute_failed)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.extensions["query_stats"] = self
+
+    def _new_stats(self) -> QueryStats:
+        return QueryStats(self.slowest_kept)
+
+    def _active(self) -> List[QueryStats]:
+        if not hasattr(self._local, "active"):
+            self._local.active = []
+        return self._local.active
+
+    @contextmanager
+    def track(self, name: str):
+        """
+        Record the SQL run in this thread inside the block, and add it to `reports[name]` afterwards
+        """
+        stats = self._new_stats()
+        self._active().append(stats)
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            self._active().remove(stats)
+            with self._lock:
+                self.reports[name].add(stats)
+            logger.info(
+                json.dumps(
+                    {
+                        "report": name,
+                        "ms": round((time.perf_counter() - start) * 1000, 2),
+                        **stats.as_dict(),
+                    }
+                )
+            )
+
+    def _before_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        conn.info.setdefault("query_stats_started", []).append(
+            (context, time.perf_counter())
+        )
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        _, started = conn.info["query_stats_started"].pop()
+        duration = time.perf_counter() - started
+        for stats in self._active():
+            stats.record(statement, duration)
+
+    @staticmethod
+    def _execute_failed(exception_context):
+        # a statement that fails doesn't reach _after_execute, so its start time is dropped here. Errors can also be
+        # raised before a statement reaches its cursor, so only the failed statement's own start time is dropped
+        connection = exception_context.connection
+        if connection is None or not connection.info.get("query_stats_started"):
+            return
+        context, _ = connection.info["query_stats_started"][-1]
+        if context is exception_context.execution_context:
+            connection.info["query_stats_started"].pop()
+
+    def _start_request(self):
+        # a request that raised doesn't reach _finish_request, so its stats may still be active
+        self._stop_request()
+        stats = self._new_stats()
+        self._local.request = stats
+        self._active().append(stats)
+
+    def _finish_request(self, response: Response) -> Response:
+        stats = self._stop_request()
+        if stats is None:
+            return response
+        logger.info(
+            json.dumps(
+                {
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status_code,
+                    **stats.as_dict(),
+                }
+            )
+        )
+        if self.headers:
+            response.headers["X-Query-Count"] = str(stats.count)
+            response.headers["X-Query-Time"] = f"{stats.total_time * 1000:.2f}ms"
+        return response
+
+    def _stop_request(self) -> QueryStats:
+        stats = getattr(self._local, "request", None)
+        if stats is not None:
+            self._active().remove(stats)
+            self._local.request = None
+        return stats
+
+
+query_stats = QueryStatsRecorder()
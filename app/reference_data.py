@@ -0,0 +1,109 @@
+from collections import Counter, namedtuple
+from time import monotonic
+from typing import Any, Dict, List, Optional
+
+from flask_sqlalchemy import Model
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class ReferenceDataCache:
+    """
+    A process-level cache of small lookup tables, like Grade, Location and Promotion, that are read on hot paths but
+    rarely written to. Each table is loaded whole the first time it's asked for and kept as plain, read-only rows,
+    so cached rows are safe to use from any session. Rows can be looked up by id or by their natural key: `name` for
+    tables that have one, like Organisation and Scheme, otherwise `value`.
+
+    A table is dropped from the cache whenever a session flushes a change to it or runs a bulk update or delete against
+    it, and every table is dropped when a session rolls back. Code that writes to these tables some other way, like
+    `bulk_insert_mappings`, must call `invalidate` itself. Other processes find out about changes when their copy
+    reaches `max_age` seconds old.
+    """
+
+    def __init__(self, max_age: float = 300):
+        self.max_age = max_age
+        self.hits = Counter()
+        self.misses = Counter()
+        self._tables: Dict[type, "_CachedTable"] = {}
+
+    def all(self, model: Model) -> List:
+        """
+        Every row in the table, in id order
+        """
+        return self._table(model).rows
+
+    def get(self, model: Model, key: Any):
+        """
+        The row whose natural key is `key`, or None
+        """
+        return self._table(model).by_key.get(key)
+
+    def by_id(self, model: Model, id: int):
+        """
+        The row with primary key `id`, or None
+        """
+        return self._table(model).by_id.get(int(id))
+
+    def id_for(self, model: Model, key: Any) -> Optional[int]:
+        row = self.get(model, key)
+        return None if row is None else row.id
+
+    def ids(self, model: Model) -> Dict[Any, int]:
+        """
+        A dictionary of natural key to id for the whole table
+        """
+        return {key: row.id for key, row in self._table(model).by_key.items()}
+
+    def invalidate(self, *models: Model):
+        """
+        Drop the given tables from the cache, or every table if none are given
+        """
+        if not models:
+            self._tables.clear()
+        for model in models:
+            self._tables.pop(model, None)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            table: {"hits": self.hits[table], "misses": self.misses[table]}
+            for table in set(self.hits) | set(self.misses)
+        }
+
+    def _table(self, model: Model) -> "_CachedTable":
+        table = self._tables.get(model)
+        if table is None or monotonic() - table.loaded_at > self.max_age:
+            self.misses[model.__tablename__] += 1
+            table = self._tables[model] = _CachedTable(model)
+        else:
+            self.hits[model.__tablename__] += 1
+        return table
+
+    def _invalidate_flushed(self, session: Session, flush_context):
+        changed = session.new | session.dirty | session.deleted
+        self.invalidate(*{type(instance) for instance in changed} & set(self._tables))
+
+    def _invalidate_bulk(self, context):
+        self.invalidate(context.mapper.class_)
+
+
+class _CachedTable:
+    def __init__(self, model: Model):
+        columns = model.__table__.columns
+        row_type = namedtuple(model.__name__, [column.key for column in columns])
+        self.rows = [
+            row_type(*row)
+            for row in model.query.with_entities(*columns).order_by(model.id)
+        ]
+        key = "name" if "name" in columns else "value"
+        self.by_key = {}
+        for row in self.rows:
+            self.by_key.setdefault(getattr(row, key), row)
+        self.by_id = {row.id: row for row in self.rows}
+        self.loaded_at = monotonic()
+
+
+reference_data = ReferenceDataCache()
+event.listen(Session, "after_flush", reference_data._invalidate_flushed)
+event.listen(Session, "after_bulk_update", reference_data._invalidate_bulk)
+event.listen(Session, "after_bulk_delete", reference_data._invalidate_bulk)
+event.listen(Session, "after_rollback", lambda session: reference_data.invalidate())
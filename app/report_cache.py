@@ -0,0 +1,239 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Iterator, Optional
+
+from flask import Flask, stream_with_context
+
+from reporting.base_report import Report
+
+DATA_VERSION_KEY = "data-version"
+
+
+class SimpleBackend:
+    """
+    A least-recently-used cache held in this process. Every web worker keeps its own copy, so data version bumps made
+    by other processes, like an upload run from the command line, are not seen. Use one of the shared backends when
+    more than one process writes to the database
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = int(self._entries.get(key) or 0) + 1
+            self._entries[key] = str(value)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileSystemBackend:
+    """
+    Keeps each entry in its own file under `directory`, so every process on the machine shares one cache. Bumping the
+    data version deletes the entries saved against older versions
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            with open(self._path(key), encoding="utf-8", newline="") as entry:
+                return entry.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key: str, value: str):
+        path = self._path(key)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8", newline="") as entry:
+            entry.write(value)
+        os.replace(temporary_path, path)
+
+    def incr(self, key: str) -> int:
+        import fcntl
+
+        with self._lock, open(self._path(key) + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            value = int(self.get(key) or 0) + 1
+            self.set(key, str(value))
+        if key == DATA_VERSION_KEY:
+            self._remove_entries(keep={self._path(key), self._path(key) + ".lock"})
+        return value
+
+    def clear(self):
+        self._remove_entries(keep=set())
+
+    def _remove_entries(self, keep: set):
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if path not in keep and not filename.endswith(".tmp"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _path(self, key: str) -> str:
+        return os.path.join(
+            self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest()
+        )
+
+
+class LocalRedis:
+    """
+    A stand-in for a Redis client that keeps its data in this process, for development and tests where no Redis
+    server is available. It only implements the commands RedisBackend uses
+    """
+
+    def __init__(self):
+        self._data: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key: str, value: str, ex: Optional[int] = None):
+        with self._lock:
+            self._data[key] = str(value).encode("utf-8")
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = int(self._data.get(key, b"0")) + 1
+            self._data[key] = str(value).encode("utf-8")
+            return value
+
+
+class RedisBackend:
+    """
+    Stores entries in Redis, or in anything that answers the same get, set and incr commands. Entries expire after
+    `timeout` seconds so that those saved against old data versions don't build up
+    """
+
+    def __init__(self, client, timeout: int = 24 * 60 * 60, prefix: str = "report:"):
+        self.client = client
+        self.timeout = timeout
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(self.prefix + key)
+        return None if value is None else value.decode("utf-8")
+
+    def set(self, key: str, value: str):
+        self.client.set(self.prefix + key, value, ex=self.timeout)
+
+    def incr(self, key: str) -> int:
+        return self.client.incr(self.prefix + key)
+
+    def clear(self):
+        # the database may be shared, so move on to a new data version rather than flushing it
+        self.incr(DATA_VERSION_KEY)
+
+
+class ReportCache:
+    """
+    Caches the CSV output of reports. Entries are keyed by the kind of report, its parameters, today's date and the
+    data version, a counter that code which changes candidate data bumps with `bump_data_version`. A bump makes every
+    report generated before it unreachable, so nothing has to work out which reports a change affects.
+
+    The backend is chosen by the REPORT_CACHE_TYPE setting: "filesystem", which uses REPORT_CACHE_DIR, "redis", which
+    connects to REPORT_CACHE_REDIS_URL, or uses a LocalRedis if that isn't set, or "simple". The default is "redis" if
+    REPORT_CACHE_REDIS_URL is set and "filesystem" if not, since every web worker has to see the same data version.
+    "simple" only suits a single process, like the tests.
+    """
+
+    def __init__(self, app: Flask = None):
+        self.backend = SimpleBackend()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        self.backend = self._create_backend(app.config)
+        app.extensions["report_cache"] = self
+
+    @staticmethod
+    def _create_backend(config):
+        cache_type = config.get("REPORT_CACHE_TYPE") or (
+            "redis" if config.get("REPORT_CACHE_REDIS_URL") else "filesystem"
+        )
+        if cache_type == "simple":
+            return SimpleBackend(config.get("REPORT_CACHE_MAX_ENTRIES", 64))
+        if cache_type == "filesystem":
+            return FileSystemBackend(config["REPORT_CACHE_DIR"])
+        if cache_type == "redis":
+            url = config.get("REPORT_CACHE_REDIS_URL")
+            if url:
+                import redis
+
+                return RedisBackend(redis.Redis.from_url(url))
+            return RedisBackend(LocalRedis())
+        raise ValueError(f"Unknown REPORT_CACHE_TYPE {cache_type}")
+
+    def data_version(self) -> int:
+        return int(self.backend.get(DATA_VERSION_KEY) or 0)
+
+    def bump_data_version(self) -> int:
+        """
+        Call this after committing a change to the data reports are built from
+        """
+        return self.backend.incr(DATA_VERSION_KEY)
+
+    def clear(self):
+        self.backend.clear()
+
+    def key(self, report_type: str, parameters: Dict) -> str:
+        parameters = "&".join(
+            f"{name}={value}" for name, value in sorted(parameters.items())
+        )
+        return f"{self.data_version()}:{date.today().isoformat()}:{report_type}:{parameters}"
+
+    def respond(self, report: Report, report_type: str, parameters: Dict):
+        """
+        The report's response, from the cache if it has been generated since the data last changed. Otherwise the
+        report is streamed as usual and saved once the last row has been sent. The X-Report-Cache header says which
+        """
+        key = self.key(report_type, parameters)
+        cached = self.backend.get(key)
+        if cached is not None:
+            response = report.response(cached)
+            response.headers["X-Report-Cache"] = "hit"
+            return response
+        response = report.response(
+            stream_with_context(self._save_when_complete(key, report))
+        )
+        response.headers["X-Report-Cache"] = "miss"
+        return response
+
+    def _save_when_complete(self, key: str, report: Report) -> Iterator[str]:
+        chunks = []
+        for chunk in report.generate_report_data():
+            chunks.append(chunk)
+            yield chunk
+        self.backend.set(key, "".join(chunks))
+
+
+report_cache = ReportCache()
@@ -0,0 +1,244 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import uuid
+from collections import namedtuple
+from concurrent.futures import Executor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from flask import Flask
+
+from reporting import ReportFactory
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+COMPLETE = "complete"
+FAILED = "failed"
+
+Job = namedtuple(
+    "Job",
+    ["id", "report_type", "parameters", "status", "filename", "error", "created_at"],
+)
+
+
+class InMemoryBroker:
+    """
+    Keeps jobs in this process. A job can only be polled from the web worker that submitted it, so this suits
+    development and single-worker deployments
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def add(self, job: Job):
+        with self._lock:
+            self._jobs[job.id] = job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id] = self._jobs[job_id]._replace(**fields)
+
+    def expire(self, created_before: datetime) -> List[str]:
+        with self._lock:
+            expired = [
+                job.id for job in self._jobs.values() if job.created_at < created_before
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return expired
+
+
+class SQLiteBroker:
+    """
+    Keeps jobs in a SQLite file, so that every web worker on the machine can see every job
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS report_job ("
+                "id TEXT PRIMARY KEY, report_type TEXT, parameters TEXT, status TEXT, filename TEXT, error TEXT, "
+                "created_at TEXT)"
+            )
+
+    def add(self, job: Job):
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO report_job VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.id,
+                    job.report_type,
+                    json.dumps(job.parameters),
+                    job.status,
+                    job.filename,
+                    job.error,
+                    job.created_at.isoformat(),
+                ),
+            )
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT * FROM report_job WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return Job(
+            row[0],
+            row[1],
+            json.loads(row[2]),
+            row[3],
+            row[4],
+            row[5],
+            datetime.fromisoformat(row[6]),
+        )
+
+    def update(self, job_id: str, **fields):
+        assignments = ", ".join(f"{field} = ?" for field in fields)
+        with self._connect() as connection:
+            connection.execute(
+                f"UPDATE report_job SET {assignments} WHERE id = ?",
+                (*fields.values(), job_id),
+            )
+
+    def expire(self, created_before: datetime) -> List[str]:
+        """
+        Remove jobs created before `created_before`, including any that never finished because their worker stopped
+        :return: the ids of the jobs removed
+        """
+        query = "FROM report_job WHERE created_at < ?"
+        parameters = (created_before.isoformat(),)
+        with self._connect() as connection:
+            expired = [
+                row[0] for row in connection.execute(f"SELECT id {query}", parameters)
+            ]
+            connection.execute(f"DELETE {query}", parameters)
+        return expired
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+
+class ReportJobQueue:
+    """
+    Builds reports in the background so that web workers aren't tied up while large reports run. A submitted job is
+    recorded with the broker and handed to a pool of worker threads, which write the finished CSV to REPORT_JOB_DIR.
+
+    The broker is chosen by the REPORT_JOB_BROKER setting: "sqlite" (the default), which keeps jobs in
+    REPORT_JOB_DATABASE, or "memory", which only suits a single web worker. REPORT_JOB_WORKERS sets the number of worker
+    threads. Jobs and their CSVs are removed REPORT_JOB_EXPIRY seconds after they were submitted, when the next job is,
+    so jobs left pending or running by a worker that was restarted don't stay forever.
+    """
+
+    def __init__(self, app: Flask = None):
+        self.app = None
+        self.broker = None
+        self.executor: Optional[Executor] = None
+        self.results_directory = None
+        self.expiry = timedelta(days=1)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        self.app = app
+        self.results_directory = app.config.get("REPORT_JOB_DIR") or os.path.join(
+            tempfile.gettempdir(), "talent-tracker-reports"
+        )
+        os.makedirs(self.results_directory, exist_ok=True)
+        if app.config.get("REPORT_JOB_BROKER", "sqlite") == "memory":
+            if not (app.debug or app.testing):
+                logger.warning(
+                    "Report jobs are kept in memory, so they can only be polled from the web worker that submitted "
+                    "them"
+                )
+            self.broker = InMemoryBroker()
+        else:
+            self.broker = SQLiteBroker(app.config["REPORT_JOB_DATABASE"])
+        self.expiry = timedelta(seconds=app.config.get("REPORT_JOB_EXPIRY", 86400))
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config.get("REPORT_JOB_WORKERS", 2),
+            thread_name_prefix="report-job",
+        )
+        app.extensions["report_jobs"] = self
+
+    def submit(self, report_type: str, parameters: Dict) -> Job:
+        """
+        Queue a report built from the same fields as the report forms take
+        :param report_type: "detailed", or the report-type field of the promotion report form
+        :param parameters: the rest of the form's fields
+        :return: the queued job
+        """
+        job = Job(
+            id=uuid.uuid4().hex,
+            report_type=report_type,
+            parameters=parameters,
+            status=PENDING,
+            filename=None,
+            error=None,
+            created_at=datetime.now(),
+        )
+        self.expire()
+        self.broker.add(job)
+        self.executor.submit(self._run, job)
+        return job
+
+    def expire(self):
+        """
+        Remove jobs older than the expiry, and any CSVs, finished or half-written, that are as old. Files are removed by
+        age rather than by job, since a worker that stops mid-job leaves its half-written CSV behind and the in-memory
+        broker forgets its jobs altogether
+        """
+        created_before = datetime.now() - self.expiry
+        self.broker.expire(created_before)
+        for filename in os.listdir(self.results_directory):
+            path = os.path.join(self.results_directory, filename)
+            if filename.endswith((".csv", ".tmp")) and (
+                datetime.fromtimestamp(os.path.getmtime(path)) < created_before
+            ):
+                self._remove(path)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.broker.get(job_id)
+
+    def result_path(self, job_id: str) -> str:
+        return os.path.join(self.results_directory, f"{job_id}.csv")
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _run(self, job: Job):
+        self.broker.update(job.id, status=RUNNING)
+        path = self.result_path(job.id)
+        try:
+            with self.app.app_context():
+                report = ReportFactory.from_form(job.report_type, job.parameters)
+                with open(f"{path}.tmp", "w", encoding="utf-8", newline="") as output:
+                    for chunk in report.generate_report_data():
+                        output.write(chunk)
+                os.replace(f"{path}.tmp", path)
+        except Exception as error:
+            logger.exception(f"Report job {job.id} failed")
+            self._remove(f"{path}.tmp")
+            self.broker.update(job.id, status=FAILED, error=str(error))
+        else:
+            self.broker.update(job.id, status=COMPLETE, filename=report.filename)
+
+
+report_jobs = ReportJobQueue()
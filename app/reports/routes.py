@@ -1,8 +1,24 @@
-from flask import request, render_template, url_for, redirect
+from itertools import product
+
+from flask import (
+    Response,
+    abort,
+    jsonify,
+    request,
+    render_template,
+    url_for,
+    redirect,
+    send_file,
+    stream_with_context,
+)
+from werkzeug.datastructures import Headers
 from app.reports import reports_bp
 from reporting import ReportFactory
-from reporting.detailed_report import DetailedReport
+from reporting.report_pack import ReportPack
 from app.models import Promotion
+from app.reference_data import reference_data
+from app.report_cache import report_cache
+from app.report_jobs import report_jobs, COMPLETE
 
 
 @reports_bp.route("/", methods=["POST", "GET"])
@@ -10,6 +26,8 @@ def reports_index():
     next_page = {
         "promotion": "reports_bp.promotion_reports",
         "detailed": "reports_bp.detailed_reports",
+        "pack": "reports_bp.report_pack",
+        "trends": "reports_bp.trend_reports",
     }
     if request.method == "POST":
         return redirect(url_for(next_page.get(request.form.get("report-type"))))
@@ -21,10 +39,9 @@ def promotion_reports():
 
     if request.method == "POST":
         form_data = request.form.to_dict()
-        report = ReportFactory.create_report(
-            report_type=form_data.pop("report-type"), **form_data
-        )
-        return report.return_data()
+        report_type = form_data.pop("report-type")
+        report = ReportFactory.from_form(report_type, form_data)
+        return report_cache.respond(report, report_type, form_data)
     return render_template(
         "reports/promotion-report.html", page_header="Promotion report"
     )
@@ -34,14 +51,78 @@ def promotion_reports():
 def detailed_reports():
     if request.method == "POST":
         form_data = request.form.to_dict()
-        report = DetailedReport(
-            form_data.get("year"),
-            form_data.get("scheme"),
-            form_data.get("promotion-type"),
-        )
-        return report.return_data()
+        report = ReportFactory.from_form("detailed", form_data)
+        return report_cache.respond(report, "detailed", form_data)
     return render_template(
         "reports/detailed-report.html",
         page_header="Detailed Report",
-        promotion_types=Promotion.query.all(),
+        promotion_types=reference_data.all(Promotion),
+    )
+
+
+@reports_bp.route("/trends", methods=["POST", "GET"])
+def trend_reports():
+    if request.method == "POST":
+        form_data = request.form.to_dict()
+        form_data.pop("report-type", None)
+        report = ReportFactory.from_form("trends", form_data)
+        return report_cache.respond(report, "trends", form_data)
+    return render_template("reports/trend-report.html", page_header="Trend report")
+
+
+@reports_bp.route("/pack", methods=["POST", "GET"])
+def report_pack():
+    if request.method == "POST":
+        pack = ReportPack(
+            product(request.form.getlist("scheme"), request.form.getlist("year"))
+        )
+        headers = Headers()
+        headers["Content-Disposition"] = f"attachment; filename={pack.filename}.zip"
+        return Response(
+            stream_with_context(pack.generate_zip()),
+            mimetype="application/zip",
+            headers=headers,
+        )
+    return render_template("reports/report-pack.html", page_header="Report pack")
+
+
+@reports_bp.route("/jobs/<report_type>", methods=["POST"])
+def submit_report_job(report_type):
+    form_data = request.form.to_dict()
+    form_data.pop("report-type", None)
+    job = report_jobs.submit(report_type, form_data)
+    return redirect(url_for("reports_bp.report_job", job_id=job.id), code=303)
+
+
+@reports_bp.route("/jobs/<job_id>", methods=["GET"])
+def report_job(job_id):
+    job = report_jobs.get(job_id) or abort(404)
+    return render_template(
+        "reports/report-job.html", page_header="Your report", job=job
+    )
+
+
+@reports_bp.route("/jobs/<job_id>/status", methods=["GET"])
+def report_job_status(job_id):
+    job = report_jobs.get(job_id) or abort(404)
+    return jsonify(
+        id=job.id,
+        status=job.status,
+        error=job.error,
+        download_url=url_for("reports_bp.download_report_job", job_id=job.id)
+        if job.status == COMPLETE
+        else None,
+    )
+
+
+@reports_bp.route("/jobs/<job_id>/download", methods=["GET"])
+def download_report_job(job_id):
+    job = report_jobs.get(job_id) or abort(404)
+    if job.status != COMPLETE:
+        abort(409)
+    return send_file(
+        report_jobs.result_path(job.id),
+        mimetype="text/csv",
+        as_attachment=True,
+        attachment_filename=f"{job.filename}.csv",
     )
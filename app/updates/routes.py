@@ -1,9 +1,10 @@
 from datetime import date
 from typing import Dict
 
-from flask import render_template, request, url_for, redirect, session
+from flask import jsonify, render_template, request, url_for, redirect, session
 from app.models import (
     Candidate,
+    CandidateEmail,
     Grade,
     db,
     Organisation,
@@ -11,20 +12,16 @@ from app.models import (
     Profession,
     Promotion,
 )
+from app.candidate_search import candidate_search
+from app.reference_data import reference_data
+from app.report_cache import report_cache
 from app.updates import update_bp, get_candidate
-from sqlalchemy import or_
 
 
 @update_bp.route("/", methods=["POST", "GET"])
 def index():
     if request.method == "POST":
-        email = request.form.get("candidate-email")
-        candidate = Candidate.query.filter(
-            or_(
-                Candidate.email_address == email,
-                Candidate.secondary_email_address == email,
-            )
-        ).first()
+        candidate = CandidateEmail.candidate(request.form.get("candidate-email"))
         if candidate:
             session["candidate-id"] = candidate.id
         else:
@@ -32,7 +29,19 @@ def index():
             return redirect(url_for("update_bp.index"))
         return redirect(url_for("update_bp.choose_update"))
     session["update-data"] = {}
-    return render_template("search-candidate.html", error=session.pop("error", None))
+    query = request.args.get("q", "")
+    return render_template(
+        "search-candidate.html",
+        error=session.pop("error", None),
+        query=query,
+        results=candidate_search.search(query) if query else None,
+    )
+
+
+@update_bp.route("/search", methods=["GET"])
+def search_candidates():
+    results = candidate_search.search(request.args.get("q", ""))
+    return jsonify(candidates=[result._asdict() for result in results])
 
 
 @update_bp.route("/choose-update", methods=["POST", "GET"])
@@ -70,10 +79,12 @@ def update_role():
         "promotable_grades": Grade.new_grades(
             Candidate.query.get(candidate_id).current_grade()
         ),
-        "organisations": Organisation.query.order_by(Organisation.name.asc()),
-        "locations": Location.query.all(),
-        "professions": Profession.query.all(),
-        "role_changes": Promotion.query.all(),
+        "organisations": sorted(
+            reference_data.all(Organisation), key=lambda org: org.name or ""
+        ),
+        "locations": reference_data.all(Location),
+        "professions": reference_data.all(Profession),
+        "role_changes": reference_data.all(Promotion),
     }
     return render_template(
         "updates/role.html",
@@ -152,8 +163,13 @@ def new_email_address():
 @get_candidate
 def update_email():
     if request.method == "POST":
+        new_address = request.form.get("email-address")
+        owner = CandidateEmail.candidate(new_address)
+        if owner is not None and owner.id != session.get("candidate-id"):
+            session["error"] = "That email address belongs to another candidate"
+            return redirect(url_for("update_bp.update_email"))
         update_data = session["update-data"]
-        update_data["new-email"]["new-address"] = request.form.get("email-address")
+        update_data["new-email"]["new-address"] = new_address
         session["update-data"] = update_data
         return redirect(url_for("update_bp.check_your_answers"))
     candidate = Candidate.query.get(session.get("candidate-id"))
@@ -166,6 +182,7 @@ def update_email():
         "updates/update-email-address.html",
         candidate=candidate,
         current_email=current_email,
+        error=session.pop("error", None),
     )
 
 
@@ -188,11 +205,15 @@ def check_your_answers():
         data.pop("start-date-year")
         role_id = data.pop("role-change")
         data = {prettify_string(key): value for key, value in data.items()}
-        data["New grade"] = Grade.query.get(data["New grade"]).value
-        data["New location"] = Location.query.get(data["New location"]).value
-        data["New org"] = Organisation.query.get(data["New org"]).name
-        data["New profession"] = Profession.query.get(data["New profession"]).value
-        data["Role change type"] = Promotion.query.get(role_id).value
+        data["New grade"] = reference_data.by_id(Grade, data["New grade"]).value
+        data["New location"] = reference_data.by_id(
+            Location, data["New location"]
+        ).value
+        data["New org"] = reference_data.by_id(Organisation, data["New org"]).name
+        data["New profession"] = reference_data.by_id(
+            Profession, data["New profession"]
+        ).value
+        data["Role change type"] = reference_data.by_id(Promotion, role_id).value
 
         return data
 
@@ -264,6 +285,7 @@ def post_your_answers():
 
     db.session.add(candidate)
     db.session.commit()
+    report_cache.bump_data_version()
 
 
 @update_bp.route("/complete", methods=["GET"])
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -9,9 +10,35 @@ class Config(object):
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     ADMINS = ["your-email@example.com"]
     LANGUAGES = ["en", "es"]
+    REPORT_CACHE_REDIS_URL = os.environ.get("REPORT_CACHE_REDIS_URL")
+    REPORT_CACHE_TYPE = os.environ.get(
+        "REPORT_CACHE_TYPE", "redis" if REPORT_CACHE_REDIS_URL else "filesystem"
+    )
+    REPORT_CACHE_DIR = os.environ.get(
+        "REPORT_CACHE_DIR",
+        os.path.join(tempfile.gettempdir(), "talent-tracker-report-cache"),
+    )
+    REPORT_JOB_BROKER = os.environ.get("REPORT_JOB_BROKER", "sqlite")
+    REPORT_JOB_DATABASE = os.environ.get(
+        "REPORT_JOB_DATABASE",
+        os.path.join(tempfile.gettempdir(), "talent-tracker-report-jobs.sqlite"),
+    )
+    REPORT_JOB_DIR = os.environ.get("REPORT_JOB_DIR")
+    REPORT_JOB_WORKERS = int(os.environ.get("REPORT_JOB_WORKERS", 2))
+    REPORT_JOB_EXPIRY = int(os.environ.get("REPORT_JOB_EXPIRY", 86400))
+    QUERY_STATS_HEADERS = os.environ.get("QUERY_STATS_HEADERS") == "true"
+    QUERY_STATS_SLOWEST = int(os.environ.get("QUERY_STATS_SLOWEST", 3))
+    QUERY_STATS_LOG_LEVEL = os.environ.get("QUERY_STATS_LOG_LEVEL", "INFO")
+    CANDIDATE_SEARCH_PREBUILD = os.environ.get("CANDIDATE_SEARCH_PREBUILD") == "true"
+    CANDIDATE_SEARCH_MAX_AGE = int(os.environ.get("CANDIDATE_SEARCH_MAX_AGE", 3600))
+    CANDIDATE_SEARCH_MAX_POSTINGS = int(
+        os.environ.get("CANDIDATE_SEARCH_MAX_POSTINGS", 10_000_000)
+    )
 
 
 class TestConfig(Config):
     SECRET_KEY = "secret-testing-key"
     TESTING = True
     SQLALCHEMY_DATABASE_URI = "sqlite:///testing-database"
+    REPORT_CACHE_TYPE = "simple"
+    REPORT_JOB_BROKER = "memory"
@@ -1,5 +1,6 @@
 import pytest
 import os
+import pandas as pd
 from datetime import date
 from app import create_app
 from app.models import db as _db
@@ -8,6 +9,11 @@ from app.models import *
 from modules.seed import clear_old_data, commit_data, SeedData
 from flask import session
 from modules.upload import Upload
+from app.reference_data import reference_data
+from app.report_cache import report_cache
+from app.candidate_search import candidate_search
+from sqlalchemy import event
+from contextlib import contextmanager
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -53,11 +59,57 @@ def blank_session(db):
     yield session_
 
     transaction.rollback()
+    reference_data.invalidate()
+    report_cache.clear()
+    candidate_search.clear()
     connection.close()
     session_.remove()
     print("Rolled back blank session")
 
 
+@contextmanager
+def _collect_statements(engine):
+    statements = []
+
+    def _collect_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _collect_statement)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", _collect_statement)
+
+
+@pytest.fixture
+def query_counter(db):
+    """
+    Collects every SQL statement sent to the database while the test runs. Clear the list to start counting afresh
+    """
+    with _collect_statements(db.engine) as statements:
+        yield statements
+
+
+@pytest.fixture
+def query_budget(db):
+    """
+    Fails the test if a block sends more SQL statements to the database than it's budgeted for, like
+    `with query_budget(2): report.get_data()`. Use it around code that should run a fixed number of queries however
+    much data there is, so that a query per row shows up as a failure
+    """
+
+    @contextmanager
+    def _budget(limit: int):
+        with _collect_statements(db.engine) as statements:
+            yield statements
+        assert len(statements) <= limit, (
+            f"{len(statements)} queries were run, over the budget of {limit}:\n"
+            + "\n".join(statements)
+        )
+
+    return _budget
+
+
 @pytest.fixture(scope="function", autouse=False)
 def test_session(blank_session):
     print("Setting up test session")
@@ -366,6 +418,25 @@ def seed_data(test_client, test_session):
         test_session.rollback()
 
 
+@pytest.fixture
+def committed_seed_data(db, blank_session):
+    """
+    Seed data that is committed to the testing database, rather than kept in the test's transaction, so that other
+    processes can read it. Every table is emptied again afterwards
+    """
+    db.session = db.create_scoped_session()
+    commit_data(
+        os.path.join(str(os.getcwd()), "tests/data/test-database-content.xlsx"),
+        seed=0,
+    )
+    yield
+    db.session.remove()
+    db.session = blank_session
+    with db.engine.begin() as connection:
+        for table in reversed(db.metadata.sorted_tables):
+            connection.execute(table.delete())
+
+
 @pytest.fixture
 def class_seed_data():
     filepath = os.path.join(str(os.getcwd()), "tests/data/test-database-content.xlsx")
@@ -377,12 +448,16 @@ def test_upload_object(test_session):
     print("Setting up upload object")
 
     def _upload_object(
-        intake_file_path, application_file_path, redacted=True, scheme: str = "FLS"
+        intake_file_path,
+        application_file_path,
+        redacted=True,
+        scheme: str = "FLS",
+        upload_class=Upload,
     ):
         directory = os.path.dirname(__file__)
         intake_file_path = os.path.join(directory, intake_file_path)
         application_file_path = os.path.join(directory, application_file_path)
-        return Upload(
+        return upload_class(
             intake_file_path,
             scheme,
             "2020-03-01",
@@ -393,3 +468,30 @@ def test_upload_object(test_session):
     yield _upload_object
     test_session.rollback()
     print("Finished with upload object")
+
+
+@pytest.fixture
+def multiple_row_upload_files(tmp_path):
+    """
+    Writes copies of the 2019 test intake and application files with `rows` candidates in, each with their own
+    username and email address, and returns their paths. Files with different numbers of rows don't share candidates
+    """
+
+    def _upload_files(rows: int):
+        intake = pd.read_csv("tests/data/2019/test_csv.csv")
+        applications = pd.read_csv("tests/data/2019/test_application_csv.csv")
+        intake = pd.concat([intake] * rows, ignore_index=True)
+        applications = pd.concat([applications] * rows, ignore_index=True)
+        usernames = [f"PU{rows}-{i}" for i in range(rows)]
+        emails = [f"candidate.{rows}.{i}@gov.uk" for i in range(rows)]
+        intake["Psych. Username"] = applications["PerID"] = usernames
+        intake["Email Address"] = applications["Email Address"] = emails
+        paths = (
+            str(tmp_path / f"intake-{rows}.csv"),
+            str(tmp_path / f"applications-{rows}.csv"),
+        )
+        intake.to_csv(paths[0], index=False)
+        applications.to_csv(paths[1], index=False)
+        return paths
+
+    return _upload_files
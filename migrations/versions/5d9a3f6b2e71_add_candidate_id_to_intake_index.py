@@ -0,0 +1,41 @@
+"""Add candidate_id to the intake index on application
+
+Revision ID: 5d9a3f6b2e71
+Revises: 7b2e8d41c6a9
+Create Date: 2026-10-18 21:04:17.642091
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5d9a3f6b2e71"
+down_revision = "7b2e8d41c6a9"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_index(
+        "ix_application_scheme_id_scheme_start_date", table_name="application"
+    )
+    op.create_index(
+        "ix_application_scheme_id_scheme_start_date_candidate_id",
+        "application",
+        ["scheme_id", "scheme_start_date", "candidate_id"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "ix_application_scheme_id_scheme_start_date_candidate_id",
+        table_name="application",
+    )
+    op.create_index(
+        "ix_application_scheme_id_scheme_start_date",
+        "application",
+        ["scheme_id", "scheme_start_date"],
+        unique=False,
+    )
@@ -1,14 +1,30 @@
 import random
-from string import ascii_lowercase
 from typing import Dict, Tuple
 from app.models import *
+from app.reference_data import reference_data
+from app.report_cache import report_cache
+from app.candidate_search import candidate_search
+from modules.synthetic import SyntheticData
 from datetime import date
 import os
 import pandas as pd
 
+DEFAULT_SEED_DATA = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "tests",
+    "data",
+    "test-database-content.xlsx",
+)
 
-def random_string(length: int) -> str:
-    return "".join([random.choice(ascii_lowercase) for i in range(length)])
+
+def _faststream_grade_id() -> int:
+    return next(
+        row.id for row in reference_data.all(Grade) if "Faststream" in row.value
+    )
+
+
+def _grade_id(rank: int) -> int:
+    return next(row.id for row in reference_data.all(Grade) if row.rank == rank)
 
 
 def generate_known_candidate():
@@ -19,65 +35,29 @@ def generate_known_candidate():
         first_name="Test",
         last_name="Candidate",
         completed_fast_stream=True,
-        joining_grade=Grade.query.filter(Grade.value.like("%Faststream%")).first(),
-        age_range=AgeRange.query.filter_by(value="25-29").first(),
-        ethnicity=Ethnicity.query.filter_by(value="Arab").first(),
-        working_pattern=WorkingPattern.query.filter_by(value="Full time").first(),
-        belief=Belief.query.filter_by(value="No Religion").first(),
-        gender=Gender.query.filter_by(value="Prefer not to say").first(),
-        sexuality=Sexuality.query.filter_by(value="Bisexual").first(),
+        joining_grade_id=_faststream_grade_id(),
+        age_range_id=reference_data.id_for(AgeRange, "25-29"),
+        ethnicity_id=reference_data.id_for(Ethnicity, "Arab"),
+        working_pattern_id=reference_data.id_for(WorkingPattern, "Full time"),
+        belief_id=reference_data.id_for(Belief, "No Religion"),
+        gender_id=reference_data.id_for(Gender, "Prefer not to say"),
+        sexuality_id=reference_data.id_for(Sexuality, "Bisexual"),
         applications=[
             Application(
-                scheme_id=Scheme.query.filter_by(name="FLS").first().id,
+                scheme_id=reference_data.id_for(Scheme, "FLS"),
                 scheme_start_date=date(2018, 3, 1),
             )
         ],
     )
     c.new_role(
         start_date=date(2015, 9, 2),
-        new_org_id=Organisation.query.filter(Organisation.name == "Cabinet Office")
-        .first()
-        .id,
-        new_profession_id=Profession.query.filter_by(value="Digital, data & technology")
-        .first()
-        .id,
-        new_location_id=Location.query.filter_by(value="London").first().id,
-        new_grade_id=Grade.query.filter(Grade.value.like("%Faststream%")).first().id,
-        new_title="Known role",
-        role_change_id=2,
-    )
-    return c
-
-
-def generate_random_candidate():
-    c = Candidate(
-        email_address=f"{random_string(16)}@gov.uk",
-        first_name=f"{random_string(8)}",
-        last_name=f"{random_string(12)}",
-        joining_date=date(
-            random.randrange(1960, 2018),
-            random.randrange(1, 12),
-            random.randrange(1, 28),
+        new_org_id=reference_data.id_for(Organisation, "Cabinet Office"),
+        new_profession_id=reference_data.id_for(
+            Profession, "Digital, data & technology"
         ),
-        completed_fast_stream=random.choice([True, False]),
-        joining_grade=(Grade.query.filter_by(rank=6).first()),
-        ethnicity=random.choice(Ethnicity.query.all()),
-        age_range=random.choice(AgeRange.query.all()),
-        gender_id=random.choice(Gender.query.all()).id,
-        long_term_health_condition=random.choice([True, False, False]),
-        caring_responsibility=random.choice([True, False, False]),
-        belief=random.choice(Belief.query.all()),
-        sexuality=random.choice(Sexuality.query.all()),
-        working_pattern=random.choice(WorkingPattern.query.all()),
-        main_job_type=MainJobType.query.first(),
-    )
-    c.new_role(
-        start_date=date(2015, 9, 2),
-        new_org_id=random.choice(Organisation.query.all()).id,
-        new_profession_id=random.choice(Profession.query.all()).id,
-        new_location_id=random.choice(Location.query.all()).id,
-        new_grade_id=Grade.query.filter(Grade.value.like("%Faststream%")).first().id,
-        new_title=f"Random role {random_string(10)}",
+        new_location_id=reference_data.id_for(Location, "London"),
+        new_grade_id=_faststream_grade_id(),
+        new_title="Known role",
         role_change_id=2,
     )
     return c
@@ -92,7 +72,7 @@ def apply_candidate_to_scheme(
 ):
     candidate.applications.append(
         Application(
-            scheme_id=Scheme.query.filter_by(name=scheme_name).first().id,
+            scheme_id=reference_data.id_for(Scheme, scheme_name),
             successful=True,
             meta=meta,
             delta=delta,
@@ -107,36 +87,25 @@ def promote_candidate(candidate: Candidate, role_change_type=None):
         role_change_type = random.choice(["substantive", "temporary", "level transfer"])
     candidate.new_role(
         start_date=date(2018, 1, 1),
-        new_org_id=Organisation.query.filter_by(name="Cabinet Office").first().id,
+        new_org_id=reference_data.id_for(Organisation, "Cabinet Office"),
         new_profession_id=1,
-        new_location_id=Location.query.filter_by(value="London").first().id,
-        new_grade_id=Grade.query.filter_by(rank=5).first().id,
+        new_location_id=reference_data.id_for(Location, "London"),
+        new_grade_id=_grade_id(5),
         new_title="First role",
-        role_change_id=Promotion.query.filter(Promotion.value == "substantive")
-        .first()
-        .id,
+        role_change_id=reference_data.id_for(Promotion, "substantive"),
     )
     candidate.new_role(
         start_date=date(2019, 6, 1),
-        new_org_id=Organisation.query.filter_by(name="Cabinet Office").first().id,
+        new_org_id=reference_data.id_for(Organisation, "Cabinet Office"),
         new_profession_id=1,
-        new_location_id=Location.query.filter_by(value="London").first().id,
-        new_grade_id=Grade.query.filter_by(rank=4).first().id,
+        new_location_id=reference_data.id_for(Location, "London"),
+        new_grade_id=_grade_id(4),
         new_title="Second role",
-        role_change_id=Promotion.query.filter(Promotion.value == f"{role_change_type}")
-        .first()
-        .id,
+        role_change_id=reference_data.id_for(Promotion, role_change_type),
     )
     return candidate
 
 
-def random_candidates(scheme: str, number: int):
-    return [
-        apply_candidate_to_scheme(scheme, generate_random_candidate())
-        for i in range(number)
-    ]
-
-
 class SeedData:
     def __init__(self, path_to_spreadsheet: str):
         self.dict_of_dataframes: Dict[str, pd.DataFrame] = pd.read_excel(
@@ -188,39 +157,41 @@ class SeedData:
         return r
 
 
-def commit_data(seed_data_filepath: str):
+def commit_data(
+    seed_data_filepath: str = DEFAULT_SEED_DATA,
+    candidates_per_scheme: int = 100,
+    seed: int = None,
+):
+    """
+    Fill an empty database with reference data, a known candidate and randomly generated candidates on the 2018 FLS
+    and SLS intakes, about half of whom are promoted. The random candidates are generated and inserted in bulk by
+    SyntheticData, so large staging datasets take seconds rather than hours
+    :param seed_data_filepath: the spreadsheet of reference data
+    :param candidates_per_scheme: how many random candidates to put on each scheme
+    :param seed: the seed for the random candidates, which are different every time if it isn't given
+    """
     SeedData(seed_data_filepath).seed_data()
-    known_candidate = generate_known_candidate()
-    db.session.add(known_candidate)
-
-    random_promoted_fls_candidates = [
-        promote_candidate(candidate) if i % 2 == 0 else candidate
-        for i, candidate in enumerate(random_candidates("FLS", 100))
-    ]
-    random_promoted_sls_candidates = [
-        promote_candidate(candidate) if i % 2 == 0 else candidate
-        for i, candidate in enumerate(random_candidates("SLS", 100))
-    ]
-    candidates = random_promoted_sls_candidates + random_promoted_fls_candidates
-    ethnic_minority_background = Ethnicity.query.filter(Ethnicity.bame.is_(True)).all()
-
-    for candidate in candidates:
-        coin_flip = random.choice([True, False])
-        if candidate.ethnicity in ethnic_minority_background:
-            candidate.applications[0].meta = coin_flip
-        if candidate.long_term_health_condition:
-            candidate.applications[0].delta = coin_flip
+    db.session.add(generate_known_candidate())
     if os.environ.get("ENV") == "dev":
         u = User(email="developer@talent-tracker.gov.uk")
         u.set_password("talent-tracker")
         db.session.add(u)
+    db.session.flush()
 
-    db.session.add_all(candidates)
+    SyntheticData(
+        candidates_per_scheme * 2,
+        seed=seed,
+        intakes=[("FLS", 2018), ("SLS", 2018)],
+    ).insert()
     db.session.commit()
+    report_cache.bump_data_version()
+    candidate_search.invalidate()
 
 
 def clear_old_data():
     tables = [
+        PromotionOutcome,
+        CandidateEmail,
         Application,
         Role,
         Candidate,
@@ -246,3 +217,5 @@ def clear_old_data():
     if os.environ.get("ENV") == "dev":
         User.query.delete()
         db.session.commit()
+    report_cache.bump_data_version()
+    candidate_search.invalidate()
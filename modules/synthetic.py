@@ -0,0 +1,331 @@
+import csv
+import io
+from collections import namedtuple
+from datetime import date
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.engine import Connection
+
+from app.models import (
+    AgeRange,
+    Application,
+    Belief,
+    Candidate,
+    CandidateEmail,
+    Ethnicity,
+    Gender,
+    Grade,
+    Location,
+    MainJobType,
+    Organisation,
+    Profession,
+    Promotion,
+    PromotionOutcome,
+    Role,
+    RoleChangeEvent,
+    Scheme,
+    Sexuality,
+    WorkingPattern,
+    db,
+)
+from app.reference_data import reference_data
+
+_Application = namedtuple("_Application", ["id", "candidate_id", "scheme_start_date"])
+
+
+class SyntheticData:
+    """
+    Generates a reproducible population of candidates, each with an application to one of `intakes`, a joining role
+    and, for a share of them, two promotions like the ones `modules.seed.promote_candidate` gives. The same seed always
+    gives the same data.
+
+    Every column is drawn as an array for a whole batch of candidates at once and written with one executemany insert
+    per table, so a million candidates take minutes rather than hours. Reference data, like the tables
+    `SeedData.seed_data` fills, must already be in the database. Ids are assigned here rather than by the database, so
+    nothing else should write candidates while the data is being inserted.
+    """
+
+    def __init__(
+        self,
+        candidates: int,
+        seed: int = 0,
+        intakes: Sequence[Tuple[str, int]] = (
+            ("FLS", 2018),
+            ("FLS", 2019),
+            ("SLS", 2018),
+            ("SLS", 2019),
+        ),
+        promoted_share: float = 0.5,
+        batch_size: int = 10000,
+    ):
+        """
+        :param candidates: how many candidates to generate
+        :param seed: the seed for the random number generator
+        :param intakes: (scheme, year) pairs, which candidates are shared between in turn
+        :param promoted_share: roughly what share of candidates are promoted
+        :param batch_size: how many candidates to generate and insert at a time
+        """
+        self.candidates = candidates
+        self.seed = seed
+        self.intakes = list(intakes)
+        self.promoted_share = promoted_share
+        self.batch_size = batch_size
+
+    def insert(self, connection: Connection = None) -> List[int]:
+        """
+        Generate the data and write it to the database
+        :param connection: the connection to insert through, by default the session's
+        :return: the ids of the candidates inserted
+        """
+        connection = connection or db.session.connection()
+        rng = np.random.default_rng(self.seed)
+        next_ids = {
+            model: (connection.execute(select([func.max(model.id)])).scalar() or 0) + 1
+            for model in (Candidate, Application, Role)
+        }
+        candidate_ids = []
+        for start in range(0, self.candidates, self.batch_size):
+            size = min(self.batch_size, self.candidates - start)
+            tables = self.batch(rng, size, next_ids)
+            for model in (
+                Candidate,
+                CandidateEmail,
+                Application,
+                Role,
+                RoleChangeEvent,
+            ):
+                self._insert(connection, model, tables[model])
+            connection.execute(
+                Candidate.__table__.update()
+                .where(Candidate.id == bindparam("candidate_id"))
+                .values(current_role_id=bindparam("role_id")),
+                tables["current_roles"],
+            )
+            self._insert(connection, PromotionOutcome, tables[PromotionOutcome])
+            candidate_ids.extend(row["id"] for row in tables[Candidate])
+        self._advance_sequences(connection)
+        return candidate_ids
+
+    def batch(
+        self, rng: np.random.Generator, size: int, next_ids: Dict
+    ) -> Dict[object, List[Dict]]:
+        """
+        The rows for `size` candidates, keyed by model. `next_ids` holds the next free id of each table, and is moved on
+        past the ids used
+        """
+        candidate_ids = np.arange(next_ids[Candidate], next_ids[Candidate] + size)
+        application_ids = np.arange(next_ids[Application], next_ids[Application] + size)
+        next_ids[Candidate] += size
+        next_ids[Application] += size
+
+        ethnicities = reference_data.all(Ethnicity)
+        ethnicity_ids = self._choose(rng, [row.id for row in ethnicities], size)
+        bame = np.isin(ethnicity_ids, [row.id for row in ethnicities if row.bame])
+        disabled = rng.random(size) < 1 / 3
+        joining_dates = [
+            date(int(year), int(month), int(day))
+            for year, month, day in zip(
+                rng.integers(1990, 2018, size),
+                rng.integers(1, 13, size),
+                rng.integers(1, 29, size),
+            )
+        ]
+        candidates = self._rows(
+            id=candidate_ids,
+            email_address=[f"candidate{id}@synthetic.gov.uk" for id in candidate_ids],
+            first_name=["Synthetic"] * size,
+            last_name=[f"Candidate {id}" for id in candidate_ids],
+            joining_date=joining_dates,
+            completed_fast_stream=rng.random(size) < 0.5,
+            joining_grade_id=self._choose(rng, self._ids(Grade), size),
+            ethnicity_id=ethnicity_ids,
+            age_range_id=self._choose(rng, self._ids(AgeRange), size),
+            gender_id=self._choose(rng, self._ids(Gender), size),
+            long_term_health_condition=disabled,
+            caring_responsibility=rng.random(size) < 1 / 3,
+            belief_id=self._choose(rng, self._ids(Belief), size),
+            sexuality_id=self._choose(rng, self._ids(Sexuality), size),
+            working_pattern_id=self._choose(rng, self._ids(WorkingPattern), size),
+            main_job_type_id=self._choose(rng, self._ids(MainJobType), size),
+        )
+
+        intakes = [
+            (reference_data.get(Scheme, scheme).id, date(year, 3, 1))
+            for scheme, year in self.intakes
+        ]
+        on_offer = rng.random(size) < 0.5
+        applications = self._rows(
+            id=application_ids,
+            candidate_id=candidate_ids,
+            scheme_id=[intakes[(id - 1) % len(intakes)][0] for id in candidate_ids],
+            scheme_start_date=[
+                intakes[(id - 1) % len(intakes)][1] for id in candidate_ids
+            ],
+            successful=[True] * size,
+            meta=bame & on_offer,
+            delta=disabled & on_offer,
+            withdrawn=[False] * size,
+        )
+
+        promotions = {
+            value: reference_data.id_for(Promotion, value)
+            for value in ["substantive", "temporary", "level transfer"]
+        }
+        promoted = rng.random(size) < self.promoted_share
+        second_promotions = rng.choice(list(promotions), size).tolist()
+        organisation_ids = self._choose(rng, self._ids(Organisation), size)
+        profession_ids = self._choose(rng, self._ids(Profession), size)
+        location_ids = self._choose(rng, self._ids(Location), size)
+        grades = {row.rank: row.id for row in reference_data.all(Grade)}
+
+        roles, role_changes, current_roles, outcomes = [], [], [], []
+        for i, candidate in enumerate(candidates):
+            role_id = next_ids[Role]
+            roles.append(
+                dict(
+                    id=role_id,
+                    candidate_id=candidate["id"],
+                    grade_id=candidate["joining_grade_id"],
+                    organisation_id=organisation_ids[i],
+                    profession_id=profession_ids[i],
+                    location_id=location_ids[i],
+                    role_name="Joining role",
+                )
+            )
+            role_changes.append(
+                dict(
+                    candidate_id=candidate["id"],
+                    new_role_id=role_id,
+                    role_change_id=promotions["substantive"],
+                    role_change_date=candidate["joining_date"],
+                )
+            )
+            candidate_promotions = []
+            if promoted[i]:
+                for offset, (role_date, promotion, rank) in enumerate(
+                    [
+                        (date(2018, 1, 1), "substantive", 5),
+                        (date(2019, 6, 1), second_promotions[i], 4),
+                    ],
+                    start=1,
+                ):
+                    roles.append(
+                        dict(
+                            id=role_id + offset,
+                            candidate_id=candidate["id"],
+                            grade_id=grades.get(rank),
+                            organisation_id=organisation_ids[i],
+                            profession_id=profession_ids[i],
+                            location_id=location_ids[i],
+                            role_name=f"Promoted role {offset}",
+                        )
+                    )
+                    role_changes.append(
+                        dict(
+                            candidate_id=candidate["id"],
+                            former_role_id=role_id + offset - 1,
+                            new_role_id=role_id + offset,
+                            role_change_id=promotions[promotion],
+                            role_change_date=role_date,
+                        )
+                    )
+                    if promotion in ("substantive", "temporary"):
+                        candidate_promotions.append((promotion, role_date))
+            next_ids[Role] = roles[-1]["id"] + 1
+            current_roles.append(
+                dict(candidate_id=candidate["id"], role_id=roles[-1]["id"])
+            )
+            application = applications[i]
+            outcomes.append(
+                PromotionOutcome._outcome(
+                    _Application(
+                        application["id"],
+                        application["candidate_id"],
+                        application["scheme_start_date"],
+                    ),
+                    candidate_promotions,
+                )
+            )
+
+        return {
+            Candidate: candidates,
+            CandidateEmail: [
+                row
+                for candidate in candidates
+                for row in CandidateEmail.rows(
+                    candidate["id"], candidate["email_address"], None
+                )
+            ],
+            Application: applications,
+            Role: roles,
+            RoleChangeEvent: role_changes,
+            PromotionOutcome: outcomes,
+            "current_roles": current_roles,
+        }
+
+    @staticmethod
+    def _insert(connection: Connection, model, rows: List[Dict]):
+        """
+        Write rows to the model's table, with COPY on Postgres and an executemany insert elsewhere. Every row is given
+        the same columns, as an executemany insert takes its columns from the first row
+        """
+        if not rows:
+            return
+        keys = set().union(*rows)
+        columns = [
+            column.name for column in model.__table__.columns if column.name in keys
+        ]
+        rows = [{column: row.get(column) for column in columns} for row in rows]
+        if connection.dialect.name != "postgresql":
+            connection.execute(model.__table__.insert(), rows)
+            return
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(
+                ["\\N" if row[column] is None else row[column] for column in columns]
+            )
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        cursor.copy_expert(
+            f"COPY {model.__tablename__} ({', '.join(columns)}) FROM STDIN "
+            f"WITH (FORMAT csv, NULL '\\N')",
+            buffer,
+        )
+
+    @staticmethod
+    def _ids(model) -> List[int]:
+        return [row.id for row in reference_data.all(model)]
+
+    @staticmethod
+    def _choose(rng: np.random.Generator, ids: List[int], size: int) -> List:
+        if not ids:
+            return [None] * size
+        return rng.choice(ids, size).tolist()
+
+    @staticmethod
+    def _rows(**columns) -> List[Dict]:
+        """
+        Rows as dictionaries, from columns of equal length, with numpy values turned into plain Python ones
+        """
+        columns = {
+            name: values.tolist() if isinstance(values, np.ndarray) else values
+            for name, values in columns.items()
+        }
+        return [dict(zip(columns.keys(), row)) for row in zip(*columns.values())]
+
+    @staticmethod
+    def _advance_sequences(connection: Connection):
+        """
+        Postgres doesn't move a table's id sequence on when ids are given explicitly, so it's moved past them here
+        """
+        if connection.dialect.name != "postgresql":
+            return
+        for model in (Candidate, Application, Role):
+            table = model.__tablename__
+            connection.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"(SELECT coalesce(max(id), 1) FROM {table}))"
+            )
@@ -1,6 +1,10 @@
 from app.models import *
+from app.reference_data import reference_data
+from app.report_cache import report_cache
+from app.candidate_search import candidate_search
 from datetime import datetime, date
-from typing import List
+from collections import defaultdict
+from typing import Dict, List, Tuple
 import pandas as pd
 import random
 import os
@@ -17,16 +21,18 @@ class Upload:
     ):
         self.intake_filepath = os.path.abspath(intake_filepath)
         self.application_filepath = os.path.abspath(application_filepath)
-        self.scheme: Scheme = Scheme.query.filter_by(name=programme).first()
+        self.scheme: Scheme = reference_data.get(Scheme, programme)
         self.scheme_start_date = datetime.strptime(scheme_start_date, "%Y-%m-%d").date()
         self.intake_dataframe = pd.read_csv(self.intake_filepath)
         self.application_dataframe = pd.read_csv(self.application_filepath)
         self.joined_dataframe: pd.DataFrame = self.join_csvs()
+        self.redact_personal_data = redact_personal_data
         self.row_reader = RedactedRow if redact_personal_data else Row
 
     def complete_upload(self):
         self.joined_dataframe.apply(self.process_row, axis=1)
         db.session.commit()
+        report_cache.bump_data_version()
 
     def join_csvs(self):
         df = pd.merge(
@@ -90,25 +96,21 @@ class Row:
             new_org_id=self._process_organisation(
                 self.data.Department_intake, self.data.ALB
             ).id,
-            new_profession_id=Profession.query.filter_by(
-                value=self.data.Profession_intake
-            )
-            .first()
-            .id,
-            new_location_id=Location.query.filter_by(value=self.data.Location_intake)
-            .first()
-            .id,
-            new_grade_id=self._grade_processor(self.data.get("Current Grade")).id,
+            new_profession_id=reference_data.id_for(
+                Profession, self.data.Profession_intake
+            ),
+            new_location_id=reference_data.id_for(Location, self.data.Location_intake),
+            new_grade_id=self._grade_processor(self.data.get("Current Grade")),
             new_title=self._get_title_or_not_provided(),
-            role_change_id=Promotion.query.filter_by(value="substantive").first().id,
+            role_change_id=reference_data.id_for(Promotion, "substantive"),
         )
 
     @staticmethod
-    def _grade_processor(grade: str) -> Grade:
+    def _grade_processor(grade: str) -> int:
         if type(grade) is not str:
-            return Grade.query.filter_by(value="Prefer not to say").first()
+            return reference_data.id_for(Grade, "Prefer not to say")
         else:
-            return Grade.query.filter_by(value=grade).first()
+            return reference_data.id_for(Grade, grade)
 
     @staticmethod
     def _process_organisation(department_field, alb_field) -> Organisation:
@@ -133,9 +135,9 @@ class Row:
             new_org_id=None,
             new_profession_id=None,
             new_location_id=None,
-            new_grade_id=self.candidate.joining_grade.id,
+            new_grade_id=self.candidate.joining_grade_id,
             new_title="Not given",
-            role_change_id=Promotion.query.filter_by(value="substantive").first().id,
+            role_change_id=reference_data.id_for(Promotion, "substantive"),
         )
 
     @staticmethod
@@ -156,18 +158,18 @@ class Row:
             caring_responsibility=self._yes_is_true_no_is_false_translator(
                 self.data.get("Caring Responsibility")
             ),
-            working_pattern=WorkingPattern.query.filter_by(
-                value=self.data.get("Working Pattern")
-            ).first(),
-            joining_grade=Grade.query.filter_by(
-                value=self.data.get("CS Joining Grade")
-            ).first(),
+            working_pattern_id=reference_data.id_for(
+                WorkingPattern, self.data.get("Working Pattern")
+            ),
+            joining_grade_id=reference_data.id_for(
+                Grade, self.data.get("CS Joining Grade")
+            ),
         )
         return c
 
     def _aspiration_processor(self):
         if self.data.get("Aspiration") == "Remain at Grade":
-            return Grade.query.filter_by(value=self.data.get("Current Grade")).first()
+            return reference_data.id_for(Grade, self.data.get("Current Grade"))
         else:
             return Row._grade_processor(self.data.get("Aspiration"))
 
@@ -180,36 +182,37 @@ class Row:
                 meta=self._empty_translator(self.data.get("META", False)),
                 delta=self._empty_translator(self.data.get("DELTA", False)),
                 cohort=self.data.Cohort,
-                aspirational_grade=self._grade_processor(self.data.Aspiration),
+                aspirational_grade_id=self._grade_processor(self.data.Aspiration),
             )
         )
 
     def _collect_personal_data(self):
         self.candidate.first_name = self.data.get("First Name")
         self.candidate.last_name = self.data.get("Last Name_intake")
-        self.candidate.belief = Belief.query.filter_by(
-            value=self.data.get("Religion/Belief")
-        ).first()
-        self.candidate.sexuality = Sexuality.query.filter_by(
-            value=self.data.get("Sexual Orientation_application")
-        ).first()
-        self.candidate.ethnicity = Ethnicity.query.filter_by(
-            value=self.data.Ethnicity_application
-        ).first()
-        self.candidate.main_job_type = MainJobType.query.filter_by(
-            value=self.data.get(
+        self.candidate.belief_id = reference_data.id_for(
+            Belief, self.data.get("Religion/Belief")
+        )
+        self.candidate.sexuality_id = reference_data.id_for(
+            Sexuality, self.data.get("Sexual Orientation_application")
+        )
+        self.candidate.ethnicity_id = reference_data.id_for(
+            Ethnicity, self.data.Ethnicity_application
+        )
+        self.candidate.main_job_type_id = reference_data.id_for(
+            MainJobType,
+            self.data.get(
                 "Describes the sort of work the main/ highest income earner in your household did in their main job?"
-            )
-        ).first()
-        self.candidate.gender = Gender.query.filter_by(
-            value=self.data.Gender_intake
-        ).first()
-        self.long_term_health_condition = self._yes_is_true_no_is_false_translator(
-            self.data.Disabled_intake
+            ),
+        )
+        self.candidate.gender_id = reference_data.id_for(
+            Gender, self.data.Gender_intake
+        )
+        self.candidate.long_term_health_condition = (
+            self._yes_is_true_no_is_false_translator(self.data.Disabled_intake)
+        )
+        self.candidate.age_range_id = reference_data.id_for(
+            AgeRange, self.data.get("Age Group")
         )
-        self.candidate.age_range = AgeRange.query.filter_by(
-            value=self.data.get("Age Group")
-        ).first()
 
     def _add_email_address(self):
         addresses = self._separate_email_addresses(
@@ -232,13 +235,303 @@ class RedactedRow(Row):
     def _collect_personal_data(self):
         self.candidate.first_name = "[REDACTED - FIRST NAME]"
         self.candidate.last_name = "[REDACTED - LAST NAME]"
-        self.candidate.belief = random.choice(Belief.query.all())
-        self.candidate.sexuality = random.choice(Sexuality.query.all())
-        self.candidate.ethnicity = random.choice(Ethnicity.query.all())
-        self.candidate.main_job_type = random.choice(MainJobType.query.all())
-        self.candidate.gender = random.choice(Gender.query.all())
+        self.candidate.belief_id = random.choice(reference_data.all(Belief)).id
+        self.candidate.sexuality_id = random.choice(reference_data.all(Sexuality)).id
+        self.candidate.ethnicity_id = random.choice(reference_data.all(Ethnicity)).id
+        self.candidate.main_job_type_id = random.choice(
+            reference_data.all(MainJobType)
+        ).id
+        self.candidate.gender_id = random.choice(reference_data.all(Gender)).id
         self.candidate.long_term_health_condition = random.randint(0, 1)
-        self.candidate.age_range = random.choice(AgeRange.query.all())
+        self.candidate.age_range_id = random.choice(reference_data.all(AgeRange)).id
 
     def _add_email_address(self):
         self.candidate.email_address = f"{self.data.PerID}@gov.uk"
+
+
+class BulkUpload(Upload):
+    """
+    Imports an intake in a fixed number of round trips to the database, however many rows it has. Lookup columns are
+    resolved by mapping them against reference tables that are loaded once, and candidates, applications, roles and
+    role changes are written with bulk inserts rather than built up one ORM object at a time. The data saved is the
+    same as `Upload` would save
+    """
+
+    def complete_upload(self):
+        data = self.joined_dataframe
+        if data.empty:
+            return
+        substantive_id = self._reference_ids(Promotion).get("substantive")
+
+        # ids are read back in one query after each insert, as asking the bulk inserts to return them makes them insert
+        # a row at a time. For the same reason, every mapping of a table has the same keys
+        candidates = self._candidate_mappings(data)
+        self._insert(Candidate, candidates)
+        candidate_ids = self._inserted_candidate_ids(candidates)
+
+        self._insert(Application, self._application_mappings(data, candidate_ids))
+
+        most_recent_roles = self._most_recent_role_mappings(data, candidate_ids)
+        first_roles = [
+            dict(
+                candidate_id=candidate_id,
+                organisation_id=None,
+                profession_id=None,
+                location_id=None,
+                grade_id=candidate["joining_grade_id"],
+                role_name="Not given",
+            )
+            for candidate_id, candidate in zip(candidate_ids, candidates)
+        ]
+        self._insert(Role, most_recent_roles + first_roles)
+        role_ids = self._inserted_role_ids(candidate_ids)
+
+        most_recent_role_start = date(self.scheme_start_date.year - 1, 1, 1)
+        role_changes = []
+        for candidate_id, candidate in zip(candidate_ids, candidates):
+            most_recent_role_id, first_role_id = role_ids[candidate_id]
+            role_changes.append(
+                dict(
+                    candidate_id=candidate_id,
+                    former_role_id=None,
+                    new_role_id=most_recent_role_id,
+                    role_change_id=substantive_id,
+                    role_change_date=most_recent_role_start,
+                )
+            )
+            role_changes.append(
+                dict(
+                    candidate_id=candidate_id,
+                    former_role_id=most_recent_role_id,
+                    new_role_id=first_role_id,
+                    role_change_id=substantive_id,
+                    role_change_date=candidate["joining_date"],
+                )
+            )
+        self._insert(RoleChangeEvent, role_changes)
+        db.session.bulk_update_mappings(
+            Candidate,
+            [
+                dict(id=candidate_id, current_role_id=role_ids[candidate_id][0])
+                for candidate_id in candidate_ids
+            ],
+        )
+        # bulk inserts skip the session's flush events, so their promotion outcomes and email addresses are built here
+        PromotionOutcome.refresh(db.session.connection(), candidate_ids)
+        CandidateEmail.refresh(db.session.connection(), candidate_ids)
+        db.session.commit()
+        report_cache.bump_data_version()
+        candidate_search.invalidate()
+
+    @staticmethod
+    def _insert(model: db.Model, mappings: List[Dict]):
+        """
+        Writes rows with a single executemany insert. Rows are only inserted together when they give values for the
+        same columns, so None is written as NULL rather than leaving the column out, after filling in the columns'
+        defaults where the ORM would have used them
+        """
+        defaults = {
+            column.key: column.default.arg
+            for column in model.__table__.columns
+            if column.default is not None and column.default.is_scalar
+        }
+        db.session.bulk_insert_mappings(
+            model,
+            [
+                {
+                    key: defaults.get(key) if value is None else value
+                    for key, value in mapping.items()
+                }
+                for mapping in mappings
+            ],
+            render_nulls=True,
+        )
+
+    @staticmethod
+    def _inserted_candidate_ids(candidates: List[Dict]) -> List[int]:
+        """
+        The ids of newly inserted candidates, in the same order, found by their email addresses
+        """
+        emails = [candidate["email_address"] for candidate in candidates]
+        ids = dict(
+            db.session.query(Candidate.email_address, Candidate.id).filter(
+                Candidate.email_address.in_(emails)
+            )
+        )
+        return [ids[email] for email in emails]
+
+    @staticmethod
+    def _inserted_role_ids(candidate_ids: List[int]) -> Dict[int, Tuple[int, int]]:
+        """
+        The ids of each new candidate's most recent and first roles. The most recent roles are inserted first, so
+        they're the lower of each candidate's two ids
+        """
+        role_ids = defaultdict(list)
+        for role_id, candidate_id in (
+            db.session.query(Role.id, Role.candidate_id)
+            .filter(Role.candidate_id.in_(candidate_ids))
+            .order_by(Role.id)
+        ):
+            role_ids[candidate_id].append(role_id)
+        return {candidate_id: tuple(ids) for candidate_id, ids in role_ids.items()}
+
+    @staticmethod
+    def _reference_ids(model: db.Model) -> Dict[str, int]:
+        return reference_data.ids(model)
+
+    @staticmethod
+    def _values(series: pd.Series) -> List:
+        """
+        Plain Python values from a column, with missing values as None, ready to be written to the database
+        """
+        return [None if pd.isnull(value) else value for value in series]
+
+    @staticmethod
+    def _ids(series: pd.Series) -> List:
+        return [None if pd.isnull(value) else int(value) for value in series]
+
+    def _column(self, data: pd.DataFrame, column: str) -> pd.Series:
+        if column in data:
+            return data[column]
+        return pd.Series([None] * len(data), index=data.index)
+
+    def _lookup(self, data: pd.DataFrame, column: str, model: db.Model) -> List:
+        return self._ids(self._column(data, column).map(self._reference_ids(model)))
+
+    def _random_ids(self, data: pd.DataFrame, model: db.Model) -> List:
+        return random.choices(list(self._reference_ids(model).values()), k=len(data))
+
+    def _grade_ids(self, grades: pd.Series) -> List:
+        """
+        The vectorised form of `Row._grade_processor`
+        """
+        grades = grades.where(
+            grades.map(lambda grade: type(grade) is str), "Prefer not to say"
+        )
+        return self._ids(grades.map(self._reference_ids(Grade)))
+
+    @staticmethod
+    def _yes_is_true(series: pd.Series) -> List[bool]:
+        return list(series == "Yes")
+
+    def _candidate_mappings(self, data: pd.DataFrame) -> List[Dict]:
+        candidates = dict(
+            joining_date=[
+                Row.time_parser(value)
+                for value in self._column(data, "CS Joining Year")
+            ],
+            completed_fast_stream=self._yes_is_true(
+                data["Have you completed  Fast Stream?"]
+            ),
+            caring_responsibility=self._yes_is_true(
+                self._column(data, "Caring Responsibility")
+            ),
+            working_pattern_id=self._lookup(data, "Working Pattern", WorkingPattern),
+            joining_grade_id=self._lookup(data, "CS Joining Grade", Grade),
+        )
+        if self.redact_personal_data:
+            candidates.update(
+                email_address=[f"{per_id}@gov.uk" for per_id in data.PerID],
+                first_name=["[REDACTED - FIRST NAME]"] * len(data),
+                last_name=["[REDACTED - LAST NAME]"] * len(data),
+                belief_id=self._random_ids(data, Belief),
+                sexuality_id=self._random_ids(data, Sexuality),
+                ethnicity_id=self._random_ids(data, Ethnicity),
+                main_job_type_id=self._random_ids(data, MainJobType),
+                gender_id=self._random_ids(data, Gender),
+                long_term_health_condition=[
+                    bool(random.randint(0, 1)) for i in range(len(data))
+                ],
+                age_range_id=self._random_ids(data, AgeRange),
+            )
+        else:
+            addresses = [
+                Row._separate_email_addresses(cell)
+                for cell in data["Email Address_application"]
+            ]
+            candidates.update(
+                email_address=[address[0] for address in addresses],
+                secondary_email_address=[
+                    address[1] if len(address) > 1 else None for address in addresses
+                ],
+                first_name=self._values(self._column(data, "First Name")),
+                last_name=self._values(self._column(data, "Last Name_intake")),
+                belief_id=self._lookup(data, "Religion/Belief", Belief),
+                sexuality_id=self._lookup(
+                    data, "Sexual Orientation_application", Sexuality
+                ),
+                ethnicity_id=self._lookup(data, "Ethnicity_application", Ethnicity),
+                main_job_type_id=self._lookup(
+                    data,
+                    "Describes the sort of work the main/ highest income earner in your household did in their main "
+                    "job?",
+                    MainJobType,
+                ),
+                gender_id=self._lookup(data, "Gender_intake", Gender),
+                long_term_health_condition=self._yes_is_true(data.Disabled_intake),
+                age_range_id=self._lookup(data, "Age Group", AgeRange),
+            )
+        return [dict(zip(candidates.keys(), row)) for row in zip(*candidates.values())]
+
+    def _application_mappings(
+        self, data: pd.DataFrame, candidate_ids: List[int]
+    ) -> List[Dict]:
+        return [
+            dict(
+                candidate_id=candidate_id,
+                scheme_id=self.scheme.id,
+                scheme_start_date=self.scheme_start_date,
+                successful=True,
+                meta=meta,
+                delta=delta,
+                cohort=cohort,
+                aspirational_grade_id=aspirational_grade_id,
+            )
+            for candidate_id, meta, delta, cohort, aspirational_grade_id in zip(
+                candidate_ids,
+                self._yes_is_true(self._column(data, "META")),
+                self._yes_is_true(self._column(data, "DELTA")),
+                self._ids(data.Cohort),
+                self._grade_ids(data.Aspiration),
+            )
+        ]
+
+    def _most_recent_role_mappings(
+        self, data: pd.DataFrame, candidate_ids: List[int]
+    ) -> List[Dict]:
+        if self.redact_personal_data:
+            titles = ["[REDACTED-JOB TITLE]"] * len(data)
+        else:
+            titles = self._values(
+                self._column(data, "Job Title").replace("", "Not provided")
+            )
+        return [
+            dict(
+                candidate_id=candidate_id,
+                organisation_id=organisation_id,
+                profession_id=profession_id,
+                location_id=location_id,
+                grade_id=grade_id,
+                role_name=title,
+            )
+            for candidate_id, organisation_id, profession_id, location_id, grade_id, title in zip(
+                candidate_ids,
+                self._organisation_ids(data),
+                self._lookup(data, "Profession_intake", Profession),
+                self._lookup(data, "Location_intake", Location),
+                self._grade_ids(self._column(data, "Current Grade")),
+                titles,
+            )
+        ]
+
+    def _organisation_ids(self, data: pd.DataFrame) -> List[int]:
+        """
+        Departments and ALBs that aren't in the database yet are created, once for each distinct pair in the intake
+        """
+        pairs = list(zip(data.Department_intake, data.ALB))
+        organisations = {}
+        for pair in set(pairs):
+            organisations[pair] = Row._process_organisation(*pair)
+            db.session.add(organisations[pair])
+            db.session.flush()
+        return [organisations[pair].id for pair in pairs]
@@ -1,16 +1,23 @@
+from typing import Dict, Type
+
 from reporting.base_report import Report
+from reporting.base_promotion_report import PromotionReport
 from reporting.promotion_reports import (
     CharacteristicPromotionReport,
     BooleanCharacteristicPromotionReport,
     DeltaOfferPromotionReport,
     MetaOfferPromotionReport,
 )
+from reporting.detailed_report import DetailedReport
+from reporting.trend_report import PromotionTrendReport
 
 
 class ReportFactory:
     @staticmethod
-    def create_report(report_type: str, **kwargs) -> Report:
-
+    def promotion_reports() -> Dict[str, Type[PromotionReport]]:
+        """
+        The promotion report class for each attribute
+        """
         characteristic_reports = {
             key: CharacteristicPromotionReport
             for key in [
@@ -30,15 +37,45 @@ class ReportFactory:
             "delta": DeltaOfferPromotionReport,
             "meta": MetaOfferPromotionReport,
         }
-        promotion_reports = {
+        return {
             **characteristic_reports,
             **boolean_reports,
             **offer_reports,
         }
-        reports = {"promotions": promotion_reports}
+
+    @staticmethod
+    def create_report(report_type: str, **kwargs) -> Report:
+        reports = {"promotions": ReportFactory.promotion_reports()}
 
         report = reports.get(report_type).get(kwargs.get("attribute"))
         if not report:
             raise NotImplementedError("No such report type exists")
         else:
             return report(**kwargs)
+
+    @staticmethod
+    def from_form(report_type: str, form_data: dict) -> Report:
+        """
+        Create a report from the fields submitted on one of the report forms
+        :param report_type: "detailed", "trends", or the report-type field of the promotion report form
+        :param form_data: the rest of the form's fields
+        """
+        if report_type == "detailed":
+            return DetailedReport(
+                form_data.get("year"),
+                form_data.get("scheme"),
+                form_data.get("promotion-type"),
+            )
+        if report_type == "trends":
+            attribute = form_data.get("attribute")
+            report_class = ReportFactory.promotion_reports().get(attribute)
+            if not report_class:
+                raise NotImplementedError("No such report type exists")
+            return PromotionTrendReport(
+                report_class,
+                form_data.get("scheme"),
+                attribute,
+                form_data.get("first-year"),
+                form_data.get("last-year"),
+            )
+        return ReportFactory.create_report(report_type=report_type, **form_data)
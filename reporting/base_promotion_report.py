@@ -1,11 +1,14 @@
 from abc import ABC
 from datetime import date
-from typing import List
+from typing import Any, Dict, List
 
 from sqlalchemy import and_
+from sqlalchemy.orm import Query
 
-from app.models import Candidate, Application, Scheme
+from app.models import Candidate, Application
 from reporting import Report
+from reporting.intake_snapshot import IntakeSnapshot
+from reporting.promotion_counter import PromotionCount, PromotionOutcomeCounter
 
 
 class PromotionReport(Report, ABC):
@@ -21,9 +24,12 @@ class PromotionReport(Report, ABC):
         self.intake_date = date(
             int(year), 3, 1
         )  # assuming it starts in March every year
-        self.scheme = Scheme.query.filter_by(name=f"{scheme}").first()
-        # we only take credit for promotions that happen after candidates find out they're successful
-        self.promotions_count_from = date(int(year) - 1, 12, 1)
+        self.promotions_count_from = Application.promotions_count_from(self.intake_date)
+        self.promotion_counter = PromotionOutcomeCounter()
+        # an IntakeSnapshot shared with other reports on the same intake, which counts are taken from if it's set
+        self.snapshot = None
+        self._eligible_candidates = None
+        self._candidates_by_id = None
 
         self.headers = [
             "characteristic",
@@ -42,44 +48,106 @@ class PromotionReport(Report, ABC):
         return output
 
     def get_row_metadata(self):
+        """
+        Subclasses return a list of tuples, one per row of the report. Each tuple holds the row's header and the
+        PromotionCount for the candidates in that row
+        """
         raise NotImplementedError
 
-    def row_writer(self, row_header, candidate_list):
+    def row_writer(self, row_header, promotion_count: PromotionCount):
         output = [row_header]
-        output.extend(self.chunk_writer(False, candidate_list))
-        output.extend(self.chunk_writer(True, candidate_list))
-        output.append(len(candidate_list))
+        output.extend(
+            self.chunk_writer(promotion_count.substantive, promotion_count.total)
+        )
+        output.extend(
+            self.chunk_writer(promotion_count.temporary, promotion_count.total)
+        )
+        output.append(promotion_count.total)
         return output
 
-    def chunk_writer(self, temporary, candidates):
-        promoted_number = len(self.promoted_candidates(temporary, candidates))
-        return [promoted_number, self.decimal_or_none(promoted_number, len(candidates))]
+    def chunk_writer(self, promoted_number, total):
+        return [promoted_number, self.decimal_or_none(promoted_number, total)]
 
-    def eligible_candidates(self) -> List[Candidate]:
+    def intake_query(self) -> Query:
         """
-        Candidates eligible to be reported on have an application whose scheme start date is aligned with ```year``` and
-        whose Application -> Scheme -> name is the same as ```scheme```. For example, the 2019 FLS intake all have a
-        scheme_start_date on their applications of 2019/03/01 and a scheme_id that references the 'FLS' scheme.
-        :return:
-        :rtype:
+        A query for the candidates in this report's intake, joined to the Application that puts them in it
         """
-        eligible_applications = Application.query.filter(
+        return Candidate.query.join(
+            Application, Application.candidate_id == Candidate.id
+        ).filter(
             and_(
                 Application.scheme_start_date == self.intake_date,
                 Application.scheme_id == self.scheme.id,
             )
-        ).all()
-        return [application.candidate for application in eligible_applications]
+        )
 
-    def promoted_candidates(self, temporary, candidates: List[Candidate]):
+    def promotion_counts(
+        self, *group_by, population: Query = None
+    ) -> Dict[Any, PromotionCount]:
+        """
+        Promotions in this report's intake, grouped by `group_by`
+        :param population: the intake query to count from, if it needs joining to other tables to group by `group_by`
+        """
+        if self.snapshot is not None:
+            return self.snapshot.count(*group_by)
+        if population is None:
+            population = self.intake_query()
+        return self.promotion_counter.count(population, *group_by)
+
+    def intake_snapshot(self) -> IntakeSnapshot:
+        """
+        The IntakeSnapshot this report counts from, loading one the first time it's needed if none has been shared
+        with the report
+        """
+        if self.snapshot is None:
+            self.snapshot = IntakeSnapshot(self.intake_query())
+        return self.snapshot
+
+    def candidates_in(self, mask) -> List[Candidate]:
+        """
+        The candidates in the rows of the intake snapshot picked out by `mask`
+        """
+        if self._candidates_by_id is None:
+            self._candidates_by_id = {
+                candidate.id: candidate for candidate in self.intake_candidates()
+            }
         return [
-            candidate
-            for candidate in candidates
-            if candidate.promoted_between(
-                self.promotions_count_from, temporary=temporary
-            )
+            self._candidates_by_id[id]
+            for id in self.intake_snapshot().candidate_ids(mask)
         ]
 
+    def eligible_candidates(self) -> List[Candidate]:
+        """
+        Candidates eligible to be reported on have an application whose scheme start date is aligned with ```year``` and
+        whose Application -> Scheme -> name is the same as ```scheme```. For example, the 2019 FLS intake all have a
+        scheme_start_date on their applications of 2019/03/01 and a scheme_id that references the 'FLS' scheme.
+
+        Reports that only cover some of the intake override this.
+        :return: the candidates in this report's intake
+        :rtype: List[Candidate]
+        """
+        return self.intake_candidates()
+
+    def intake_candidates(self) -> List[Candidate]:
+        """
+        The intake is loaded once per report, along with the relationships in `candidate_loader_options`, and the same
+        list is returned on every later call.
+        :return: the candidates in this report's intake
+        :rtype: List[Candidate]
+        """
+        if self._eligible_candidates is None:
+            self._eligible_candidates = (
+                self.intake_query().options(*self.candidate_loader_options()).all()
+            )
+        return self._eligible_candidates
+
+    def candidate_loader_options(self) -> List:
+        """
+        Loader options for the relationships this report reads on each eligible candidate, so they come back with the
+        intake rather than being lazy-loaded one candidate at a time
+        """
+        return []
+
     def write_row(self, row_data, data_object, csv_writer):
         """
         Format the row data in a human-readable form and write it out
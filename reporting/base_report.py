@@ -1,11 +1,14 @@
 import csv
 from abc import ABC, abstractmethod
 from io import StringIO
+from typing import Iterator
 
 from flask import Response, stream_with_context
 from werkzeug.datastructures import Headers
 
 from app.models import Scheme
+from app.query_stats import query_stats
+from app.reference_data import reference_data
 
 
 class Report(ABC):
@@ -15,7 +18,7 @@ class Report(ABC):
     """
 
     def __init__(self, scheme: str):
-        self.scheme: Scheme = Scheme.query.filter_by(name=f"{scheme}").first()
+        self.scheme: Scheme = reference_data.get(Scheme, scheme)
         self.filename = None
         self.headers = []
 
@@ -38,8 +41,18 @@ class Report(ABC):
     def get_data(self):
         raise NotImplementedError
 
+    def generate_rows(self) -> Iterator:
+        """
+        The report's rows, one at a time. Reports that can produce their rows without first holding all of them in
+        memory should override this
+        """
+        return iter(self.get_data())
+
     def generate_report_data(self):
-        output = self.get_data()
+        with query_stats.track(type(self).__name__):
+            yield from self._generate_report_data()
+
+    def _generate_report_data(self):
         data = StringIO()
         w = csv.writer(data)
 
@@ -49,18 +62,20 @@ class Report(ABC):
         data.truncate(0)
 
         # write each item
-        for item in output:
+        for item in self.generate_rows():
             yield self.write_row(item, data, w)
             data.seek(0)
             data.truncate(0)
 
     def return_data(self):
+        return self.response(stream_with_context(self.generate_report_data()))
+
+    def response(self, body) -> Response:
+        """
+        A CSV download of `body`, which is either the whole report or an iterable of chunks of it
+        """
         headers = Headers()
         headers["Content-Disposition"] = f"attachment; filename={self.filename}.csv"
         headers["Content-type"] = "text/csv"
 
-        return Response(
-            stream_with_context(self.generate_report_data()),
-            mimetype="text/csv",
-            headers=headers,
-        )
+        return Response(body, mimetype="text/csv", headers=headers)
@@ -1,7 +1,9 @@
 from reporting.base_report import Report
-from typing import List
-from app.models import Candidate, Application, Promotion, Role
-from sqlalchemy import and_, extract
+from typing import Iterator, List
+from app.models import Candidate, Application, Promotion, Role, RoleChangeEvent
+from app.reference_data import reference_data
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Query, aliased, joinedload
 from datetime import datetime, date
 
 
@@ -10,10 +12,14 @@ class DetailedReport(Report):
     The initial version of the detailed report will take one input year, one scheme, and one role_change_type
     """
 
+    batch_size = 1000
+
     def __init__(self, intake_year: str, scheme: str, role_change_type: int):
         super().__init__(scheme)
         self.intake = int(intake_year)
-        self.role_change_type: Promotion = Promotion.query.get(role_change_type)
+        self.role_change_type: Promotion = reference_data.by_id(
+            Promotion, role_change_type
+        )
         self.filename = (
             f"detailed-report-{self.intake}-{self.role_change_type.value}-{scheme}"
         )
@@ -45,13 +51,12 @@ class DetailedReport(Report):
         ]
 
     def write_row(self, row_data, data_object, csv_writer):
-        print(row_data)
         csv_writer.writerow(row_data)
         return data_object.getvalue()
 
-    def row_writer(self, candidate: Candidate) -> List:
-        application = candidate.most_recent_application()
-        current_role: Role = candidate.current_role()
+    def row_writer(
+        self, candidate: Candidate, application: Application, current_role: Role
+    ) -> List:
         return [
             f"{candidate.first_name} {candidate.last_name}",
             candidate.email_address,
@@ -79,29 +84,96 @@ class DetailedReport(Report):
         ]
 
     def get_data(self):
-        output = []
-        for candidate in self.candidates():
-            output.append(self.row_writer(candidate))
-        return output
+        return list(self.generate_rows())
 
-    def candidates(self):
+    def generate_rows(self) -> Iterator[List]:
         """
-        Iterate through the roles each candidate has held since beginning the programme and identifies if any of them
-        have been 'role_change_type'. If they have, return that candidate
-        :return:
-        :rtype:
+        Rows come from a single query, which is read `batch_size` candidates at a time (through a server-side cursor
+        where the database supports one), so the first rows are ready before the rest of the intake has been read
         """
-        return [
-            candidate
-            for candidate in self.eligible_candidates()
-            if self.role_change_type.id
-            in {
-                rce.role_change_id
-                for rce in candidate.role_change_events_since_date(
-                    date(self.intake, 1, 1)
+        for candidate, application in self.candidates_with_applications():
+            yield self.row_writer(candidate, application, candidate.current_role())
+
+    def candidates_with_applications(self) -> Query:
+        """
+        Eligible candidates who have had a role change of type 'role_change_type' since the start of their intake year,
+        each paired with their most recent application. Every characteristic and the current role the report needs are
+        loaded alongside them
+        """
+        application_order = (
+            select(
+                [
+                    Application.id,
+                    Application.candidate_id,
+                    func.row_number()
+                    .over(
+                        partition_by=Application.candidate_id,
+                        order_by=Application.application_date.desc(),
+                    )
+                    .label("position"),
+                ]
+            ).where(
+                Application.candidate_id.in_(
+                    self.candidates_query().with_entities(Candidate.id)
                 )
-            }
-        ]
+            )
+        ).alias("application_order")
+        most_recent_application = aliased(Application)
+        return (
+            self.candidates_query()
+            .join(
+                application_order,
+                and_(
+                    application_order.c.candidate_id == Candidate.id,
+                    application_order.c.position == 1,
+                ),
+            )
+            .join(
+                most_recent_application,
+                most_recent_application.id == application_order.c.id,
+            )
+            .add_entity(most_recent_application)
+            .options(
+                joinedload(Candidate.ethnicity),
+                joinedload(Candidate.gender),
+                joinedload(Candidate.sexuality),
+                joinedload(Candidate.belief),
+                joinedload(Candidate.age_range),
+                joinedload(Candidate.working_pattern),
+                joinedload(Candidate.main_job_type),
+                joinedload(Candidate.joining_grade),
+                joinedload(Candidate.latest_role).joinedload(Role.grade),
+                joinedload(Candidate.latest_role).joinedload(Role.location),
+                joinedload(Candidate.latest_role).joinedload(Role.organisation),
+            )
+            .order_by(Application.id)
+            .yield_per(self.batch_size)
+        )
+
+    def candidates_query(self) -> Query:
+        changed_role = select([RoleChangeEvent.candidate_id]).where(
+            and_(
+                RoleChangeEvent.role_change_id == self.role_change_type.id,
+                RoleChangeEvent.role_change_date >= date(self.intake, 1, 1),
+            )
+        )
+        return self.intake_query().filter(Candidate.id.in_(changed_role))
+
+    def intake_query(self) -> Query:
+        """
+        Candidates in `intake` and on `scheme`, joined to the Application that puts them there. The year in the
+        application start date is used as shorthand for the intake year, and is compared as a range of dates rather than
+        by extracting the year so that the index on scheme and start date can be used
+        """
+        return Candidate.query.join(
+            Application, Application.candidate_id == Candidate.id
+        ).filter(
+            and_(
+                Application.scheme_id == self.scheme.id,
+                Application.scheme_start_date >= date(self.intake, 1, 1),
+                Application.scheme_start_date < date(self.intake + 1, 1, 1),
+            )
+        )
 
     def eligible_candidates(self) -> List[Candidate]:
         """
@@ -109,12 +181,4 @@ class DetailedReport(Report):
         shorthand for the intake year
         :return: List[Candidate]
         """
-        return [
-            application.candidate
-            for application in Application.query.filter(
-                and_(
-                    extract("year", Application.scheme_start_date) == self.intake,
-                    Application.scheme_id == self.scheme.id,
-                )
-            ).all()
-        ]
+        return self.intake_query().order_by(Application.id).all()
@@ -0,0 +1,136 @@
+from copy import copy
+from datetime import date
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Query
+
+from app.models import Application, Candidate, Ethnicity, PromotionOutcome
+from reporting.promotion_counter import PromotionCount
+
+
+class IntakeSnapshot:
+    """
+    An intake loaded in one query into a pandas DataFrame, `frame`, with a row per candidate and application. It holds
+    every column a promotion report can group an intake by, as compact nullable integer and boolean columns, and
+    whether each candidate was substantively or temporarily promoted. Any number of promotion reports on the same
+    intake can be counted from the snapshot without going back to the database, and candidates can be picked out with
+    vectorised masks like `snapshot.frame["application.meta"]`. Give it to a report through `PromotionReport.snapshot`
+    """
+
+    id_columns = [
+        Candidate.ethnicity_id,
+        Candidate.gender_id,
+        Candidate.sexuality_id,
+        Candidate.belief_id,
+        Candidate.working_pattern_id,
+        Candidate.age_range_id,
+    ]
+    flag_columns = [
+        Candidate.long_term_health_condition,
+        Candidate.caring_responsibility,
+        Application.meta,
+        Application.delta,
+        Ethnicity.bame,
+    ]
+
+    def __init__(self, intake_query: Query, promoted_before_date: date = None):
+        """
+        :param intake_query: a query joining the intake's candidates to their applications, like
+        `PromotionReport.intake_query`. It can cover several intakes, which `intake` then splits apart
+        :param promoted_before_date: promotions after this date aren't counted, by default today
+        """
+        self.promoted_before_date = promoted_before_date or date.today()
+        rows = (
+            intake_query.outerjoin(Ethnicity, Candidate.ethnicity_id == Ethnicity.id)
+            .outerjoin(
+                PromotionOutcome, PromotionOutcome.application_id == Application.id
+            )
+            .with_entities(
+                Candidate.id,
+                Application.scheme_start_date,
+                *self.id_columns,
+                *self.flag_columns,
+                PromotionOutcome.substantive_promotion_date
+                <= self.promoted_before_date,
+                PromotionOutcome.temporary_promotion_date <= self.promoted_before_date,
+            )
+            .all()
+        )
+        columns = (
+            iter(zip(*rows))
+            if rows
+            else iter([()] * (len(self.id_columns) + len(self.flag_columns) + 4))
+        )
+        frame = {
+            "candidate_id": np.array(next(columns), dtype=np.int64),
+            "intake_date": pd.to_datetime(pd.Series(next(columns), dtype=object)),
+        }
+        for column in self.id_columns:
+            frame[self.label(column)] = pd.array(next(columns), dtype="Int32")
+        for column in self.flag_columns:
+            frame[self.label(column)] = pd.array(next(columns), dtype="boolean")
+        frame["substantive"] = pd.array(next(columns), dtype="boolean").fillna(False)
+        frame["temporary"] = pd.array(next(columns), dtype="boolean").fillna(False)
+        self.frame = pd.DataFrame(frame)
+
+    @staticmethod
+    def label(column) -> str:
+        """
+        The name of `column`'s column in `frame`, like "candidate.ethnicity_id"
+        """
+        return f"{column.class_.__tablename__}.{column.key}"
+
+    def intake(self, intake_date: date) -> "IntakeSnapshot":
+        """
+        The part of this snapshot for the intake that started on `intake_date`, for snapshots loaded from a query over
+        several intakes
+        """
+        snapshot = copy(self)
+        snapshot.frame = self.frame[self.frame.intake_date == pd.Timestamp(intake_date)]
+        return snapshot
+
+    def mask(self, column, value) -> pd.Series:
+        """
+        Which rows of `frame` have `value` in `column`, where a value of None picks out the rows with no value
+        """
+        values = self.frame[self.label(column)]
+        if value is None:
+            return values.isna()
+        return (values == value).fillna(False).astype(bool)
+
+    def candidate_ids(self, mask: pd.Series = None) -> List[int]:
+        """
+        The ids of the candidates in the rows picked out by `mask`, or in every row, in the order they were loaded
+        """
+        ids = self.frame.candidate_id if mask is None else self.frame.candidate_id[mask]
+        return ids.drop_duplicates().tolist()
+
+    def count(self, *group_by) -> Dict[Any, PromotionCount]:
+        """
+        The same counts `PromotionOutcomeCounter.count` would give for the intake, grouped by any of the snapshot's
+        columns
+        """
+        labels = [self.label(column) for column in group_by]
+        frame = self.frame.assign(
+            substantive_id=self.frame.candidate_id.where(self.frame.substantive),
+            temporary_id=self.frame.candidate_id.where(self.frame.temporary),
+        )
+        counts = frame.groupby(labels, dropna=False, sort=False).agg(
+            substantive=("substantive_id", "nunique"),
+            temporary=("temporary_id", "nunique"),
+            total=("candidate_id", "nunique"),
+        )
+        return {
+            self._key(key): PromotionCount(
+                int(row.substantive), int(row.temporary), int(row.total)
+            )
+            for key, row in counts.iterrows()
+        }
+
+    @staticmethod
+    def _key(key):
+        if isinstance(key, tuple):
+            return tuple(None if value is pd.NA else value for value in key)
+        return None if key is pd.NA else key
@@ -0,0 +1,24 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from config import Config
+
+
+def process_pool(workers: int = None, configuration=Config) -> ProcessPoolExecutor:
+    """
+    A process pool for running reports in parallel. Each worker process creates its own app, and with it its own
+    database engine, when it starts, so no connections are shared with the process that created the pool
+    :param workers: how many processes to start, by default one per CPU
+    :param configuration: the config class the workers' apps are created with
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers, initializer=_start_worker, initargs=(configuration,)
+    )
+
+
+def _start_worker(configuration):
+    from app import create_app
+    from app.models import db
+
+    create_app(configuration).app_context().push()
+    # a forked worker inherits the parent's session, along with any connection it holds, so it needs one of its own
+    db.session = db.create_scoped_session()
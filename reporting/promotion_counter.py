@@ -0,0 +1,105 @@
+from collections import namedtuple
+from datetime import date
+from typing import Any, Dict, Iterable
+
+from sqlalchemy import and_, case, distinct, func
+from sqlalchemy.orm import Query
+
+from app.models import (
+    Application,
+    Candidate,
+    Promotion,
+    PromotionOutcome,
+    RoleChangeEvent,
+)
+
+PromotionCount = namedtuple("PromotionCount", ["substantive", "temporary", "total"])
+
+
+class PromotionCounter:
+    """
+    Counts how many candidates in a population were promoted, substantively and temporarily, between two dates. The
+    counts for every group in the population come back from a single aggregate query, rather than from checking each
+    candidate's role changes one at a time
+    """
+
+    no_promotions = PromotionCount(0, 0, 0)
+
+    def __init__(
+        self, promoted_after_date: date, promoted_before_date: [date, None] = None
+    ):
+        self.promoted_after_date = promoted_after_date
+        self.promoted_before_date = promoted_before_date or date.today()
+
+    def count(self, population: Query, *group_by) -> Dict[Any, PromotionCount]:
+        """
+        Count the promotions in `population`, grouped by the columns in `group_by`
+        :param population: a query that selects the candidates to count from the Candidate table
+        :param group_by: the columns or expressions to group candidates by
+        :return: PromotionCounts keyed by the group's value, or by a tuple of values if grouping by several columns
+        :rtype: Dict[Any, PromotionCount]
+        """
+        query = (
+            self._join_promotions(population)
+            .with_entities(
+                *group_by,
+                self._candidates_promoted("substantive"),
+                self._candidates_promoted("temporary"),
+                func.count(distinct(Candidate.id)),
+            )
+            .group_by(*group_by)
+        )
+        output = {}
+        for row in query.all():
+            key = row[0] if len(group_by) == 1 else tuple(row[: len(group_by)])
+            output[key] = PromotionCount(*row[len(group_by) :])
+        return output
+
+    @staticmethod
+    def combine(counts: Iterable[PromotionCount]) -> PromotionCount:
+        """
+        Add together the counts for several groups. Only use this for groups that don't share any candidates
+        """
+        output = PromotionCounter.no_promotions
+        for count in counts:
+            output = PromotionCount(*(a + b for a, b in zip(output, count)))
+        return output
+
+    def _join_promotions(self, population: Query) -> Query:
+        return population.outerjoin(
+            RoleChangeEvent,
+            and_(
+                RoleChangeEvent.candidate_id == Candidate.id,
+                RoleChangeEvent.role_change_date >= self.promoted_after_date,
+                RoleChangeEvent.role_change_date <= self.promoted_before_date,
+            ),
+        ).outerjoin(Promotion, Promotion.id == RoleChangeEvent.role_change_id)
+
+    def _candidates_promoted(self, promotion_type: str):
+        return func.count(
+            distinct(case([(Promotion.value == promotion_type, Candidate.id)]))
+        )
+
+
+class PromotionOutcomeCounter(PromotionCounter):
+    """
+    Counts promotions from the precomputed PromotionOutcome table rather than from candidates' role histories. Each
+    application's promotions are counted from its own `Application.promotions_count_from` date, so the population
+    must be a query that joins Candidate to the Application whose outcome should be counted
+    """
+
+    def __init__(self, promoted_before_date: [date, None] = None):
+        super().__init__(None, promoted_before_date)
+
+    def _join_promotions(self, population: Query) -> Query:
+        return population.outerjoin(
+            PromotionOutcome, PromotionOutcome.application_id == Application.id
+        )
+
+    def _candidates_promoted(self, promotion_type: str):
+        promotion_date = getattr(PromotionOutcome, f"{promotion_type}_promotion_date")
+        return func.count(
+            distinct(
+                case([(promotion_date <= self.promoted_before_date, Candidate.id)])
+            )
+        )
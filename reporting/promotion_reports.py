@@ -1,4 +1,12 @@
+import os
+from concurrent.futures import Executor
+from typing import Dict
+
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+
 from app.models import (
+    Application,
     Ethnicity,
     Gender,
     Candidate,
@@ -8,17 +16,32 @@ from app.models import (
     AgeRange,
 )
 
+from app.reference_data import reference_data
 from reporting.base_promotion_report import PromotionReport
+from reporting.promotion_counter import PromotionCount, PromotionCounter
 
 
 class CharacteristicPromotionReport(PromotionReport):
     """
     This class is for reports that iterate over a separate table. The tables are listed in self.tables. This report
-    iterates over each value in the table and groups together candidates with that value
+    iterates over each value in the table and groups together candidates with that value.
+
+    Given an `executor`, like the one from `reporting.parallel.process_pool`, the report splits the intake into
+    `workers` ranges of candidate ids, counts each range on a different worker and adds the ranges' counts together
     """
 
-    def __init__(self, scheme: str, year: str, attribute: str):
+    def __init__(
+        self,
+        scheme: str,
+        year: str,
+        attribute: str,
+        executor: Executor = None,
+        workers: int = None,
+    ):
         super().__init__(scheme, year, attribute)
+        self.year = year
+        self.executor = executor
+        self.workers = workers or os.cpu_count()
         self.tables = {
             "ethnicity": Ethnicity,
             "gender": Gender,
@@ -30,18 +53,82 @@ class CharacteristicPromotionReport(PromotionReport):
         self.table = self.tables.get(self.attribute)
 
     def get_row_metadata(self):
+        rows = reference_data.all(self.table)
+        if self.executor is None or self.snapshot is not None:
+            counts = self.characteristic_counts()
+        else:
+            counts = {}
+            for share_counts in self.executor.map(
+                count_characteristic_share,
+                *zip(*self._shares()),
+            ):
+                for key, count in share_counts.items():
+                    counts[key] = PromotionCounter.combine(
+                        [counts.get(key, PromotionCounter.no_promotions), count]
+                    )
         return [
-            (row.value, self.candidates_with_characteristic(row))
-            for row in self.table.query.all()
+            (row.value, counts.get(row.id, PromotionCounter.no_promotions))
+            for row in rows
         ]
 
-    def candidates_with_characteristic(self, characteristic):
+    def characteristic_counts(self, first_id: int = None, last_id: int = None):
+        """
+        Promotion counts for this report's intake keyed by characteristic id. If `first_id` and `last_id` are given,
+        only candidates whose ids are between the two, inclusive, are counted
+        """
+        column = getattr(Candidate, f"{self.attribute}_id")
+        if first_id is None:
+            return self.promotion_counts(column)
+        return self.promotion_counts(
+            column,
+            population=self.intake_query().filter(
+                Application.candidate_id.between(first_id, last_id)
+            ),
+        )
+
+    def _shares(self):
+        """
+        Splits the range of candidate ids in the intake into at most `workers` ranges of the same size
+        """
+        first_id, last_id = (
+            self.intake_query()
+            .with_entities(func.min(Candidate.id), func.max(Candidate.id))
+            .one()
+        )
+        if first_id is None:
+            return []
+        size = (last_id - first_id) // self.workers + 1
         return [
-            candidate
-            for candidate in self.eligible_candidates()
-            if getattr(candidate, self.attribute) == characteristic
+            (
+                self.scheme.name,
+                self.year,
+                self.attribute,
+                share_first_id,
+                min(share_first_id + size - 1, last_id),
+            )
+            for share_first_id in range(first_id, last_id + 1, size)
         ]
 
+    def candidate_loader_options(self):
+        return [joinedload(getattr(Candidate, self.attribute))]
+
+    def candidates_with_characteristic(self, characteristic):
+        column = getattr(Candidate, f"{self.attribute}_id")
+        return self.candidates_in(
+            self.intake_snapshot().mask(column, characteristic.id)
+        )
+
+
+def count_characteristic_share(
+    scheme: str, year: str, attribute: str, first_id: int, last_id: int
+) -> Dict[int, PromotionCount]:
+    """
+    The work one executor worker does for a parallel CharacteristicPromotionReport. It runs in the worker's own app
+    context, so through the worker's own database engine
+    """
+    report = CharacteristicPromotionReport(scheme, year, attribute)
+    return report.characteristic_counts(first_id, last_id)
+
 
 class BooleanCharacteristicPromotionReport(PromotionReport):
     """
@@ -67,13 +154,9 @@ class BooleanCharacteristicPromotionReport(PromotionReport):
         )
 
     def get_row_metadata(self):
+        counts = self.promotion_counts(getattr(Candidate, self.attribute))
         return [
-            (
-                value,
-                Candidate.query.filter(
-                    getattr(Candidate, self.attribute).is_(key)
-                ).all(),
-            )
+            (value, counts.get(key, PromotionCounter.no_promotions))
             for key, value in self.human_readable_row_titles.items()
         ]
 
@@ -88,51 +171,77 @@ class OfferPromotionReport(PromotionReport):
         }
 
     def get_row_metadata(self):
+        counts = self.promotion_counts(
+            self.eligibility_column(),
+            getattr(Application, self.attribute),
+            population=self.eligibility_query(),
+        )
         return [
             (
                 f"Candidates eligible for {self.upper_attribute}",
-                self.eligible_candidates(),
+                PromotionCounter.combine(
+                    count for (eligible, on_offer), count in counts.items() if eligible
+                ),
             ),
             (
                 f"Candidates on {self.upper_attribute}",
-                self.candidates_on_offer(self.attribute),
+                PromotionCounter.combine(
+                    count for (eligible, on_offer), count in counts.items() if on_offer
+                ),
             ),
             (
                 f"Candidates not on {self.upper_attribute}",
-                list(
-                    set(self.eligible_candidates())
-                    - set(self.candidates_on_offer(self.attribute))
+                PromotionCounter.combine(
+                    count
+                    for (eligible, on_offer), count in counts.items()
+                    if eligible and not on_offer
                 ),
             ),
         ]
 
+    def eligibility_query(self):
+        """
+        The intake, joined to any tables that `eligibility_column` needs
+        """
+        return self.intake_query()
+
+    def eligibility_column(self):
+        """
+        The column that says whether a candidate is eligible for the offer
+        """
+        raise NotImplementedError
+
+    def eligible_candidates(self):
+        return self.candidates_in(
+            self.intake_snapshot().mask(self.eligibility_column(), True)
+        )
+
     def candidates_on_offer(self, offer):
-        return [
-            candidate
-            for candidate in super().eligible_candidates()
-            if getattr(candidate.applications[0], offer)
-        ]
+        """
+        The candidates in the intake whose application put them on `offer`, read from the application that was joined
+        to load the intake
+        """
+        return self.candidates_in(
+            self.intake_snapshot().mask(getattr(Application, offer), True)
+        )
 
 
 class MetaOfferPromotionReport(OfferPromotionReport):
     def __init__(self, scheme, year, attribute):
         super().__init__(scheme, year, attribute)
 
-    def eligible_candidates(self):
-        return [
-            candidate
-            for candidate in super().eligible_candidates()
-            if candidate.ethnicity.bame
-        ]
+    def eligibility_query(self):
+        return self.intake_query().outerjoin(
+            Ethnicity, Candidate.ethnicity_id == Ethnicity.id
+        )
+
+    def eligibility_column(self):
+        return Ethnicity.bame
 
 
 class DeltaOfferPromotionReport(OfferPromotionReport):
     def __init__(self, scheme, year, attribute):
         super().__init__(scheme, year, attribute)
 
-    def eligible_candidates(self):
-        return [
-            candidate
-            for candidate in super().eligible_candidates()
-            if candidate.long_term_health_condition
-        ]
+    def eligibility_column(self):
+        return Candidate.long_term_health_condition
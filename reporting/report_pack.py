@@ -0,0 +1,67 @@
+import zipfile
+from datetime import date
+from typing import Iterable, Iterator, List, Tuple
+
+from reporting import ReportFactory
+from reporting.base_promotion_report import PromotionReport
+from reporting.intake_snapshot import IntakeSnapshot
+
+
+class _ChunkBuffer:
+    """
+    A write-only stream that hands back what has been written to it since it was last emptied, so a ZIP file can be
+    sent as it's built
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def empty(self) -> bytes:
+        output = b"".join(self.chunks)
+        self.chunks = []
+        return output
+
+
+class ReportPack:
+    """
+    Every promotion report for each of the given intakes, as a ZIP of CSVs. Each intake is loaded once, into an
+    IntakeSnapshot that all of its reports are counted from, so a pack costs about as much as one report per intake
+    """
+
+    def __init__(self, intakes: Iterable[Tuple[str, str]]):
+        """
+        :param intakes: (scheme, year) pairs, like ("FLS", "2019")
+        """
+        self.intakes = list(intakes)
+        self.filename = (
+            f"promotion-reports-generated-{date.today().strftime('%d-%m-%Y')}"
+        )
+
+    def reports(self, scheme: str, year: str) -> List[PromotionReport]:
+        reports = [
+            report_class(scheme=scheme, year=year, attribute=attribute)
+            for attribute, report_class in ReportFactory.promotion_reports().items()
+        ]
+        snapshot = IntakeSnapshot(reports[0].intake_query())
+        for report in reports:
+            report.snapshot = snapshot
+        return reports
+
+    def generate_zip(self) -> Iterator[bytes]:
+        buffer = _ChunkBuffer()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as pack:
+            for scheme, year in self.intakes:
+                for report in self.reports(scheme, year):
+                    pack.writestr(
+                        f"{scheme}-{year}/{report.filename}.csv",
+                        "".join(report.generate_report_data()),
+                    )
+                    yield buffer.empty()
+        yield buffer.empty()
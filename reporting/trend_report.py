@@ -0,0 +1,109 @@
+from datetime import date
+from typing import List, Type
+
+from sqlalchemy import and_
+
+from app.models import Application, Candidate
+from reporting.base_report import Report
+from reporting.base_promotion_report import PromotionReport
+from reporting.intake_snapshot import IntakeSnapshot
+
+
+class PromotionTrendReport(Report):
+    """
+    A promotion report for one attribute across a range of intake years, with a row per characteristic and a set of
+    columns per year. Every year's intake is read in the same query into one IntakeSnapshot, which is then split by
+    year, so a trend over several years costs one query rather than one report per year
+    """
+
+    def __init__(
+        self,
+        report_class: Type[PromotionReport],
+        scheme: str,
+        attribute: str,
+        first_year: str,
+        last_year: str,
+    ):
+        """
+        :param report_class: the promotion report for `attribute`, from `ReportFactory.promotion_reports`
+        """
+        super().__init__(scheme)
+        self.report_class = report_class
+        self.attribute = attribute
+        self.years = [str(year) for year in range(int(first_year), int(last_year) + 1)]
+        self.headers = ["characteristic"]
+        for year in self.years:
+            self.headers.extend(
+                [
+                    f"{year} number substantively promoted",
+                    f"{year} percentage substantively promoted",
+                    f"{year} number temporarily promoted",
+                    f"{year} percentage temporarily promoted",
+                    f"{year} total in group",
+                ]
+            )
+        self.filename = (
+            f"promotion-trends-by-{attribute}-{scheme}-{first_year}-to-{last_year}-generated-"
+            f"{date.today().strftime('%d-%m-%Y')}"
+        )
+
+    def reports(self) -> List[PromotionReport]:
+        """
+        A report for each year, all counted from the same snapshot of every year's intake
+        """
+        reports = [
+            self.report_class(
+                scheme=self.scheme.name, year=year, attribute=self.attribute
+            )
+            for year in self.years
+        ]
+        snapshot = IntakeSnapshot(
+            self.intake_query([report.intake_date for report in reports])
+        )
+        for report in reports:
+            report.snapshot = snapshot.intake(report.intake_date)
+        return reports
+
+    def intake_query(self, intake_dates: List[date]):
+        return Candidate.query.join(
+            Application, Application.candidate_id == Candidate.id
+        ).filter(
+            and_(
+                Application.scheme_start_date.in_(intake_dates),
+                Application.scheme_id == self.scheme.id,
+            )
+        )
+
+    def get_data(self):
+        reports = self.reports()
+        output = []
+        for rows in zip(*(report.get_row_metadata() for report in reports)):
+            output_row = [rows[0][0]]
+            for report, (row_header, promotion_count) in zip(reports, rows):
+                output_row.extend(report.row_writer(row_header, promotion_count)[1:])
+            output.append(output_row)
+        return output
+
+    def write_row(self, row_data, data_object, csv_writer):
+        """
+        Write out a row with each year's decimals formatted as percentages, the same as a single year's report
+        """
+        output = [row_data[0]]
+        for (
+            substantive,
+            substantive_decimal,
+            temporary,
+            temporary_decimal,
+            total,
+        ) in zip(*[iter(row_data[1:])] * 5):
+            output.extend(
+                [
+                    substantive,
+                    "{0:.0%}".format(substantive_decimal),
+                    temporary,
+                    "{0:.0%}".format(temporary_decimal),
+                    total,
+                ]
+            )
+        csv_writer.writerow(output)
+        return data_object.getvalue()
@@ -0,0 +1,235 @@
+"""
+Times every report type, the upload pipeline and the main routes against synthetic datasets of different sizes, and
+writes the timings to a JSON file so they can be compared between releases.
+
+    python scripts/benchmark.py --sizes 10000 100000 1000000 --output benchmark-results.json
+
+Each dataset is built from scratch in the database at DATABASE_URL, or in a SQLite file if it isn't set, so don't
+point this at a database whose data you want to keep.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from time import perf_counter
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from app.candidate_search import candidate_search  # noqa: E402
+from app.models import Candidate, Promotion, User, db  # noqa: E402
+from app.reference_data import reference_data  # noqa: E402
+from app.report_cache import report_cache  # noqa: E402
+from config import Config  # noqa: E402
+from modules.seed import SeedData  # noqa: E402
+from modules.synthetic import SyntheticData  # noqa: E402
+from modules.upload import BulkUpload, Upload  # noqa: E402
+from reporting import ReportFactory  # noqa: E402
+from reporting.detailed_report import DetailedReport  # noqa: E402
+from reporting.report_pack import ReportPack  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REFERENCE_DATA = os.path.join(ROOT, "tests", "data", "test-database-content.xlsx")
+INTAKE_CSV = os.path.join(ROOT, "tests", "data", "2019", "test_csv.csv")
+APPLICATION_CSV = os.path.join(
+    ROOT, "tests", "data", "2019", "test_application_csv.csv"
+)
+
+
+class BenchmarkConfig(Config):
+    SECRET_KEY = "benchmark"
+    WTF_CSRF_ENABLED = False
+    SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL") or (
+        f"sqlite:///{os.path.join(tempfile.gettempdir(), 'talent-tracker-benchmark.db')}"
+    )
+
+
+def timed(function, repeats: int) -> float:
+    """
+    The fastest of `repeats` runs of `function`, in seconds
+    """
+    timings = []
+    for i in range(repeats):
+        start = perf_counter()
+        function()
+        timings.append(perf_counter() - start)
+    return min(timings)
+
+
+def build_dataset(size: int, seed: int) -> float:
+    db.drop_all()
+    db.create_all()
+    reference_data.invalidate()
+    SeedData(REFERENCE_DATA).seed_data()
+    user = User(email="benchmark@talent-tracker.gov.uk")
+    user.set_password("benchmark")
+    db.session.add(user)
+    db.session.commit()
+    start = perf_counter()
+    SyntheticData(size, seed=seed).insert()
+    db.session.commit()
+    candidate_search.clear()
+    return perf_counter() - start
+
+
+def report_benchmarks():
+    """
+    (name, function) pairs for every kind of report, on the 2019 FLS intake
+    """
+    for attribute in ReportFactory.promotion_reports():
+        yield f"promotion report: {attribute}", lambda attribute=attribute: ReportFactory.create_report(
+            "promotions", scheme="FLS", year="2019", attribute=attribute
+        ).get_data()
+    for promotion in reference_data.all(Promotion):
+        yield f"detailed report: {promotion.value}", lambda id=promotion.id: list(
+            DetailedReport("2019", "FLS", id).generate_report_data()
+        )
+    yield "trend report: ethnicity", lambda: ReportFactory.from_form(
+        "trends",
+        {
+            "scheme": "FLS",
+            "attribute": "ethnicity",
+            "first-year": "2018",
+            "last-year": "2019",
+        },
+    ).get_data()
+    yield "report pack", lambda: b"".join(
+        ReportPack([("FLS", "2018"), ("FLS", "2019")]).generate_zip()
+    )
+
+
+def upload_benchmarks(rows: int, workdir: str):
+    """
+    (name, function) pairs for each upload pipeline, importing an intake of `rows` copies of the test intake
+    """
+    intake = pd.concat([pd.read_csv(INTAKE_CSV)] * rows, ignore_index=True)
+    application = pd.concat([pd.read_csv(APPLICATION_CSV)] * rows, ignore_index=True)
+    for upload_class in (Upload, BulkUpload):
+        # each upload needs its own candidates, as email addresses are made from their ids
+        ids = [f"{upload_class.__name__}{i}" for i in range(rows)]
+        intake["Psych. Username"] = ids
+        application["PerID"] = ids
+        intake_path = os.path.join(workdir, f"{upload_class.__name__}-intake.csv")
+        application_path = os.path.join(
+            workdir, f"{upload_class.__name__}-application.csv"
+        )
+        intake.to_csv(intake_path, index=False)
+        application.to_csv(application_path, index=False)
+        yield f"upload: {upload_class.__name__} of {rows} rows", lambda upload_class=upload_class, intake_path=intake_path, application_path=application_path: upload_class(
+            intake_path, "FLS", "2021-03-01", application_path
+        ).complete_upload()
+
+
+def route_benchmarks(client, candidate_id: int, last_candidate_id: int):
+    yield "route: GET /", lambda: client.get("/").data
+    yield "route: GET candidate profile", lambda: client.get(
+        f"/candidates/{candidate_id}"
+    ).data
+    yield "route: GET candidate directory, first page", lambda: client.get(
+        "/candidates/"
+    ).data
+    yield "route: GET candidate directory, last page", lambda: client.get(
+        f"/candidates/?after={last_candidate_id - 10}"
+    ).data
+    yield "route: GET candidate search", lambda: client.get(
+        "/update/search?q=synthetic candidate 12345"
+    ).data
+    yield "route: POST promotion report", lambda: client.post(
+        "/reports/promotions",
+        data={
+            "report-type": "promotions",
+            "scheme": "FLS",
+            "year": "2019",
+            "attribute": "ethnicity",
+        },
+    ).data
+
+
+def git_revision() -> str:
+    try:
+        return (
+            subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT)
+            .decode("utf-8")
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--upload-rows", type=int, default=1000)
+    parser.add_argument("--output", default="benchmark-results.json")
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    results = []
+
+    def record(size, name, seconds):
+        results.append(dict(size=size, benchmark=name, seconds=round(seconds, 4)))
+        print(f"{size:>9} {name:<45} {seconds:8.3f}s", flush=True)
+
+    with app.app_context(), tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            record(size, "generate dataset", build_dataset(size, args.seed))
+            for name, function in report_benchmarks():
+                # clear the report cache so every run generates the report
+                record(
+                    size,
+                    name,
+                    timed(lambda: (report_cache.clear(), function()), args.repeats),
+                )
+
+            client = app.test_client()
+            client.post(
+                "/auth/login",
+                data={
+                    "email-address": "benchmark@talent-tracker.gov.uk",
+                    "password": "benchmark",
+                },
+            )
+            candidate_id = Candidate.query.order_by(Candidate.id).first().id
+            last_candidate_id = Candidate.query.order_by(Candidate.id.desc()).first().id
+            for name, function in route_benchmarks(
+                client, candidate_id, last_candidate_id
+            ):
+                record(
+                    size,
+                    name,
+                    timed(lambda: (report_cache.clear(), function()), args.repeats),
+                )
+
+            # uploads add candidates, so they're run once each, after everything else
+            for name, function in upload_benchmarks(args.upload_rows, workdir):
+                record(size, name, timed(function, 1))
+
+    with open(args.output, "w") as output:
+        json.dump(
+            dict(
+                revision=git_revision(),
+                generated=datetime.now().isoformat(timespec="seconds"),
+                python=platform.python_version(),
+                database=BenchmarkConfig.SQLALCHEMY_DATABASE_URI.split(":")[0],
+                seed=args.seed,
+                repeats=args.repeats,
+                results=results,
+            ),
+            output,
+            indent=2,
+        )
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Times a characteristic promotion report run serially and across a process pool, against the database in DATABASE_URL.
+
+    python scripts/benchmark_parallel_report.py FLS 2019 ethnicity --workers 4
+"""
+import argparse
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from reporting.parallel import process_pool  # noqa: E402
+from reporting.promotion_reports import CharacteristicPromotionReport  # noqa: E402
+
+
+def time_report(scheme, year, attribute, repeats, executor=None, workers=None):
+    timings = []
+    for i in range(repeats):
+        start = perf_counter()
+        data = CharacteristicPromotionReport(
+            scheme, year, attribute, executor=executor, workers=workers
+        ).get_data()
+        timings.append(perf_counter() - start)
+    return data, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("scheme")
+    parser.add_argument("year")
+    parser.add_argument("attribute")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        serial, serial_time = time_report(
+            args.scheme, args.year, args.attribute, args.repeats
+        )
+        with process_pool(args.workers) as executor:
+            # the first map starts the workers, so don't time it
+            list(executor.map(abs, range(args.workers)))
+            parallel, parallel_time = time_report(
+                args.scheme,
+                args.year,
+                args.attribute,
+                args.repeats,
+                executor,
+                args.workers,
+            )
+    assert parallel == serial, "parallel output differs from serial output"
+    print(f"serial:   {serial_time:.3f}s")
+    print(f"parallel: {parallel_time:.3f}s with {args.workers} workers")
+    print(f"speedup:  {serial_time / parallel_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,31 @@
-from modules.seed import commit_data, clear_old_data
-from app import create_app
+import argparse
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.seed import commit_data, clear_old_data, DEFAULT_SEED_DATA  # noqa: E402
+from app import create_app  # noqa: E402
 
 
 def main():
+    parser = argparse.ArgumentParser(
+        description="Replace the data in the database with freshly generated data"
+    )
+    parser.add_argument("--spreadsheet", default=DEFAULT_SEED_DATA)
+    parser.add_argument(
+        "--candidates-per-scheme",
+        type=int,
+        default=100,
+        help="how many random candidates to put on each scheme",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
     if os.environ.get("ENV") != "staging":
         app = create_app()
         with app.app_context():
             clear_old_data()
-            commit_data()
+            commit_data(args.spreadsheet, args.candidates_per_scheme, args.seed)
 
 
 if __name__ == "__main__":
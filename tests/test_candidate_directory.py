@@ -0,0 +1,107 @@
+from datetime import date
+
+import pytest
+
+from app.candidate_directory import CandidateDirectory
+from app.models import Application, Candidate
+
+
+@pytest.fixture
+def small_pages(monkeypatch):
+    monkeypatch.setattr(CandidateDirectory, "page_size", 30)
+
+
+def every_page(directory: CandidateDirectory):
+    after = 0
+    while after is not None:
+        page = directory.page(after)
+        yield page
+        after = page.next_after
+
+
+def matches(candidate: Candidate, filters: dict) -> bool:
+    role = candidate.latest_role
+    for column in ["grade", "organisation", "location"]:
+        if column in filters and getattr(role, f"{column}_id") != filters[column]:
+            return False
+    if "scheme" not in filters and "intake" not in filters:
+        return True
+    return any(
+        filters.get("scheme", application.scheme_id) == application.scheme_id
+        and filters.get("intake", application.scheme_start_date.year)
+        == application.scheme_start_date.year
+        for application in candidate.applications
+    )
+
+
+def test_pages_cover_every_candidate_once(seed_data, small_pages):
+    pages = list(every_page(CandidateDirectory()))
+    ids = [candidate["id"] for page in pages for candidate in page.candidates]
+    assert ids == [candidate.id for candidate in Candidate.query.order_by(Candidate.id)]
+    assert all(len(page.candidates) == 30 for page in pages[:-1])
+    assert pages[-1].next_after is None
+
+
+def filters_matching(candidate: Candidate, *names) -> dict:
+    """
+    Filters that `candidate` is picked out by, so that no filter in the tests picks out nobody
+    """
+    application = candidate.applications.first()
+    values = dict(
+        scheme=application.scheme_id,
+        intake=application.scheme_start_date.year,
+        grade=candidate.latest_role.grade_id,
+        organisation=candidate.latest_role.organisation_id,
+        location=candidate.latest_role.location_id,
+    )
+    return {name: values[name] for name in names}
+
+
+@pytest.mark.parametrize(
+    "names",
+    [
+        ["scheme"],
+        ["scheme", "intake"],
+        ["intake"],
+        ["grade"],
+        ["scheme", "organisation"],
+        ["location", "grade"],
+    ],
+)
+def test_filters(seed_data, small_pages, names):
+    candidates = Candidate.query.order_by(Candidate.id).all()
+    filters = filters_matching(candidates[-50], *names)
+    ids = [
+        candidate["id"]
+        for page in every_page(CandidateDirectory(**filters))
+        for candidate in page.candidates
+    ]
+    assert candidates[-50].id in ids
+    assert ids == [
+        candidate.id for candidate in candidates if matches(candidate, filters)
+    ]
+
+
+def test_candidates_who_applied_twice_are_listed_once(test_candidate_applied_to_fls):
+    candidate = Candidate.query.get(1)
+    candidate.applications.append(
+        Application(scheme_id=1, scheme_start_date=date(2020, 3, 1))
+    )
+    page = CandidateDirectory(scheme=1).page()
+    assert [row["id"] for row in page.candidates] == [1]
+
+
+def test_each_page_is_one_query(seed_data, small_pages, query_budget):
+    candidate = Candidate.query.order_by(Candidate.id.desc()).offset(20).first()
+    filters = filters_matching(candidate, "scheme", "intake")
+    with query_budget(1):
+        page = CandidateDirectory(**filters).page(after=candidate.id - 1)
+    assert set(page.candidates[0]) == {
+        "id",
+        "first_name",
+        "last_name",
+        "email_address",
+        "grade",
+        "organisation",
+        "location",
+    }
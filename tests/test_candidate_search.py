@@ -0,0 +1,147 @@
+import pytest
+
+from app.candidate_search import CandidateSearchIndex, candidate_search, trigrams
+from app.models import Candidate
+
+
+def found(results):
+    return [(result.id, result.name) for result in results]
+
+
+class QueuedExecutor:
+    def __init__(self):
+        self.queued = []
+
+    def submit(self, fn, *args, **kwargs):
+        self.queued.append((fn, args, kwargs))
+
+    def run(self):
+        while self.queued:
+            fn, args, kwargs = self.queued.pop(0)
+            fn(*args, **kwargs)
+
+
+def test_trigrams_are_taken_from_each_word():
+    assert trigrams("Jo.Drew") == {" jo", "jo ", " dr", "dre", "rew", "ew "}
+    assert trigrams("  ") == set()
+
+
+@pytest.fixture
+def known_candidate(seed_data):
+    return Candidate.query.filter_by(email_address="staging.candidate@gov.uk").one()
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["Test Candidate", "tesst candidat", "staging.candidate@", "STAGING.SECONDARY"],
+)
+def test_finds_candidates_by_name_or_email(known_candidate, query):
+    assert found(candidate_search.search(query))[0] == (
+        known_candidate.id,
+        "Test Candidate",
+    )
+
+
+def test_unrelated_queries_find_nothing(test_candidate):
+    assert candidate_search.search("zzqx") == []
+    assert candidate_search.search("") == []
+
+
+def test_committed_changes_are_indexed_without_a_rebuild(
+    test_candidate, test_session, query_counter
+):
+    assert found(candidate_search.search("Testy"))
+    test_candidate.first_name = "Renamed"
+    test_session.add(Candidate(first_name="Newly", last_name="Added"))
+    test_session.commit()
+    query_counter.clear()
+    assert found(candidate_search.search("Renamed Candidate")) == [
+        (1, "Renamed Candidate")
+    ]
+    assert found(candidate_search.search("Newly Added"))[0][1] == "Newly Added"
+    assert candidate_search.search("Testy") == []
+    # only the candidates' own queries ran; the index wasn't rebuilt
+    assert not [
+        statement for statement in query_counter if "FROM candidate" in statement
+    ]
+
+
+def test_deleted_candidates_are_not_found(test_candidate, test_session):
+    candidate = Candidate(first_name="Shortlived", last_name="Candidate")
+    test_session.add(candidate)
+    test_session.commit()
+    assert found(candidate_search.search("Shortlived"))
+    test_session.delete(candidate)
+    test_session.commit()
+    assert candidate_search.search("Shortlived") == []
+
+
+def test_changes_rolled_back_are_not_indexed(test_candidate, test_session):
+    candidate_search.build()
+    test_candidate.first_name = "Temporary"
+    test_session.flush()
+    test_session.rollback()
+    assert candidate_search.search("Temporary") == []
+
+
+def test_postings_are_kept_within_budget(known_candidate):
+    index = CandidateSearchIndex(max_postings=5000)
+    index.build()
+    stats = index.stats()
+    assert stats["postings"] <= 5000
+    assert stats["dropped_trigrams"] > 0
+    # the trigrams left out are the ones most candidates share
+    frequencies = {gram: len(ids) for gram, ids in index._postings.items()}
+    full_index = CandidateSearchIndex()
+    full_index.build()
+    assert min(len(full_index._postings[gram]) for gram in index._dropped) >= max(
+        frequencies.values()
+    )
+    assert found(index.search("Test Candidate"))[0] == (
+        known_candidate.id,
+        "Test Candidate",
+    )
+
+
+def test_rebuilds_in_the_background_after_invalidating(
+    test_candidate, test_session, monkeypatch
+):
+    executor = QueuedExecutor()
+    monkeypatch.setattr(candidate_search, "executor", executor)
+    assert found(candidate_search.search("Testy"))
+    test_session.execute(
+        Candidate.__table__.update()
+        .where(Candidate.id == test_candidate.id)
+        .values(first_name="Rewritten")
+    )
+    candidate_search.invalidate()
+
+    # the old index answers searches until the new one is built
+    assert found(candidate_search.search("Testy"))
+    assert len(executor.queued) == 1
+    assert found(candidate_search.search("Testy"))
+    assert len(executor.queued) == 1
+
+    executor.run()
+    assert candidate_search.search("Testy") == []
+    assert found(candidate_search.search("Rewritten Candidate")) == [
+        (test_candidate.id, "Rewritten Candidate")
+    ]
+
+
+def test_changes_committed_while_building_are_kept(
+    test_candidate, test_session, monkeypatch
+):
+    index_documents = candidate_search._index
+
+    def commit_a_change(documents):
+        test_candidate.first_name = "Committed"
+        test_session.commit()
+        return index_documents(documents)
+
+    monkeypatch.setattr(candidate_search, "_index", commit_a_change)
+    candidate_search.build()
+    assert candidate_search.search("Testy") == []
+    assert found(candidate_search.search("Committed Candidate")) == [
+        (test_candidate.id, "Committed Candidate")
+    ]
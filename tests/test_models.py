@@ -2,12 +2,19 @@ from app.models import (
     FLSLeadership,
     Leadership,
     Candidate,
+    CandidateEmail,
     Role,
     Grade,
     Application,
     Promotion,
+    PromotionOutcome,
+    RoleChangeEvent,
 )
+from reporting.detailed_report import DetailedReport
+from reporting.promotion_reports import CharacteristicPromotionReport
 from datetime import date
+import re
+from sqlalchemy import and_
 import pytest
 
 
@@ -124,6 +131,41 @@ class TestCandidate:
             is expected_outcome
         )
 
+    def test_new_role_moves_current_role(self, test_candidate, test_session):
+        test_candidate.new_role(
+            start_date=date(2019, 1, 1),
+            new_org_id=1,
+            new_profession_id=1,
+            new_location_id=1,
+            new_grade_id=3,
+            new_title="Newer role",
+            role_change_id=2,
+        )
+        test_session.commit()
+        candidate = Candidate.query.get(test_candidate.id)
+        assert candidate.current_role().role_name == "Newer role"
+        assert candidate.current_role_id == candidate.role_changes.first().new_role_id
+        assert candidate.role_changes.first().former_role.role_name == (
+            "Snr Test Candidate"
+        )
+
+    def test_new_role_that_started_earlier_is_not_current(
+        self, test_candidate, test_session
+    ):
+        test_candidate.new_role(
+            start_date=date(2005, 1, 1),
+            new_org_id=1,
+            new_profession_id=1,
+            new_location_id=1,
+            new_grade_id=1,
+            new_title="Older role",
+            role_change_id=2,
+        )
+        test_session.commit()
+        candidate = Candidate.query.get(test_candidate.id)
+        assert candidate.current_role().role_name == "Snr Test Candidate"
+        assert candidate.roles.count() == 2
+
     def test_current_scheme_returns_current_scheme(self, test_candidate_applied_to_fls):
         assert test_candidate_applied_to_fls.current_scheme().name == "FLS"
 
@@ -144,6 +186,120 @@ class TestCandidate:
         )
 
 
+class TestPromotionOutcome:
+    @staticmethod
+    def outcome(candidate: Candidate) -> PromotionOutcome:
+        return PromotionOutcome.query.filter_by(
+            application_id=candidate.most_recent_application().id
+        ).one()
+
+    @staticmethod
+    def promote(candidate: Candidate, start_date: date, role_change_id: int):
+        candidate.new_role(
+            start_date=start_date,
+            new_org_id=1,
+            new_profession_id=1,
+            new_location_id=1,
+            new_grade_id=1,
+            new_title="New title",
+            role_change_id=role_change_id,
+        )
+
+    def test_new_application_has_an_outcome(
+        self, test_candidate_applied_to_fls, test_session
+    ):
+        outcome = self.outcome(test_candidate_applied_to_fls)
+        assert outcome.candidate_id == test_candidate_applied_to_fls.id
+        assert outcome.substantive_promotion_date is None
+        assert outcome.temporary_promotion_date is None
+
+    def test_new_role_records_first_promotion_after_count_from_date(
+        self, test_candidate_applied_to_fls, test_session
+    ):
+        self.promote(test_candidate_applied_to_fls, date(2018, 11, 30), 2)
+        self.promote(test_candidate_applied_to_fls, date(2019, 6, 1), 2)
+        self.promote(test_candidate_applied_to_fls, date(2019, 2, 1), 2)
+        self.promote(test_candidate_applied_to_fls, date(2019, 4, 1), 1)
+        self.promote(test_candidate_applied_to_fls, date(2019, 5, 1), 4)
+        test_session.commit()
+        outcome = self.outcome(test_candidate_applied_to_fls)
+        assert outcome.substantive_promotion_date == date(2019, 2, 1)
+        assert outcome.temporary_promotion_date == date(2019, 4, 1)
+
+    def test_deferring_an_application_refreshes_its_outcome(
+        self, test_candidate_applied_to_fls, test_session
+    ):
+        self.promote(test_candidate_applied_to_fls, date(2019, 6, 1), 2)
+        test_session.commit()
+        test_candidate_applied_to_fls.most_recent_application().defer(date(2020, 3, 1))
+        test_session.commit()
+        assert (
+            self.outcome(test_candidate_applied_to_fls).substantive_promotion_date
+            is None
+        )
+
+
+class TestCandidateEmail:
+    def addresses(self, candidate: Candidate):
+        return sorted(
+            (row.address, row.primary)
+            for row in CandidateEmail.query.filter_by(candidate_id=candidate.id)
+        )
+
+    def test_new_candidate_can_be_found_by_either_address(self, test_candidate):
+        assert self.addresses(test_candidate) == [
+            ("test.candidate@numberten.gov.uk", True),
+            ("test.secondary@gov.uk", False),
+        ]
+        assert CandidateEmail.candidate("TEST.SECONDARY@gov.uk ") == test_candidate
+
+    def test_update_email_replaces_the_old_address(self, test_candidate, test_session):
+        test_candidate.update_email("New.Address@gov.uk", primary=True)
+        test_session.commit()
+        assert CandidateEmail.candidate("test.candidate@numberten.gov.uk") is None
+        assert CandidateEmail.candidate("new.address@gov.uk") == test_candidate
+
+    def test_secondary_address_the_same_as_the_primary_is_left_out(
+        self, test_candidate, test_session
+    ):
+        test_candidate.update_email("Test.Candidate@numberten.gov.uk", primary=False)
+        test_session.commit()
+        assert self.addresses(test_candidate) == [
+            ("test.candidate@numberten.gov.uk", True)
+        ]
+
+    def test_refresh_rebuilds_addresses_written_without_the_session(
+        self, test_candidate, test_session
+    ):
+        test_session.execute(
+            Candidate.__table__.update()
+            .where(Candidate.id == test_candidate.id)
+            .values(secondary_email_address=None)
+        )
+        CandidateEmail.refresh(test_session.connection(), [test_candidate.id])
+        assert self.addresses(test_candidate) == [
+            ("test.candidate@numberten.gov.uk", True)
+        ]
+
+    def test_addresses_other_candidates_have_are_left_out(
+        self, test_candidate, test_session, caplog
+    ):
+        other = Candidate(
+            email_address="TEST.CANDIDATE@numberten.gov.uk",
+            secondary_email_address="Other.Address@gov.uk",
+        )
+        test_session.add(other)
+        test_session.commit()
+        assert self.addresses(other) == [("other.address@gov.uk", False)]
+        assert "belongs to another candidate" in caplog.text
+        assert CandidateEmail.refresh(test_session.connection(), [other.id]) == [
+            (other.id, "test.candidate@numberten.gov.uk")
+        ]
+        assert CandidateEmail.candidate("test.candidate@numberten.gov.uk") == (
+            test_candidate
+        )
+
+
 class TestGrade:
     def test_eligible_returns_correct_grades(self, test_session):
         assert ["Grade 7", "Grade 6"] == [
@@ -205,3 +361,76 @@ class TestRole:
             role_change_id=role_change_id,
         )
         assert test_candidate.current_role().is_promotion() is expected_outcome
+
+
+def query_plan(session, query) -> str:
+    """
+    The database's plan for running `query`, as text
+    """
+    dialect = session.bind.dialect
+    statement = query.statement.compile(
+        dialect=dialect, compile_kwargs={"literal_binds": True}
+    )
+    if dialect.name == "postgresql":
+        # tables this small would otherwise be read without an index whatever indexes there are
+        session.execute("SET LOCAL enable_seqscan = off")
+        return "\n".join(row[0] for row in session.execute(f"EXPLAIN {statement}"))
+    return "\n".join(
+        row[-1] for row in session.execute(f"EXPLAIN QUERY PLAN {statement}")
+    )
+
+
+class TestReportingIndexes:
+    def test_intake_is_found_by_scheme_and_start_date(self, test_session):
+        report = CharacteristicPromotionReport("FLS", "2019", "ethnicity")
+        assert "ix_application_scheme_id_scheme_start_date" in query_plan(
+            test_session, report.intake_query()
+        )
+
+    def test_candidates_are_found_by_email_address(self, test_session):
+        query = CandidateEmail.query.filter_by(address="test@gov.uk")
+        assert "ix_candidate_email_address" in query_plan(test_session, query)
+
+    def test_detailed_report_intake_is_a_range_of_start_dates(self, test_session):
+        plan = query_plan(test_session, DetailedReport(2019, "FLS", 2).intake_query())
+        assert "ix_application_scheme_id_scheme_start_date" in plan
+        # the start date is part of the index search, rather than checked against every application to the scheme
+        assert re.search(r"scheme_start_date ?>", plan)
+
+    def test_detailed_report_only_orders_the_intakes_applications(self, test_session):
+        report = DetailedReport(2019, "FLS", 2)
+        plan = query_plan(test_session, report.candidates_with_applications())
+        # applications are looked up by candidate, rather than every application in the database being numbered
+        assert not re.search(r"SCAN application\b", plan)
+
+    def test_promotions_are_found_by_candidate_type_and_date(
+        self, test_session, test_candidate
+    ):
+        query = test_candidate.role_changes.filter(
+            and_(
+                RoleChangeEvent.role_change_id == 1,
+                RoleChangeEvent.role_change_date <= date(2020, 1, 1),
+                RoleChangeEvent.role_change_date >= date(2019, 1, 1),
+            )
+        )
+        assert (
+            "ix_role_change_event_candidate_id_role_change_id_role_change_date"
+            in query_plan(test_session, query)
+        )
+
+    @pytest.mark.parametrize(
+        "query, index",
+        [
+            (
+                lambda: RoleChangeEvent.query.filter_by(new_role_id=1),
+                "ix_role_change_event_new_role_id",
+            ),
+            (lambda: Role.query.filter_by(candidate_id=1), "ix_role_candidate_id"),
+            (
+                lambda: Application.query.filter_by(candidate_id=1),
+                "ix_application_candidate_id",
+            ),
+        ],
+    )
+    def test_foreign_keys_are_indexed(self, test_session, query, index):
+        assert index in query_plan(test_session, query())
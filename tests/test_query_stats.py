@@ -0,0 +1,77 @@
+import json
+import logging
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.models import Candidate
+from app.query_stats import QueryStats, query_stats
+from reporting.promotion_reports import CharacteristicPromotionReport
+
+
+@pytest.fixture
+def stats_headers(monkeypatch):
+    monkeypatch.setattr(query_stats, "headers", True)
+
+
+def test_slowest_statements_are_kept():
+    stats = QueryStats(slowest_kept=2)
+    for duration, statement in [(0.1, "a"), (0.3, "b"), (0.2, "c")]:
+        stats.record(statement, duration)
+    other = QueryStats(slowest_kept=2)
+    other.record("d", 0.25)
+    stats.add(other)
+    assert stats.count == 4
+    assert stats.total_time == pytest.approx(0.85)
+    assert stats.slowest == [(0.3, "b"), (0.25, "d")]
+
+
+def test_request_headers(
+    test_client, logged_in_user, test_candidate_applied_to_fls, stats_headers, caplog
+):
+    with caplog.at_level(logging.INFO, logger="app.query_stats"):
+        response = test_client.get("/candidates/1")
+    assert int(response.headers["X-Query-Count"]) >= 1
+    assert response.headers["X-Query-Time"].endswith("ms")
+    logged = json.loads(caplog.records[-1].getMessage())
+    assert logged["path"] == "/candidates/1"
+    assert logged["queries"] == int(response.headers["X-Query-Count"])
+
+
+def test_requests_are_logged_without_setting_a_level(
+    test_client, logged_in_user, caplog
+):
+    test_client.get("/")
+    logged = [
+        json.loads(record.getMessage())
+        for record in caplog.records
+        if record.name == "app.query_stats"
+    ]
+    assert logged[-1]["path"] == "/"
+    # pytest's handler doesn't change the logger's level, so this only passes if the app sets it
+    assert logging.getLogger("app.query_stats").isEnabledFor(logging.INFO)
+
+
+def test_failed_statements_are_not_left_timing(test_session):
+    connection = test_session.connection()
+    with pytest.raises(OperationalError):
+        connection.execute("SELECT * FROM no_such_table")
+    assert not connection.info.get("query_stats_started")
+    connection.execute("SELECT 1")
+    assert not connection.info.get("query_stats_started")
+
+
+def test_headers_are_only_sent_when_enabled(test_client, logged_in_user):
+    assert "X-Query-Count" not in test_client.get("/").headers
+
+
+def test_reports_are_tracked_by_class(test_session, monkeypatch):
+    monkeypatch.setattr(query_stats, "reports", type(query_stats.reports)(QueryStats))
+    for i in range(2):
+        report = CharacteristicPromotionReport("FLS", "2019", "ethnicity")
+        list(report.generate_report_data())
+    with query_stats.track("lookup") as stats:
+        Candidate.query.all()
+    assert stats.count == 1
+    assert query_stats.reports["lookup"].count == 1
+    assert query_stats.reports["CharacteristicPromotionReport"].count >= 2
@@ -0,0 +1,35 @@
+from app.models import Organisation, Promotion, Scheme
+from app.reference_data import ReferenceDataCache, reference_data
+
+
+class TestReferenceDataCache:
+    def test_table_is_loaded_once(self, test_session, query_counter):
+        cache = ReferenceDataCache()
+        cache.all(Promotion)
+        queries_after_first_load = len(query_counter)
+        assert cache.id_for(Promotion, "substantive") == 2
+        assert cache.by_id(Promotion, 1).value == "temporary"
+        assert len(query_counter) == queries_after_first_load
+        assert cache.stats() == {"promotion": {"hits": 2, "misses": 1}}
+
+    def test_rows_are_keyed_by_name_where_tables_have_one(self, test_session):
+        cache = ReferenceDataCache()
+        assert cache.get(Scheme, "SLS").id == 2
+        assert cache.ids(Promotion)["demotion"] == 4
+
+    def test_flushed_changes_drop_the_table(self, test_session):
+        assert reference_data.get(Organisation, "Cabinet Office") is None
+        test_session.add(Organisation(name="Cabinet Office"))
+        test_session.flush()
+        assert reference_data.get(Organisation, "Cabinet Office") is not None
+
+    def test_bulk_deletes_drop_the_table(self, test_session):
+        assert reference_data.get(Promotion, "demotion")
+        Promotion.query.filter_by(value="demotion").delete()
+        assert reference_data.get(Promotion, "demotion") is None
+
+    def test_stale_tables_are_reloaded(self, test_session):
+        cache = ReferenceDataCache(max_age=0)
+        cache.all(Promotion)
+        cache.all(Promotion)
+        assert cache.misses["promotion"] == 2
@@ -0,0 +1,64 @@
+import pytest
+
+from app.report_cache import (
+    FileSystemBackend,
+    LocalRedis,
+    RedisBackend,
+    ReportCache,
+    SimpleBackend,
+)
+
+
+@pytest.fixture(params=["simple", "filesystem", "redis"])
+def backend(request, tmp_path):
+    backends = {
+        "simple": lambda: SimpleBackend(),
+        "filesystem": lambda: FileSystemBackend(str(tmp_path)),
+        "redis": lambda: RedisBackend(LocalRedis()),
+    }
+    return backends[request.param]()
+
+
+class TestBackends:
+    def test_get_and_set(self, backend):
+        assert backend.get("report") is None
+        backend.set("report", "a,b\r\n")
+        assert backend.get("report") == "a,b\r\n"
+
+    def test_incr(self, backend):
+        assert backend.incr("counter") == 1
+        assert backend.incr("counter") == 2
+
+    def test_simple_backend_evicts_least_recently_used(self):
+        backend = SimpleBackend(max_entries=2)
+        backend.set("first", "1")
+        backend.set("second", "2")
+        backend.get("first")
+        backend.set("third", "3")
+        assert backend.get("second") is None
+        assert backend.get("first") == "1"
+
+
+class TestReportCache:
+    def test_bumping_data_version_changes_keys(self, backend):
+        cache = ReportCache()
+        cache.backend = backend
+        key = cache.key("promotions", {"scheme": "FLS", "year": "2019"})
+        assert key == cache.key("promotions", {"year": "2019", "scheme": "FLS"})
+        cache.bump_data_version()
+        assert cache.data_version() == 1
+        assert key != cache.key("promotions", {"scheme": "FLS", "year": "2019"})
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            ReportCache._create_backend({"REPORT_CACHE_TYPE": "memcached"})
+
+    def test_default_backend_is_shared_between_processes(self, tmp_path):
+        config = {"REPORT_CACHE_DIR": str(tmp_path)}
+        worker, other_worker = (
+            ReportCache._create_backend(config),
+            ReportCache._create_backend(config),
+        )
+        assert isinstance(worker, FileSystemBackend)
+        worker.incr("data-version")
+        assert other_worker.get("data-version") == "1"
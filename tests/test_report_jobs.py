@@ -0,0 +1,138 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.report_jobs import (
+    COMPLETE,
+    FAILED,
+    PENDING,
+    RUNNING,
+    InMemoryBroker,
+    Job,
+    SQLiteBroker,
+    report_jobs,
+)
+
+
+class InlineExecutor:
+    def submit(self, fn, *args, **kwargs):
+        fn(*args, **kwargs)
+
+
+@pytest.fixture
+def inline_jobs(monkeypatch, tmp_path):
+    monkeypatch.setattr(report_jobs, "executor", InlineExecutor())
+    monkeypatch.setattr(report_jobs, "results_directory", str(tmp_path))
+    yield report_jobs
+
+
+@pytest.mark.parametrize("broker_type", ["memory", "sqlite"])
+def test_broker(broker_type, tmp_path):
+    broker = (
+        InMemoryBroker()
+        if broker_type == "memory"
+        else SQLiteBroker(str(tmp_path / "jobs.sqlite"))
+    )
+    job = Job(
+        "abc",
+        "promotions",
+        {"scheme": "FLS", "year": "2019"},
+        PENDING,
+        None,
+        None,
+        datetime(2020, 1, 1),
+    )
+    broker.add(job)
+    assert broker.get("abc") == job
+    broker.update("abc", status=COMPLETE, filename="report")
+    assert broker.get("abc") == job._replace(status=COMPLETE, filename="report")
+    assert broker.get("missing") is None
+
+
+@pytest.mark.parametrize("broker_type", ["memory", "sqlite"])
+def test_broker_expires_old_jobs(broker_type, tmp_path):
+    broker = (
+        InMemoryBroker()
+        if broker_type == "memory"
+        else SQLiteBroker(str(tmp_path / "jobs.sqlite"))
+    )
+    for job_id, status, created_at in [
+        ("old", COMPLETE, datetime(2020, 1, 1)),
+        ("old-failed", FAILED, datetime(2020, 1, 1)),
+        ("old-pending", PENDING, datetime(2020, 1, 1)),
+        ("old-running", RUNNING, datetime(2020, 1, 1)),
+        ("new", COMPLETE, datetime(2020, 1, 3)),
+    ]:
+        broker.add(Job(job_id, "promotions", {}, status, None, None, created_at))
+    assert sorted(broker.expire(datetime(2020, 1, 2))) == [
+        "old",
+        "old-failed",
+        "old-pending",
+        "old-running",
+    ]
+    assert broker.get("old-running") is None
+    assert broker.get("new")
+    # a worker that finishes a job after it has expired doesn't bring it back
+    broker.update("old-running", status=COMPLETE)
+    assert broker.get("old-running") is None
+
+
+def test_expired_results_are_deleted(inline_jobs, test_session, monkeypatch):
+    job = inline_jobs.submit(
+        "promotions", {"scheme": "FLS", "year": "2019", "attribute": "ethnicity"}
+    )
+    assert inline_jobs.get(job.id).status == COMPLETE
+    monkeypatch.setattr(inline_jobs, "expiry", timedelta(0))
+    inline_jobs.expire()
+    assert inline_jobs.get(job.id) is None
+    assert not os.path.exists(inline_jobs.result_path(job.id))
+
+
+def test_half_written_results_are_deleted(inline_jobs):
+    stale = os.path.join(inline_jobs.results_directory, "stale.csv.tmp")
+    writing = os.path.join(inline_jobs.results_directory, "writing.csv.tmp")
+    for path in (stale, writing):
+        open(path, "w").close()
+    two_days_ago = (datetime.now() - timedelta(days=2)).timestamp()
+    os.utime(stale, (two_days_ago, two_days_ago))
+    inline_jobs.expire()
+    assert not os.path.exists(stale)
+    assert os.path.exists(writing)
+
+
+class TestReportJobRoutes:
+    data = {
+        "report-type": "promotions",
+        "scheme": "FLS",
+        "year": 2019,
+        "attribute": "ethnicity",
+    }
+
+    def test_job_result_matches_report(self, test_client, logged_in_user, inline_jobs):
+        submitted = test_client.post("/reports/jobs/promotions", data=self.data)
+        assert submitted.status_code == 303
+        status = test_client.get(f"{submitted.location}/status").get_json()
+        assert status["status"] == COMPLETE
+        download = test_client.get(status["download_url"])
+        assert download.status_code == 200
+        assert "attachment" in download.headers["Content-Disposition"]
+        report = test_client.post("/reports/promotions", data=self.data)
+        assert download.data == report.data
+
+    def test_failed_job_cannot_be_downloaded(
+        self, test_client, logged_in_user, inline_jobs
+    ):
+        submitted = test_client.post(
+            "/reports/jobs/promotions", data={**self.data, "attribute": "height"}
+        )
+        status = test_client.get(f"{submitted.location}/status").get_json()
+        assert status["status"] == FAILED
+        job_id = status["id"]
+        assert test_client.get(f"/reports/jobs/{job_id}/download").status_code == 409
+        assert "could not be generated" in test_client.get(
+            f"/reports/jobs/{job_id}"
+        ).data.decode("utf-8")
+
+    def test_unknown_job(self, test_client, logged_in_user):
+        assert test_client.get("/reports/jobs/missing/status").status_code == 404
@@ -1,13 +1,26 @@
+import io
 import pytest
+import tracemalloc
+import zipfile
 from typing import List
 from reporting.promotion_reports import (
     CharacteristicPromotionReport,
     BooleanCharacteristicPromotionReport,
     DeltaOfferPromotionReport,
+    MetaOfferPromotionReport,
 )
 from reporting.base_promotion_report import PromotionReport
+from reporting.promotion_counter import (
+    PromotionCounter,
+    PromotionCount,
+    PromotionOutcomeCounter,
+)
 from reporting.detailed_report import DetailedReport
-from app.models import Ethnicity, Candidate, Application
+from reporting import ReportFactory
+from reporting.report_pack import ReportPack
+from reporting.parallel import process_pool
+from app.models import Ethnicity, Candidate, Application, Role, RoleChangeEvent, db
+from config import TestConfig
 from datetime import date
 from freezegun import freeze_time
 
@@ -44,6 +57,8 @@ class TestReports:
         scheme_appender,
         test_multiple_candidates_multiple_ethnicities,
         candidates_promoter,
+        test_session,
+        query_budget,
     ):
         bb_candidates = Candidate.query.filter_by(
             ethnicity_id=Ethnicity.query.filter_by(value="Black British").first().id
@@ -55,11 +70,13 @@ class TestReports:
         candidates_promoter(wb_candidates, white_british_promoted)
         scheme_appender(bb_candidates, scheme_id)
         scheme_appender(wb_candidates, scheme_id)
-        output = CharacteristicPromotionReport(*parameters).get_data()
+        test_session.commit()
+        with query_budget(3):
+            output = CharacteristicPromotionReport(*parameters).get_data()
         assert output[0] == expected_output
 
     def test_deferred_candidates_are_not_counted(
-        self, test_session, candidates_promoter
+        self, test_session, candidates_promoter, query_budget
     ):
         """
         Two candidates apply to the 2019 intake and are successful. One defers to 2019. Both are promoted in the
@@ -88,7 +105,8 @@ class TestReports:
         test_session.add_all(candidates)
         test_session.commit()
 
-        data = CharacteristicPromotionReport("FLS", "2019", "ethnicity").get_data()
+        with query_budget(3):
+            data = CharacteristicPromotionReport("FLS", "2019", "ethnicity").get_data()
         expected_output = ["Prefer not to say", 1, 1.0, 0, 0.0, 1]
         assert data[0] == expected_output
 
@@ -114,6 +132,78 @@ class TestPromotionReport:
         data = PromotionReport("FLS", "2019").eligible_candidates()
         assert len(data) == 1
 
+    def test_eligible_candidates_are_loaded_once(self, test_session, scheme_appender):
+        candidates = [Candidate(ethnicity_id=1) for i in range(2)]
+        scheme_appender(candidates)
+        test_session.add_all(candidates)
+        test_session.commit()
+
+        report = PromotionReport("FLS", "2019")
+        first_load = report.eligible_candidates()
+        test_session.add(Candidate(ethnicity_id=1))
+        scheme_appender([Candidate.query.order_by(Candidate.id.desc()).first()])
+        test_session.commit()
+        assert report.eligible_candidates() is first_load
+        assert len(report.eligible_candidates()) == 2
+
+
+class TestCharacteristicPromotionReport:
+    def test_candidates_with_characteristic(
+        self, test_multiple_candidates_multiple_ethnicities, scheme_appender
+    ):
+        scheme_appender(Candidate.query.filter_by(ethnicity_id=3).all()[0:4])
+        scheme_appender(Candidate.query.filter_by(ethnicity_id=2).all()[0:7])
+        report = CharacteristicPromotionReport("FLS", "2019", "ethnicity")
+        assert len(report.candidates_with_characteristic(Ethnicity.query.get(3))) == 4
+        assert len(report.candidates_with_characteristic(Ethnicity.query.get(2))) == 7
+        assert all(
+            candidate.ethnicity.value == "White British"
+            for candidate in report.candidates_with_characteristic(
+                Ethnicity.query.get(2)
+            )
+        )
+
+    def test_parallel_output_matches_serial(
+        self,
+        test_multiple_candidates_multiple_ethnicities,
+        candidates_promoter,
+        scheme_appender,
+        test_session,
+    ):
+        class SerialExecutor:
+            def __init__(self):
+                self.calls = 0
+
+            def map(self, fn, *iterables):
+                self.calls += 1
+                return map(fn, *iterables)
+
+        candidates = Candidate.query.order_by(Candidate.id).all()
+        candidates_promoter(candidates[0:12], 0.5, temporary=False)
+        candidates_promoter(candidates[8:], 0.5, temporary=True)
+        scheme_appender(candidates)
+        test_session.commit()
+
+        executor = SerialExecutor()
+        parallel = CharacteristicPromotionReport(
+            "FLS", "2019", "ethnicity", executor=executor, workers=3
+        ).get_data()
+        assert executor.calls == 1
+        assert (
+            parallel
+            == CharacteristicPromotionReport("FLS", "2019", "ethnicity").get_data()
+        )
+
+    def test_process_pool_output_matches_serial(self, committed_seed_data):
+        with process_pool(2, TestConfig) as executor:
+            parallel = CharacteristicPromotionReport(
+                "FLS", "2018", "ethnicity", executor=executor, workers=2
+            ).get_data()
+        serial = CharacteristicPromotionReport("FLS", "2018", "ethnicity").get_data()
+        # the 100 random candidates on the 2018 FLS intake and the known candidate
+        assert sum(row[5] for row in serial) == 101
+        assert parallel == serial
+
 
 class TestBooleanCharacteristicPromotionReport:
     def test_get_data(
@@ -122,6 +212,7 @@ class TestBooleanCharacteristicPromotionReport:
         candidates_promoter,
         scheme_appender,
         test_session,
+        query_budget,
     ):
 
         candidate_groups = {
@@ -148,9 +239,10 @@ class TestBooleanCharacteristicPromotionReport:
             scheme_appender(group, scheme_id_to_add=1)
 
         test_session.commit()
-        output = BooleanCharacteristicPromotionReport(
-            "FLS", "2019", "long_term_health_condition"
-        ).get_data()
+        with query_budget(2):
+            output = BooleanCharacteristicPromotionReport(
+                "FLS", "2019", "long_term_health_condition"
+            ).get_data()
         expected_output = [
             ["People with a disability", 3, 0.3, 0, 0.0, 10],
             ["People without a disability", 4, 0.4, 0, 0.0, 10],
@@ -158,6 +250,37 @@ class TestBooleanCharacteristicPromotionReport:
         ]
         assert output == expected_output
 
+    def test_only_counts_the_intake(
+        self,
+        disability_with_without_no_answer,
+        candidates_promoter,
+        scheme_appender,
+        test_session,
+        query_counter,
+    ):
+        candidates = Candidate.query.filter(
+            Candidate.long_term_health_condition.is_(True)
+        ).all()
+        candidates_promoter(candidates, 1, temporary=False)
+        scheme_appender(candidates[0:4], scheme_id_to_add=1)
+        scheme_appender(candidates[4:7], scheme_id_to_add=2)
+        for candidate in candidates[7:]:
+            candidate.applications.append(
+                Application(scheme_id=1, scheme_start_date=date(2020, 3, 1))
+            )
+        test_session.commit()
+
+        report = BooleanCharacteristicPromotionReport(
+            "FLS", "2019", "long_term_health_condition"
+        )
+        query_counter.clear()
+        assert report.get_data() == [
+            ["People with a disability", 4, 1.0, 0, 0.0, 4],
+            ["People without a disability", 0, 0, 0, 0, 0],
+            ["No answer provided", 0, 0, 0, 0, 0],
+        ]
+        assert len(query_counter) == 1
+
 
 class TestDeltaOfferPromotionReport:
     def test_get_data(
@@ -166,6 +289,7 @@ class TestDeltaOfferPromotionReport:
         candidates_promoter,
         scheme_appender,
         test_session,
+        query_budget,
     ):
         candidates_with_disability = Candidate.query.filter(
             Candidate.long_term_health_condition.is_(True)
@@ -181,7 +305,8 @@ class TestDeltaOfferPromotionReport:
 
         test_session.commit()
 
-        output = DeltaOfferPromotionReport("FLS", "2019", "delta").get_data()
+        with query_budget(2):
+            output = DeltaOfferPromotionReport("FLS", "2019", "delta").get_data()
         expected_output = [
             ["Candidates eligible for DELTA", 6, 0.6, 0, 0.0, 10],
             ["Candidates on DELTA", 4, 0.8, 0, 0.0, 5],
@@ -190,6 +315,145 @@ class TestDeltaOfferPromotionReport:
         assert expected_output == output
 
 
+class TestMetaOfferPromotionReport:
+    @freeze_time(date(2020, 1, 1))
+    def test_get_data(
+        self,
+        test_multiple_candidates_multiple_ethnicities,
+        candidates_promoter,
+        scheme_appender,
+        test_session,
+        query_budget,
+    ):
+        bame_candidates = Candidate.query.filter_by(ethnicity_id=3).all()
+        white_candidates = Candidate.query.filter_by(ethnicity_id=2).all()
+
+        candidates_promoter(bame_candidates[0:5], 0.6, temporary=False)
+        scheme_appender(bame_candidates[0:5], meta=True)
+        candidates_promoter(bame_candidates[5:10], 0.4, temporary=True)
+        scheme_appender(bame_candidates[5:10])
+        candidates_promoter(white_candidates, 1, temporary=False)
+        scheme_appender(white_candidates)
+
+        test_session.commit()
+
+        with query_budget(2):
+            output = MetaOfferPromotionReport("FLS", "2019", "meta").get_data()
+        expected_output = [
+            ["Candidates eligible for META", 3, 0.3, 2, 0.2, 10],
+            ["Candidates on META", 3, 0.6, 0, 0.0, 5],
+            ["Candidates not on META", 0, 0.0, 2, 0.4, 5],
+        ]
+        assert expected_output == output
+
+    def test_candidate_helpers_load_the_intake_once(
+        self,
+        test_multiple_candidates_multiple_ethnicities,
+        scheme_appender,
+        test_session,
+        query_counter,
+    ):
+        bame_candidates = Candidate.query.filter_by(ethnicity_id=3).all()
+        scheme_appender(bame_candidates[0:5], meta=True)
+        scheme_appender(bame_candidates[5:10])
+        scheme_appender(Candidate.query.filter_by(ethnicity_id=2).all())
+        test_session.commit()
+        report = MetaOfferPromotionReport("FLS", "2019", "meta")
+        query_counter.clear()
+        for i in range(2):
+            report.get_data()
+            eligible = report.eligible_candidates()
+            on_meta = report.candidates_on_offer("meta")
+            on_delta = report.candidates_on_offer("delta")
+        assert [candidate.id for candidate in eligible] == [
+            candidate.id for candidate in bame_candidates
+        ]
+        assert [candidate.id for candidate in on_meta] == [
+            candidate.id for candidate in bame_candidates[0:5]
+        ]
+        assert on_delta == []
+        # one query each for the report's counts, the intake snapshot and the candidates themselves
+        assert len(query_counter) == 3
+
+
+class TestPromotionCounter:
+    @freeze_time(date(2020, 1, 1))
+    def test_count_agrees_with_promoted_between(
+        self,
+        test_multiple_candidates_multiple_ethnicities,
+        candidates_promoter,
+        test_session,
+    ):
+        candidates = Candidate.query.order_by(Candidate.id).all()
+        candidates_promoter(candidates[0:15], 0.6, temporary=False)
+        candidates_promoter(candidates[10:], 0.5, temporary=True)
+        test_session.commit()
+
+        counts = PromotionCounter(date(2018, 12, 1)).count(
+            Candidate.query, Candidate.ethnicity_id
+        )
+        for ethnicity_id in (2, 3):
+            group = [c for c in candidates if c.ethnicity_id == ethnicity_id]
+            assert counts[ethnicity_id] == PromotionCount(
+                len([c for c in group if c.promoted_between(date(2018, 12, 1))]),
+                len(
+                    [
+                        c
+                        for c in group
+                        if c.promoted_between(date(2018, 12, 1), temporary=True)
+                    ]
+                ),
+                len(group),
+            )
+
+    @freeze_time(date(2020, 1, 1))
+    def test_count_ignores_promotions_outside_dates(
+        self,
+        test_multiple_candidates_multiple_ethnicities,
+        candidates_promoter,
+        test_session,
+    ):
+        candidates_promoter(Candidate.query.all(), 1, temporary=False)
+        test_session.commit()
+
+        too_late = PromotionCounter(date(2019, 6, 1)).count(
+            Candidate.query, Candidate.ethnicity_id
+        )
+        too_early = PromotionCounter(date(2018, 1, 1), date(2019, 1, 1)).count(
+            Candidate.query, Candidate.ethnicity_id
+        )
+        assert too_late[3] == too_early[3] == PromotionCount(0, 0, 10)
+
+    @freeze_time(date(2020, 1, 1))
+    def test_outcome_counter_agrees_with_role_histories(
+        self,
+        test_multiple_candidates_multiple_ethnicities,
+        candidates_promoter,
+        scheme_appender,
+        test_session,
+    ):
+        candidates = Candidate.query.order_by(Candidate.id).all()
+        candidates_promoter(candidates[0:15], 0.6, temporary=False)
+        candidates_promoter(candidates[10:], 0.5, temporary=True)
+        scheme_appender(candidates)
+        test_session.commit()
+
+        population = Candidate.query.join(
+            Application, Application.candidate_id == Candidate.id
+        )
+        assert PromotionOutcomeCounter().count(
+            population, Candidate.ethnicity_id
+        ) == PromotionCounter(date(2018, 12, 1)).count(
+            population, Candidate.ethnicity_id
+        )
+
+    def test_combine(self):
+        assert PromotionCounter.combine(
+            [PromotionCount(1, 2, 3), PromotionCount(4, 5, 6)]
+        ) == PromotionCount(5, 7, 9)
+        assert PromotionCounter.combine([]) == PromotionCounter.no_promotions
+
+
 class TestDetailedPromotionReport:
     @pytest.mark.parametrize("intake_year", (2018, 2019, 2020))
     @pytest.mark.parametrize("role_change_type", (1, 2, 3))
@@ -200,12 +464,14 @@ class TestDetailedPromotionReport:
         test_candidate_applied_and_promoted,
         intake_year,
         test_session,
+        query_budget,
     ):
-        report = DetailedReport(intake_year, "FLS", role_change_type)
+        with query_budget(3):
+            data = DetailedReport(intake_year, "FLS", role_change_type).get_data()
         if (
             intake_year == 2019 and role_change_type == 2
         ):  # 2 is a substantive promotion
-            assert report.get_data()[0] == [
+            assert data[0] == [
                 "Testy Candidate",
                 "test.candidate@numberten.gov.uk",
                 "test.secondary@gov.uk",
@@ -231,4 +497,262 @@ class TestDetailedPromotionReport:
                 "localhost:5000/candidates/candidate/1",
             ]
         else:
-            assert report.get_data() == []
+            assert data == []
+
+    @pytest.mark.parametrize("intake_size", (10, 100))
+    @freeze_time(date(2020, 3, 1))
+    def test_query_count_does_not_grow_with_intake(
+        self,
+        intake_size,
+        test_candidate_applied_and_promoted,
+        test_session,
+        query_counter,
+    ):
+        def report_queries():
+            query_counter.clear()
+            data = DetailedReport(2019, "FLS", 2).get_data()
+            return len(data), len(query_counter)
+
+        rows, queries_for_one_candidate = report_queries()
+        assert rows == 1
+
+        for i in range(intake_size):
+            candidate = Candidate(
+                first_name="Candidate",
+                last_name=str(i),
+                joining_grade_id=1,
+                main_job_type_id=1,
+                ethnicity_id=1,
+                gender_id=1,
+                sexuality_id=1,
+                belief_id=1,
+                age_range_id=1,
+                working_pattern_id=1,
+            )
+            candidate.applications.append(
+                Application(
+                    application_date=date(2018, 6, 1),
+                    scheme_id=1,
+                    scheme_start_date=date(2019, 3, 1),
+                )
+            )
+            test_session.add(candidate)
+            candidate.new_role(
+                start_date=date(2019, 6, 1),
+                new_org_id=1,
+                new_profession_id=1,
+                new_location_id=2,
+                new_grade_id=5,
+                new_title="Director of Happiness",
+                role_change_id=2,
+            )
+        test_session.commit()
+
+        rows, queries_for_intake = report_queries()
+        assert rows == intake_size + 1
+        assert queries_for_intake == queries_for_one_candidate
+
+    def test_intake_runs_from_january_to_december(
+        self, test_multiple_candidates_multiple_ethnicities, test_session
+    ):
+        start_dates = [
+            date(2018, 12, 31),
+            date(2019, 1, 1),
+            date(2019, 12, 31),
+            date(2020, 1, 1),
+        ]
+        candidates = Candidate.query.order_by(Candidate.id).limit(4).all()
+        for candidate, start_date in zip(candidates, start_dates):
+            candidate.applications.append(
+                Application(scheme_id=1, scheme_start_date=start_date)
+            )
+        test_session.commit()
+        assert DetailedReport(2019, "FLS", 2).eligible_candidates() == candidates[1:3]
+
+    @freeze_time(date(2020, 3, 1))
+    def test_peak_memory_does_not_grow_with_intake(
+        self, detailed_candidate, test_session
+    ):
+        def add_promoted_candidates(first_id, number):
+            ids = range(first_id, first_id + number)
+            db.session.execute(
+                Candidate.__table__.insert(),
+                [
+                    dict(
+                        id=i,
+                        first_name="Synthetic",
+                        last_name=str(i),
+                        joining_grade_id=1,
+                        main_job_type_id=1,
+                        ethnicity_id=1,
+                        gender_id=1,
+                        sexuality_id=1,
+                        belief_id=1,
+                        age_range_id=1,
+                        working_pattern_id=1,
+                        current_role_id=i,
+                    )
+                    for i in ids
+                ],
+            )
+            db.session.execute(
+                Role.__table__.insert(),
+                [
+                    dict(
+                        id=i,
+                        candidate_id=i,
+                        organisation_id=1,
+                        location_id=2,
+                        grade_id=5,
+                        role_name="Synthetic role",
+                    )
+                    for i in ids
+                ],
+            )
+            db.session.execute(
+                RoleChangeEvent.__table__.insert(),
+                [
+                    dict(
+                        candidate_id=i,
+                        new_role_id=i,
+                        role_change_id=2,
+                        role_change_date=date(2019, 6, 1),
+                    )
+                    for i in ids
+                ],
+            )
+            db.session.execute(
+                Application.__table__.insert(),
+                [
+                    dict(
+                        candidate_id=i,
+                        scheme_id=1,
+                        application_date=date(2018, 6, 1),
+                        scheme_start_date=date(2019, 3, 1),
+                    )
+                    for i in ids
+                ],
+            )
+
+        def peak_memory_generating_report():
+            report = DetailedReport(2019, "FLS", 2)
+            report.batch_size = 100
+            tracemalloc.start()
+            lines = sum(1 for line in report.generate_report_data())
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return lines, peak
+
+        add_promoted_candidates(1000, 1000)
+        lines, peak_for_small_intake = peak_memory_generating_report()
+        assert lines == 1001
+
+        add_promoted_candidates(2000, 10000)
+        lines, peak_for_large_intake = peak_memory_generating_report()
+        assert lines == 11001
+        assert peak_for_large_intake < peak_for_small_intake * 1.2
+
+
+@pytest.fixture
+def mixed_intake(
+    test_multiple_candidates_multiple_ethnicities,
+    candidates_promoter,
+    scheme_appender,
+    test_session,
+):
+    candidates = Candidate.query.order_by(Candidate.id).all()
+    for i, candidate in enumerate(candidates):
+        candidate.long_term_health_condition = [True, False, None][i % 3]
+        candidate.caring_responsibility = i % 2 == 0
+    candidates_promoter(candidates[0:12], 0.5, temporary=False)
+    candidates_promoter(candidates[6:], 0.5, temporary=True)
+    scheme_appender(candidates[0:5], meta=True)
+    scheme_appender(candidates[5:9], delta=True)
+    scheme_appender(candidates[9:])
+    test_session.commit()
+
+
+class TestReportPack:
+    @freeze_time(date(2020, 1, 1))
+    def test_reports_match_standalone_reports(self, mixed_intake, query_counter):
+        reports = ReportPack([("FLS", "2019")]).reports("FLS", "2019")
+        assert len(reports) == 10
+        query_counter.clear()
+        pack_data = [report.get_data() for report in reports]
+        # only the characteristic tables are read, once each, to label the rows
+        assert not any("candidate" in statement for statement in query_counter)
+        for report, data in zip(reports, pack_data):
+            report.snapshot = None
+            assert data == report.get_data()
+
+    def test_zip_has_a_csv_per_report(self, mixed_intake):
+        pack = ReportPack([("FLS", "2019"), ("SLS", "2019")])
+        with zipfile.ZipFile(io.BytesIO(b"".join(pack.generate_zip()))) as archive:
+            names = archive.namelist()
+            ethnicity_report = archive.read(
+                next(name for name in names if "ethnicity-FLS" in name)
+            ).decode("utf-8")
+        assert len(names) == 20
+        assert len([name for name in names if name.startswith("SLS-2019/")]) == 10
+        assert "White British" in ethnicity_report
+
+    def test_snapshot_masks_pick_out_candidates(self, mixed_intake):
+        report = ReportPack([("FLS", "2019")]).reports("FLS", "2019")[0]
+        snapshot = report.intake_snapshot()
+        assert str(snapshot.frame["candidate.ethnicity_id"].dtype) == "Int32"
+        assert str(snapshot.frame["application.meta"].dtype) == "boolean"
+        no_answer = snapshot.candidate_ids(
+            snapshot.mask(Candidate.long_term_health_condition, None)
+        )
+        assert no_answer == [
+            candidate.id
+            for candidate in report.eligible_candidates()
+            if candidate.long_term_health_condition is None
+        ]
+        assert len(snapshot.candidate_ids(snapshot.mask(Application.meta, True))) == 5
+
+
+class TestPromotionTrendReport:
+    @pytest.fixture
+    def two_intakes(self, mixed_intake, test_session):
+        for candidate in Candidate.query.order_by(Candidate.id).all()[0:8]:
+            candidate.applications.append(
+                Application(
+                    application_date=date(2017, 8, 1),
+                    scheme_id=1,
+                    scheme_start_date=date(2018, 3, 1),
+                    meta=True,
+                )
+            )
+        test_session.commit()
+
+    @freeze_time(date(2020, 1, 1))
+    @pytest.mark.parametrize(
+        "attribute", ["ethnicity", "long_term_health_condition", "meta"]
+    )
+    def test_each_year_matches_its_own_report(
+        self, two_intakes, attribute, query_counter
+    ):
+        trend = ReportFactory.from_form(
+            "trends",
+            {
+                "scheme": "FLS",
+                "attribute": attribute,
+                "first-year": "2018",
+                "last-year": "2019",
+            },
+        )
+        query_counter.clear()
+        data = trend.get_data()
+        assert (
+            len([statement for statement in query_counter if "candidate" in statement])
+            == 1
+        )
+        for i, year in enumerate(["2018", "2019"]):
+            report = ReportFactory.create_report(
+                "promotions", scheme="FLS", year=year, attribute=attribute
+            )
+            assert [
+                [row[0], *row[1 + 5 * i : 6 + 5 * i]] for row in data
+            ] == report.get_data()
+        assert len(trend.headers) == 11
@@ -1,8 +1,13 @@
+import io
+import zipfile
+
 import pytest
 from flask import url_for, session
 from datetime import date
 
 from app.models import (
+    Application,
+    Candidate,
     Grade,
     Organisation,
     Profession,
@@ -14,6 +19,9 @@ from app.models import (
 )
 from flask_login import current_user
 
+from app.candidate_directory import CandidateDirectory
+from app.report_cache import report_cache
+
 
 def test_home_status_code(test_client, logged_in_user):
     # sends HTTP GET request to the application
@@ -58,6 +66,28 @@ class TestNewEmail:
         )
 
 
+class TestUpdateEmail:
+    def test_address_of_another_candidate_is_refused(
+        self, test_client, logged_in_user, test_candidate, test_session
+    ):
+        test_session.add(Candidate(email_address="someone.else@gov.uk"))
+        test_session.commit()
+        with test_client.session_transaction() as sess:
+            sess["candidate-id"] = test_candidate.id
+            sess["update-data"] = {"new-email": {"which-email": "primary-email"}}
+        result = test_client.post(
+            url_for("update_bp.update_email"),
+            data={"email-address": "Someone.Else@gov.uk"},
+            follow_redirects=True,
+        )
+        assert result.status_code == 200
+        assert "That email address belongs to another candidate" in result.data.decode(
+            "UTF-8"
+        )
+        with test_client.session_transaction() as sess:
+            assert "new-address" not in sess["update-data"]["new-email"]
+
+
 class TestUpdateType:
     @pytest.mark.parametrize("option", ["Role", "Name", "Deferral", "Email"])
     def test_get(self, option, test_client, logged_in_user, candidate_in_session):
@@ -138,7 +168,12 @@ class TestSearchCandidate:
         assert "Most recent candidate email address" in result.data.decode("UTF-8")
 
     @pytest.mark.parametrize(
-        "email", ("test.candidate@numberten.gov.uk", "test.secondary@gov.uk")
+        "email",
+        (
+            "test.candidate@numberten.gov.uk",
+            "test.secondary@gov.uk",
+            " Test.Candidate@NumberTen.gov.uk",
+        ),
     )
     def test_post(
         self,
@@ -159,6 +194,14 @@ class TestSearchCandidate:
 
         assert 1 == session.get("candidate-id")
 
+    def test_fuzzy_search(self, test_client, logged_in_user, test_candidate):
+        result = test_client.get(url_for("update_bp.index", q="testy candiate"))
+        assert "test.candidate@numberten.gov.uk" in result.data.decode("UTF-8")
+        found = test_client.get(url_for("update_bp.search_candidates", q="testy"))
+        assert [candidate["id"] for candidate in found.get_json()["candidates"]] == [
+            test_candidate.id
+        ]
+
     def test_given_candidate_email_doesnt_exist_when_user_searches_then_user_is_redirected_to_new_search(
         self, test_client, logged_in_user, candidate_in_session
     ):
@@ -225,7 +268,9 @@ class TestAuthentication:
     def test_login(self, logged_in_user):
         assert current_user.is_authenticated
 
-    @pytest.mark.parametrize("url", ["/update/", "/reports/", "/candidates/1"])
+    @pytest.mark.parametrize(
+        "url", ["/update/", "/reports/", "/candidates/", "/candidates/1"]
+    )
     def test_non_logged_in_users_are_redirected_to_login(self, url, test_client):
         with test_client:
             response = test_client.get(url, follow_redirects=False)
@@ -248,6 +293,45 @@ class TestReports:
         result = test_client.post("/reports/promotions", data=data)
         assert 200 == result.status_code
 
+    def test_post_promotions_is_cached_until_data_changes(
+        self, test_client, logged_in_user
+    ):
+        data = {
+            "report-type": "promotions",
+            "scheme": "FLS",
+            "year": 2018,
+            "attribute": "ethnicity",
+        }
+        first = test_client.post("/reports/promotions", data=data)
+        assert first.headers["X-Report-Cache"] == "miss"
+        assert first.data  # the report is saved once it has been sent in full
+        second = test_client.post("/reports/promotions", data=data)
+        assert second.headers["X-Report-Cache"] == "hit"
+        assert second.data == first.data
+        report_cache.bump_data_version()
+        third = test_client.post("/reports/promotions", data=data)
+        assert third.headers["X-Report-Cache"] == "miss"
+
+    def test_post_report_pack(self, test_client, logged_in_user):
+        assert "Report pack" in test_client.get("/reports/pack").data.decode("utf-8")
+        result = test_client.post(
+            "/reports/pack", data={"scheme": ["FLS", "SLS"], "year": ["2019"]}
+        )
+        assert result.mimetype == "application/zip"
+        assert len(zipfile.ZipFile(io.BytesIO(result.data)).namelist()) == 20
+
+    def test_post_trend_report(self, test_client, logged_in_user):
+        assert "Trend report" in test_client.get("/reports/trends").data.decode("utf-8")
+        data = {
+            "scheme": "FLS",
+            "attribute": "gender",
+            "first-year": "2018",
+            "last-year": "2019",
+        }
+        result = test_client.post("/reports/trends", data=data)
+        assert result.mimetype == "text/csv"
+        assert "2019 total in group" in result.data.decode("utf-8")
+
     def test_get_detailed_report(self, test_client, logged_in_user):
         result = test_client.get("/reports/detailed")
         assert "Detailed Report" in result.data.decode("utf-8")
@@ -259,9 +343,75 @@ class TestReports:
 
 
 class TestProfile:
+    def test_get(
+        self,
+        test_client,
+        logged_in_user,
+        test_candidate_applied_and_promoted,
+        test_session,
+        query_budget,
+    ):
+        candidate = test_candidate_applied_and_promoted
+        for year, grade_id, title in [
+            (2020, 6, "Deputy Director of Happiness"),
+            (2021, 7, "Director General of Happiness"),
+        ]:
+            candidate.new_role(
+                start_date=date(year, 6, 1),
+                new_org_id=1,
+                new_profession_id=1,
+                new_location_id=1,
+                new_grade_id=grade_id,
+                new_title=title,
+                role_change_id=2,
+            )
+        candidate.applications.append(
+            Application(
+                application_date=date(2020, 6, 1),
+                scheme_id=2,
+                scheme_start_date=date(2021, 3, 1),
+                meta=False,
+                delta=True,
+            )
+        )
+        test_session.commit()
+        # the same number of queries however many roles and applications the candidate has
+        with query_budget(11):
+            result = test_client.get("/candidates/1")
+        page = result.data.decode("utf-8")
+        assert "Career profile for Testy Candidate" in page
+        assert "Director General of Happiness" in page
+
+
+class TestCandidateDirectory:
     def test_get(self, test_client, logged_in_user, test_candidate_applied_to_fls):
-        result = test_client.get("/candidates/1")
-        assert "Career profile for Testy Candidate" in result.data.decode("utf-8")
+        result = test_client.get("/candidates/")
+        assert "Testy Candidate" in result.data.decode("utf-8")
+
+    def test_pages_through_candidates(
+        self,
+        test_client,
+        logged_in_user,
+        test_multiple_candidates_multiple_ethnicities,
+        monkeypatch,
+    ):
+        monkeypatch.setattr(CandidateDirectory, "page_size", 7)
+        ids = [candidate.id for candidate in Candidate.query.order_by(Candidate.id)]
+        url, seen = "/candidates/api", []
+        while url:
+            page = test_client.get(url).get_json()
+            seen.extend(candidate["id"] for candidate in page["candidates"])
+            url = page["next"]
+        assert seen == ids
+
+    @pytest.mark.parametrize("intake", ["0", "9999", "-1", "100000"])
+    def test_intake_years_without_dates_are_ignored(
+        self, intake, test_client, logged_in_user, test_candidate_applied_to_fls
+    ):
+        result = test_client.get(f"/candidates/?intake={intake}")
+        assert "Testy Candidate" in result.data.decode("utf-8")
+        result = test_client.get(f"/candidates/api?intake={intake}")
+        assert [candidate["id"] for candidate in result.get_json()["candidates"]] == [1]
 
 
 def test_audit_events(test_client, logged_in_user):
@@ -1,5 +1,16 @@
-from app.models import Ethnicity, Candidate, Organisation, Profession, Grade
-from modules.seed import clear_old_data
+from app.models import (
+    Ethnicity,
+    Candidate,
+    CandidateEmail,
+    Organisation,
+    Profession,
+    Grade,
+    PromotionOutcome,
+    Role,
+    RoleChangeEvent,
+)
+from modules.seed import clear_old_data, commit_data
+from modules.synthetic import SyntheticData
 import pytest
 
 
@@ -33,9 +44,88 @@ class TestSeedScript:
         ]:
             assert len(item[0].query.all()) == item[1]
 
+    def test_commit_data_runs_a_fixed_number_of_queries(
+        self, test_session, test_client, query_counter
+    ):
+        def queries(candidates_per_scheme):
+            clear_old_data()
+            query_counter.clear()
+            commit_data(candidates_per_scheme=candidates_per_scheme, seed=0)
+            return len(query_counter)
+
+        assert queries(10) == queries(200)
+        assert Candidate.query.count() == 401
+
     @pytest.mark.parametrize("model", [Candidate, Organisation, Grade, Profession])
     def test_clear_old_data(self, model, test_session, test_client):
         with test_client:
             clear_old_data()
             for model in [Candidate, Organisation, Grade, Profession]:
                 assert 0 == len(model.query.all())
+
+
+class TestSyntheticData:
+    def test_same_seed_gives_same_data(self, seed_data, test_session):
+        def describe(candidate_ids):
+            return [
+                (
+                    candidate.ethnicity_id,
+                    candidate.long_term_health_condition,
+                    candidate.joining_date,
+                    candidate.current_role().role_name,
+                    candidate.applications.first().scheme_start_date,
+                )
+                for candidate in Candidate.query.filter(
+                    Candidate.id.in_(candidate_ids)
+                ).order_by(Candidate.id)
+            ]
+
+        first_ids = SyntheticData(50, seed=1, batch_size=20).insert()
+        first = describe(first_ids)
+        second = describe(SyntheticData(50, seed=1, batch_size=20).insert())
+        assert len(first) == 50
+        assert first == second
+        assert CandidateEmail.candidate(
+            f"Candidate{first_ids[0]}@synthetic.gov.uk"
+        ) == Candidate.query.get(first_ids[0])
+
+    def test_promotion_outcomes_match_role_changes(self, seed_data, test_session):
+        candidate_ids = SyntheticData(100, seed=2).insert()
+
+        def outcomes():
+            return sorted(
+                (
+                    outcome.application_id,
+                    outcome.substantive_promotion_date,
+                    outcome.temporary_promotion_date,
+                )
+                for outcome in PromotionOutcome.query.filter(
+                    PromotionOutcome.candidate_id.in_(candidate_ids)
+                )
+            )
+
+        generated = outcomes()
+        PromotionOutcome.refresh(test_session.connection(), candidate_ids)
+        assert len(generated) == 100
+        assert any(outcome[1] for outcome in generated)
+        assert generated == outcomes()
+
+    def test_promotions_keep_the_former_role(self, seed_data, test_session):
+        candidate_ids = SyntheticData(100, seed=3, batch_size=30).insert()
+        role_changes = RoleChangeEvent.query.filter(
+            RoleChangeEvent.candidate_id.in_(candidate_ids)
+        ).all()
+        # each candidate's first role change is joining, and every one after it a promotion from their last role
+        joining = [change for change in role_changes if change.former_role_id is None]
+        promotions = [change for change in role_changes if change.former_role_id]
+        assert len(joining) == 100
+        assert promotions
+        role_owners = dict(
+            Role.query.filter(Role.candidate_id.in_(candidate_ids)).with_entities(
+                Role.id, Role.candidate_id
+            )
+        )
+        assert all(
+            role_owners[change.former_role_id] == change.candidate_id
+            for change in promotions
+        )
@@ -1,14 +1,19 @@
 from app.models import (
+    Application,
     Candidate,
+    CandidateEmail,
+    Role,
+    RoleChangeEvent,
     Organisation,
     Belief,
     Sexuality,
     Ethnicity,
     Gender,
+    PromotionOutcome,
 )
 import pytest
 from datetime import date
-from modules.upload import Row
+from modules.upload import Row, BulkUpload, Upload
 
 
 @pytest.mark.parametrize("scheme", ["FLS"])
@@ -42,6 +47,32 @@ class TestUpload:
             == "SCS2 – Director"
         )
 
+    def test_complete_upload_query_budget(
+        self,
+        year,
+        scheme,
+        test_upload_object,
+        multiple_row_upload_files,
+        seed_data,
+        test_session,
+        query_budget,
+    ):
+        test_session.add_all(
+            [
+                Organisation(name="SIS"),
+                Organisation(name="Foreign and Commonwealth Office"),
+            ]
+        )
+        test_session.commit()
+        u = test_upload_object(*multiple_row_upload_files(3), False, scheme)
+        # each row is saved with its own queries, so a new query per row adds three to the count
+        with query_budget(76):
+            u.complete_upload()
+        assert (
+            Candidate.query.filter(Candidate.email_address.like("candidate.%")).count()
+            == 3
+        )
+
     @pytest.mark.parametrize(
         "csv_field, db_field, new_data",
         [
@@ -113,6 +144,114 @@ class TestUpload:
         assert candidate.main_job_type.value != "Don’t know"
 
 
+@pytest.mark.parametrize("redacted", [True, False])
+class TestBulkUpload:
+    def test_saves_same_data_as_upload(
+        self, redacted, test_upload_object, seed_data, test_session
+    ):
+        test_session.add_all(
+            [
+                Organisation(name="SIS"),
+                Organisation(name="Foreign and Commonwealth Office"),
+            ]
+        )
+        test_session.commit()
+
+        def upload_and_describe(upload_class):
+            upload = test_upload_object(
+                "tests/data/2019/test_csv.csv",
+                "tests/data/2019/test_application_csv.csv",
+                redacted,
+                upload_class=upload_class,
+            )
+            upload.complete_upload()
+            candidate = Candidate.query.order_by(Candidate.id.desc()).first()
+            application = candidate.most_recent_application()
+            description = (
+                candidate.email_address,
+                candidate.first_name,
+                candidate.joining_date,
+                candidate.completed_fast_stream,
+                candidate.caring_responsibility,
+                candidate.working_pattern_id,
+                candidate.joining_grade_id,
+                application.scheme_start_date,
+                application.cohort,
+                application.meta,
+                application.aspirational_grade_id,
+                candidate.current_role().role_name,
+                candidate.current_role().grade_id,
+                candidate.current_role().organisation_id,
+                candidate.current_role().date_started(),
+                candidate.roles.count(),
+                [
+                    (change.role_change_date, change.former_role_id is None)
+                    for change in candidate.role_changes
+                ],
+                PromotionOutcome.query.filter_by(application_id=application.id)
+                .with_entities(
+                    PromotionOutcome.substantive_promotion_date,
+                    PromotionOutcome.temporary_promotion_date,
+                )
+                .one(),
+                sorted(
+                    (email.address, email.primary)
+                    for email in CandidateEmail.query.filter_by(
+                        candidate_id=candidate.id
+                    )
+                ),
+            )
+            if not redacted:
+                description += (
+                    candidate.sexuality_id,
+                    candidate.ethnicity_id,
+                    candidate.gender_id,
+                    candidate.long_term_health_condition,
+                )
+            candidate.current_role_id = None
+            for model in (PromotionOutcome, RoleChangeEvent, Application, Role):
+                model.query.filter_by(candidate_id=candidate.id).delete()
+            test_session.delete(candidate)
+            test_session.commit()
+            return description
+
+        assert upload_and_describe(BulkUpload) == upload_and_describe(Upload)
+
+    def test_runs_a_fixed_number_of_queries(
+        self,
+        redacted,
+        test_upload_object,
+        multiple_row_upload_files,
+        seed_data,
+        test_session,
+        query_counter,
+    ):
+        test_session.add_all(
+            [
+                Organisation(name="SIS"),
+                Organisation(name="Foreign and Commonwealth Office"),
+            ]
+        )
+        test_session.commit()
+        promotions = RoleChangeEvent.query.filter(
+            RoleChangeEvent.former_role_id.isnot(None)
+        )
+        promotions_before = promotions.count()
+
+        def queries(rows):
+            upload = test_upload_object(
+                *multiple_row_upload_files(rows), redacted, upload_class=BulkUpload
+            )
+            query_counter.clear()
+            upload.complete_upload()
+            return len(query_counter)
+
+        # the first upload also links the ALB to its department and reloads reference data afterwards
+        queries(2)
+        assert queries(1) == queries(20)
+        assert promotions.count() - promotions_before == 23
+
+
 class TestRow:
     def test_process_organisation_adds_alb_to_parent(self, blank_session):
         dept = "Foreign and Commonwealth Office"